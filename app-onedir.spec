@@ -0,0 +1,52 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Faster-starting build: a folder instead of a single self-extracting EXE.
+# The onefile build (app.spec) unpacks itself to a temporary folder and
+# decompresses UPX-packed binaries on every launch; this one starts
+# straight from dist/app/. Build with:  pyinstaller app-onedir.spec
+
+
+a = Analysis(
+    ['app.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=[],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    # Not used by the app; keeps them out of the bundle and its import scan
+    excludes=['pydub', 'numpy', 'PIL', 'matplotlib', 'IPython', 'unittest', 'doctest', 'pydoc',
+              'pydoc_data', 'xmlrpc', 'lib2to3', 'idlelib', 'tkinter.test', 'test',
+              'setuptools', 'pkg_resources', 'pip'],
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='app',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    # UPX saves disk space but every launch pays to decompress
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='app',
+)
@@ -1,26 +1,49 @@
 import os
+import sys
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 from tkinter import font
 import threading
-import yt_dlp as youtube_dl
-from pydub import AudioSegment
+import time
 import webbrowser
-import subprocess
-import signal
+from downloader.control import JobCancelled, JobControl
+from downloader.convert import LOUDNESS_TARGET
+from downloader.engine import DownloadOptions, is_youtube_url
+from downloader.events import EventBus
+from downloader.jobs import FAILED, CANCELLED, RUNNING, JobQueue
+from downloader.preview import IN_LIBRARY, ON_DISK, UNAVAILABLE
+from downloader.progress import format_bytes, format_eta
+from downloader.segmented import DEFAULT_CONNECTIONS
+
+# Write buffer choices; Auto lets yt-dlp size blocks to the transfer rate
+WRITE_BUFFERS = {"Auto": None, "256 KB": 256 * 1024, "1 MB": 1024 * 1024, "4 MB": 4 * 1024 * 1024}
+
+# Milliseconds between GUI refreshes; events arriving in between are coalesced into one
+FRAME_MS = 40
 
 class MediaDownloaderGUI:
     def __init__(self, root):
         self.root = root
         self.setup_gui()
-        self.is_downloading = False
-        self.download_thread = None  # Track the download thread
-        self.processes = []  # Track subprocesses (if any)
+        # Worker threads never touch Tk directly; they publish events that
+        # the Tk thread applies once per frame, keeping only each job's latest state
+        self.events = EventBus()
+        self.metrics, self.metrics_server = self.start_metrics()
+        self.job_queue = JobQueue(max_jobs=int(self.max_jobs_var.get()),
+                                  on_update=lambda job: self.events.publish('job', job, key=job.id),
+                                  metrics=self.metrics)
+        self.update_bandwidth()
+        self.announced_jobs = set()
+        self.job_rows = {}  # Treeview row -> values last shown
+        self.root.after(FRAME_MS, self.drain_events)
+        # Load yt-dlp in the background once the window is up
+        self.root.after_idle(self.job_queue.engine.prewarm)
         # Bind the close event to cleanup
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         # Get default Downloads folder path
         downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
         self.directory_var = tk.StringVar(value=downloads_path)
+        self.last_timed_result = None
 
     def setup_gui(self):
         # Configure main window
@@ -213,37 +236,167 @@ class MediaDownloaderGUI:
         tk.Label(range_frame, text="(leave end empty for all)", font=("Arial", 9), bg=bg_color, fg="gray").grid(
             row=0, column=5, padx=(10, 0), pady=5, sticky="w")
         
-        self.quality_var = tk.StringVar(value="Best Available")
-        quality_combo = ttk.Combobox(options_frame, textvariable=self.quality_var, 
-                                    values=["Best Available", "Good", "Normal"], state="readonly", font=label_font)
-        quality_combo.grid(row=0, column=3, padx=5, pady=8, sticky="w")
+        # Concurrency Section
+        concurrency_frame = tk.Frame(options_frame, bg=bg_color)
+        concurrency_frame.grid(row=2, column=0, columnspan=4, sticky="ew", pady=(5, 0))
         
-        # Progress Section
-        progress_frame = tk.Frame(main_frame, bg=bg_color)
-        progress_frame.grid(row=5, column=0, columnspan=3, sticky="ew", pady=(0, 15))
-        progress_frame.grid_columnconfigure(0, weight=1)
+        tk.Label(concurrency_frame, text="Parallel Downloads:", font=label_font, bg=bg_color, fg=primary_color).grid(
+            row=0, column=0, padx=5, pady=5, sticky="w")
+        
+        self.workers_var = tk.StringVar(value="4")
+        workers_spin = tk.Spinbox(concurrency_frame, from_=1, to=16, textvariable=self.workers_var,
+                                  font=label_font, width=6, relief="solid", bd=1)
+        workers_spin.grid(row=0, column=1, padx=5, pady=5)
+        
+        tk.Label(concurrency_frame, text="Per Host:", font=label_font, bg=bg_color, fg=primary_color).grid(
+            row=0, column=2, padx=(20, 5), pady=5, sticky="w")
+        
+        self.host_limit_var = tk.StringVar(value="2")
+        host_limit_spin = tk.Spinbox(concurrency_frame, from_=1, to=16, textvariable=self.host_limit_var,
+                                     font=label_font, width=6, relief="solid", bd=1)
+        host_limit_spin.grid(row=0, column=3, padx=5, pady=5)
+        
+        # Start downloading while a very large playlist or channel is still being listed
+        self.lazy_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(concurrency_frame, text="Stream large playlists", variable=self.lazy_var,
+                       font=label_font, bg=bg_color, fg=primary_color, activebackground=bg_color).grid(
+            row=0, column=4, padx=(20, 5), pady=5, sticky="w")
+        
+        # Record how long extraction, download, merge and conversion take
+        self.trace_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(concurrency_frame, text="Record timings", variable=self.trace_var,
+                       font=label_font, bg=bg_color, fg=primary_color, activebackground=bg_color).grid(
+            row=0, column=5, padx=(10, 5), pady=5, sticky="w")
+        
+        # Combined rate of every running job; applies to transfers already in flight
+        tk.Label(concurrency_frame, text="Bandwidth (MB/s, 0 = no limit):", font=label_font, bg=bg_color, fg=primary_color).grid(
+            row=1, column=0, padx=5, pady=5, sticky="w")
+        
+        self.bandwidth_var = tk.StringVar(value="0")
+        tk.Spinbox(concurrency_frame, from_=0, to=1000, increment=0.5, textvariable=self.bandwidth_var,
+                   font=label_font, width=6, relief="solid", bd=1).grid(row=1, column=1, padx=5, pady=5)
+        self.bandwidth_var.trace_add("write", lambda *args: self.update_bandwidth())
+        
+        # Larger fixed blocks mean fewer, bigger writes to network storage
+        tk.Label(concurrency_frame, text="Write Buffer:", font=label_font, bg=bg_color, fg=primary_color).grid(
+            row=1, column=2, padx=(20, 5), pady=5, sticky="w")
+        
+        self.write_buffer_var = tk.StringVar(value="Auto")
+        ttk.Combobox(concurrency_frame, textvariable=self.write_buffer_var, values=list(WRITE_BUFFERS),
+                     state="readonly", font=label_font, width=8).grid(row=1, column=3, padx=5, pady=5, sticky="w")
+        
+        # Large single files are split into byte ranges fetched in parallel, where the server allows
+        tk.Label(concurrency_frame, text="Connections per File:", font=label_font, bg=bg_color, fg=primary_color).grid(
+            row=1, column=4, padx=(20, 5), pady=5, sticky="w")
+        
+        self.segments_var = tk.StringVar(value=str(DEFAULT_CONNECTIONS))
+        tk.Spinbox(concurrency_frame, from_=1, to=16, textvariable=self.segments_var,
+                   font=label_font, width=6, relief="solid", bd=1).grid(row=1, column=5, padx=5, pady=5, sticky="w")
+        
+        # MP3 post-processing, all done in the single transcode pass
+        mp3_frame = tk.Frame(options_frame, bg=bg_color)
+        mp3_frame.grid(row=3, column=0, columnspan=4, sticky="ew", pady=(5, 0))
+        
+        tk.Label(mp3_frame, text="MP3 Files:", font=label_font, bg=bg_color, fg=primary_color).grid(
+            row=0, column=0, padx=5, pady=5, sticky="w")
+        
+        self.normalize_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(mp3_frame, text=f"Normalize loudness ({LOUDNESS_TARGET:g} LUFS)", variable=self.normalize_var,
+                       font=label_font, bg=bg_color, fg=primary_color, activebackground=bg_color).grid(
+            row=0, column=1, padx=(20, 5), pady=5, sticky="w")
+        
+        self.tags_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(mp3_frame, text="Write tags", variable=self.tags_var,
+                       font=label_font, bg=bg_color, fg=primary_color, activebackground=bg_color).grid(
+            row=0, column=2, padx=(10, 5), pady=5, sticky="w")
+        
+        self.cover_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(mp3_frame, text="Embed cover art", variable=self.cover_var,
+                       font=label_font, bg=bg_color, fg=primary_color, activebackground=bg_color).grid(
+            row=0, column=3, padx=(10, 5), pady=5, sticky="w")
+        
+        # Jobs Section
+        jobs_frame = tk.LabelFrame(main_frame, text="📋 Jobs", 
+                                  font=label_font, bg=bg_color, fg=primary_color, padx=15, pady=10)
+        jobs_frame.grid(row=5, column=0, columnspan=3, sticky="ew", pady=(0, 15))
+        jobs_frame.grid_columnconfigure(0, weight=1)
+        
+        columns = ("playlist", "format", "range", "priority", "state", "progress", "details")
+        self.jobs_tree = ttk.Treeview(jobs_frame, columns=columns, height=6, selectmode="browse")
+        self.jobs_tree.heading("#0", text="#")
+        self.jobs_tree.column("#0", width=40, stretch=False)
+        for column, heading, width in (("playlist", "Playlist", 200), ("format", "Format", 90),
+                                       ("range", "Range", 70), ("priority", "Priority", 60),
+                                       ("state", "State", 80), ("progress", "Progress", 70),
+                                       ("details", "Speed / ETA / Status", 200)):
+            self.jobs_tree.heading(column, text=heading)
+            self.jobs_tree.column(column, width=width, anchor="w" if column in ("playlist", "details") else "center")
+        self.jobs_tree.tag_configure(FAILED, foreground=warning_color)
+        self.jobs_tree.tag_configure(CANCELLED, foreground="gray")
+        self.jobs_tree.grid(row=0, column=0, sticky="ew")
+        jobs_scroll = ttk.Scrollbar(jobs_frame, orient="vertical", command=self.jobs_tree.yview)
+        jobs_scroll.grid(row=0, column=1, sticky="ns")
+        self.jobs_tree.configure(yscrollcommand=jobs_scroll.set)
+        # Double-click a job for its summary
+        self.jobs_tree.bind("<Double-1>", lambda e: self.show_job_summary())
+        
+        job_buttons = tk.Frame(jobs_frame, bg=bg_color)
+        job_buttons.grid(row=1, column=0, columnspan=2, sticky="w", pady=(8, 0))
+        for column, (text, command) in enumerate((("⏸️ Pause", self.pause_job),
+                                                  ("▶️ Resume", self.resume_job),
+                                                  ("✖️ Cancel", self.cancel_job),
+                                                  ("⬆️ Priority", lambda: self.change_priority(1)),
+                                                  ("⬇️ Priority", lambda: self.change_priority(-1)),
+                                                  ("🧹 Clear Finished", self.clear_finished_jobs))):
+            tk.Button(job_buttons, text=text, command=command, bg=secondary_color, fg="white",
+                      font=("Arial", 9, "bold"), cursor="hand2", relief="flat").grid(
+                row=0, column=column, padx=(0, 6))
+        
+        # How many playlists download at the same time; the rest wait in the queue
+        tk.Label(job_buttons, text="Parallel Playlists:", font=label_font, bg=bg_color, fg=primary_color).grid(
+            row=0, column=6, padx=(14, 5))
+        self.max_jobs_var = tk.StringVar(value="2")
+        tk.Spinbox(job_buttons, from_=1, to=8, textvariable=self.max_jobs_var, font=label_font,
+                   width=4, relief="solid", bd=1).grid(row=0, column=7)
+        self.max_jobs_var.trace_add("write", lambda *args: self.update_max_jobs())
         
         self.progress_var = tk.StringVar(value="Ready to download...")
-        progress_label = tk.Label(progress_frame, textvariable=self.progress_var, 
+        progress_label = tk.Label(jobs_frame, textvariable=self.progress_var, 
                                  font=label_font, bg=bg_color, fg=primary_color)
-        progress_label.grid(row=0, column=0, pady=5)
+        progress_label.grid(row=2, column=0, columnspan=2, pady=(10, 5))
+        
+        self.progress_bar = ttk.Progressbar(jobs_frame, mode='determinate', maximum=100)
+        self.progress_bar.grid(row=3, column=0, columnspan=2, sticky="ew", pady=5)
         
-        self.progress_bar = ttk.Progressbar(progress_frame, mode='indeterminate')
-        self.progress_bar.grid(row=1, column=0, sticky="ew", pady=5)
+        self.stats_var = tk.StringVar()
+        stats_label = tk.Label(jobs_frame, textvariable=self.stats_var, 
+                               font=("Arial", 9), bg=bg_color, fg="gray")
+        stats_label.grid(row=4, column=0, columnspan=2, pady=(0, 5))
         
         # Action Buttons
         button_frame = tk.Frame(main_frame, bg=bg_color)
         button_frame.grid(row=6, column=0, columnspan=3, pady=20)
         
-        self.download_btn = tk.Button(button_frame, text="🚀 Start Download", command=self.start_download, 
+        self.download_btn = tk.Button(button_frame, text="➕ Add to Queue", command=self.add_job, 
                                      bg=accent_color, fg="white", font=("Arial", 12, "bold"), 
                                      width=18, height=2, cursor="hand2", relief="flat")
         self.download_btn.grid(row=0, column=0, padx=10)
+        
+        # See what a download would fetch before committing to it
+        preview_btn = tk.Button(button_frame, text="🔍 Preview", command=self.preview,
+                                bg=info_color, fg="white", font=("Arial", 12, "bold"),
+                                width=12, cursor="hand2", relief="flat")
+        preview_btn.grid(row=0, column=1, padx=10)
     
         clear_btn = tk.Button(button_frame, text="🗑️ Clear All", command=self.clear_all, 
                              bg=warning_color, fg="white", font=("Arial", 12, "bold"), 
                              width=15, cursor="hand2", relief="flat")
-        clear_btn.grid(row=0, column=1, padx=10)
+        clear_btn.grid(row=0, column=2, padx=10)
+        
+        self.timings_btn = tk.Button(button_frame, text="⏱️ Timings", command=self.show_timings,
+                                     bg=info_color, fg="white", font=("Arial", 12, "bold"),
+                                     width=12, cursor="hand2", relief="flat", state="disabled")
+        self.timings_btn.grid(row=0, column=3, padx=10)
         
         # Footer with credits (now inside scrollable area)
         footer_frame = tk.Frame(main_frame, bg=primary_color, height=60)
@@ -268,7 +421,8 @@ class MediaDownloaderGUI:
         footer_label.bind("<Button-1>", open_github)
         
         # Add hover effects
-        self.add_hover_effects([browse_btn, cookies_btn, cookies_clear_btn, cookies_help_btn, self.download_btn, clear_btn])
+        self.add_hover_effects([browse_btn, cookies_btn, cookies_clear_btn, cookies_help_btn, self.download_btn, preview_btn,
+                                clear_btn, self.timings_btn])
         
         # Initialize format options
         self.update_format_options()
@@ -430,14 +584,23 @@ Remember: Respect content creators' rights and platform terms of service!"""
         self.cookies_var.set("")
         self.start_var.set("1")
         self.end_var.set("")
+        self.workers_var.set("4")
+        self.host_limit_var.set("2")
+        self.lazy_var.set(False)
+        self.trace_var.set(False)
+        self.write_buffer_var.set("Auto")
+        self.segments_var.set(str(DEFAULT_CONNECTIONS))
+        self.normalize_var.set(False)
+        self.tags_var.set(True)
+        self.cover_var.set(False)
         self.progress_var.set("Ready to download...")
-        self.progress_bar.stop()
+        self.progress_bar['value'] = 0
+        self.stats_var.set("")
         self.update_format_options()
         
     def is_youtube_url(self, url):
         """Check if the URL is from YouTube"""
-        youtube_domains = ['youtube.com', 'youtu.be', 'm.youtube.com', 'www.youtube.com']
-        return any(domain in url.lower() for domain in youtube_domains)
+        return is_youtube_url(url)
         
     def update_format_options(self):
         """Update format options based on URL"""
@@ -493,186 +656,458 @@ Remember: Respect content creators' rights and platform terms of service!"""
             except ValueError:
                 messagebox.showerror("Error", "End index must be a valid number.")
                 return False
+        
+        for value, label in ((self.workers_var.get(), "Parallel downloads"),
+                             (self.host_limit_var.get(), "Per host limit"),
+                             (self.segments_var.get(), "Connections per file")):
+            try:
+                if int(value.strip()) < 1:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", f"{label} must be a number of 1 or greater.")
+                return False
             
         return True
 
-    def start_download(self):
+    def form_options(self):
+        """The playlist in the form as :class:`DownloadOptions`, or None if the form is invalid"""
         if not self.validate_inputs():
+            return None
+        
+        start_str = self.start_var.get().strip()
+        end_str = self.end_var.get().strip()
+        cookies_file = self.cookies_var.get().strip()
+        
+        # Each job keeps its own copy of the form, so the form can be reused right away
+        return DownloadOptions(
+            url=self.url_var.get().strip(),
+            directory=self.directory_var.get().strip(),
+            output_format=self.format_var.get(),
+            quality=self.quality_var.get(),
+            start_index=int(start_str) if start_str else 1,
+            end_index=int(end_str) if end_str else None,
+            cookies_file=cookies_file or None,
+            max_workers=int(self.workers_var.get().strip()),
+            per_host_limit=int(self.host_limit_var.get().strip()),
+            segments=int(self.segments_var.get().strip()),
+            lazy=self.lazy_var.get(),
+            trace=self.trace_var.get(),
+            write_buffer=WRITE_BUFFERS.get(self.write_buffer_var.get()),
+            loudness=LOUDNESS_TARGET if self.normalize_var.get() else None,
+            tags=self.tags_var.get(),
+            embed_thumbnail=self.cover_var.get(),
+        )
+
+    def add_job(self, options=None):
+        """Queue the playlist in the form as a new job"""
+        options = options or self.form_options()
+        if options is None:
             return
-            
-        if self.is_downloading:
-            messagebox.showwarning("Warning", "Download is already in progress!")
+        job = self.job_queue.submit(options)
+        self.progress_var.set(f"Added job #{job.id} to the queue.")
+    
+    def preview(self):
+        """Show what downloading the playlist in the form would fetch, without downloading"""
+        options = self.form_options()
+        if options is None:
             return
-            
-        # Start download in separate thread
-        self.download_thread = threading.Thread(target=self.download_playlist)
-        self.download_thread.daemon = True
-        self.download_thread.start()
-
-    def download_playlist(self):
-        self.is_downloading = True
-        self.download_btn.config(state="disabled", text="⏳ Downloading...")
-        self.progress_bar.start()
-        self.progress_var.set("Preparing download...")
-        
-        try:
-            playlist_url = self.url_var.get().strip()
-            save_directory = self.directory_var.get().strip()
-            cookies_file = self.cookies_var.get().strip()
-            
-            # NEW: Get playlist range values
-            start_str = self.start_var.get().strip()
-            end_str = self.end_var.get().strip()
-            start_index = int(start_str) if start_str else 1
-            end_index = int(end_str) if end_str else None
-            
-            # Create directory if it doesn't exist
-            if not os.path.exists(save_directory):
-                os.makedirs(save_directory)
-                
-            # Configure yt-dlp options
-            selected_format = self.format_var.get()
-            
-            if selected_format == "MP4" and self.is_youtube_url(playlist_url):
-                cmd = [
-                    "python", "-m", "yt_dlp",
-                    "-f", "bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4",
-                    "--merge-output-format", "mp4",
-                    "--output", os.path.join(save_directory, "%(playlist_index)s - %(title)s.%(ext)s"),
-                    "--playlist-start", str(start_index)
-                ]
-                
-                # NEW: Add end index if specified
-                if end_index:
-                    cmd += ["--playlist-end", str(end_index)]
-                    
-                cmd.append(playlist_url)
-                process = subprocess.Popen(cmd, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0)
-                self.processes.append(process)
-                process.wait()
-                
-                range_text = f"from {start_index}" + (f" to {end_index}" if end_index else " to end")
-                self.progress_var.set("MP4 files downloaded successfully!")
-                messagebox.showinfo("Success", 
-                                f"Playlist downloaded successfully!\n"
-                                f"Format: {selected_format}\n"
-                                f"Range: {range_text}\n"
-                                f"Location: {save_directory}")
+        control = JobControl()
+        state = {'result': None, 'error': None, 'status': "Listing playlist..."}
+        # Entries by row, and the values each row shows
+        rows = {}
+        shown = {}
+        sort = {'column': None, 'reverse': False}
+        
+        window = tk.Toplevel(self.root)
+        window.title("🔍 Preview")
+        window.configure(bg="#f8f9fa")
+        window.transient(self.root)
+        
+        frame = tk.Frame(window, bg="#f8f9fa", padx=20, pady=20)
+        frame.pack(fill="both", expand=True)
+        
+        title_var = tk.StringVar(value=options.url)
+        tk.Label(frame, textvariable=title_var, font=("Arial", 13, "bold"), bg="#f8f9fa",
+                 fg="#2c3e50").pack(anchor="w")
+        tk.Label(frame, text=f"{options.output_format} • {options.quality} • range {options.range_text}",
+                 font=("Arial", 9), bg="#f8f9fa", fg="gray").pack(anchor="w", pady=(0, 10))
+        
+        columns = ("status", "duration", "size", "title")
+        table = tk.Frame(frame, bg="#f8f9fa")
+        table.pack(fill="both", expand=True)
+        tree = ttk.Treeview(table, columns=columns, height=16)
+        tree.heading("#0", text="#", command=lambda: sort_by("#0"))
+        tree.column("#0", width=50, anchor="e", stretch=False)
+        for column, heading, width in (("status", "Status", 90), ("duration", "Duration", 70),
+                                       ("size", "Size", 80), ("title", "Title", 360)):
+            tree.heading(column, text=heading, command=lambda column=column: sort_by(column))
+            tree.column(column, width=width, anchor="w" if column == "title" else "center")
+        tree.tag_configure(UNAVAILABLE, foreground="#e74c3c")
+        tree.tag_configure(ON_DISK, foreground="gray")
+        tree.tag_configure(IN_LIBRARY, foreground="gray")
+        tree.pack(side="left", fill="both", expand=True)
+        scroll = ttk.Scrollbar(table, orient="vertical", command=tree.yview)
+        scroll.pack(side="right", fill="y")
+        tree.configure(yscrollcommand=scroll.set)
+        
+        summary_var = tk.StringVar(value=state['status'])
+        tk.Label(frame, textvariable=summary_var, font=("Arial", 10), bg="#f8f9fa", fg="#2c3e50",
+                 wraplength=640, justify="left").pack(anchor="w", pady=(10, 0))
+        
+        def sort_key(iid, column):
+            entry = rows[iid]
+            if column == "#0":
+                return entry.index or 0
+            if column == "duration":
+                return entry.duration or 0
+            if column == "size":
+                return entry.expected_bytes or 0
+            return str(getattr(entry, column) or "").lower()
+        
+        def sort_by(column):
+            """Sort by ``column``; clicking it again reverses the order"""
+            if sort['column'] == column:
+                sort['reverse'] = not sort['reverse']
             else:
-                # For SoundCloud and other platforms, or MP3 format
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'outtmpl': os.path.join(save_directory, '%(playlist_index)s - %(title)s.%(ext)s'),
-                    'noplaylist': False,
-                    'postprocessors': [],
-                    'http_headers': {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                    },
-                    # NEW: Add playlist range options
-                    'playliststart': start_index,
-                }
-                
-                # NEW: Add end index if specified
-                if end_index:
-                    ydl_opts['playlistend'] = end_index
-            
-                # Add cookies file if provided
-                if cookies_file and os.path.exists(cookies_file):
-                    ydl_opts['cookiefile'] = cookies_file
-                
-                ydl_opts.update({
-                    'ignoreerrors': True,
-                    'no_warnings': False,
-                    'extractaudio': False,
-                    'embed_subs': False,
-                    'writeautomaticsub': False,
-                })
-                
-                range_text = f"from {start_index}" + (f" to {end_index}" if end_index else " to end")
-                self.progress_var.set(f"Extracting playlist information... (Range: {range_text})")
-                
-                with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                    info_dict = ydl.extract_info(playlist_url, download=True)
-                    playlist_title = info_dict.get('title', 'playlist')
-                    entries = info_dict.get('entries', [])
-                    
-                    # Handle format conversion for MP3
-                    if selected_format == "MP3":
-                        self.progress_var.set("Converting to MP3...")
-                        total_files = len(entries)
-                        
-                        for i, entry in enumerate(entries):
-                            try:
-                                if entry is None:
-                                    continue
-                                    
-                                file_path = ydl.prepare_filename(entry)
-                                if file_path and os.path.exists(file_path) and not file_path.endswith('.mp3'):
-                                    self.progress_var.set(f"Converting to MP3... ({i+1}/{total_files})")
-                                    audio = AudioSegment.from_file(file_path)
-                                    mp3_path = os.path.splitext(file_path)[0] + '.mp3'
-                                    audio.export(mp3_path, format='mp3')
-                                    os.remove(file_path)
-                            except Exception as e:
-                                print(f"Error converting file {i+1}: {e}")
-                                continue
-                        
-                        self.progress_var.set("Download and conversion completed successfully!")
-                    else:
-                        self.progress_var.set("Files downloaded in original format!")
-                    
-                    successful_downloads = len([e for e in entries if e is not None])
-                    messagebox.showinfo("Success", 
-                                    f"Playlist '{playlist_title}' downloaded successfully!\n"
-                                    f"Format: {selected_format}\n"
-                                    f"Range: {range_text}\n"
-                                    f"Location: {save_directory}\n"
-                                    f"Files downloaded: {successful_downloads}")
-                            
-        except Exception as e:
-            self.progress_var.set("Download failed!")
-            error_msg = str(e)
-            
-            if "Requested format is not available" in error_msg:
-                error_msg += "\n\nTip: Try selecting 'Original Format' instead of MP4, or check if the videos support the requested quality."
-            elif "Private video" in error_msg:
-                error_msg += "\n\nTip: Some videos in the playlist might be private. Try using a cookies file if you have access."
-            elif "Video unavailable" in error_msg:
-                error_msg += "\n\nTip: Some videos might be region-locked or removed. The downloader will skip these."
-                
-            messagebox.showerror("Error", f"Download failed:\n{error_msg}")
-            
-        finally:
-            self.is_downloading = False
-            self.download_btn.config(state="normal", text="🚀 Start Download")
-            self.progress_bar.stop()
-            self.processes = []
-        
-    def on_closing(self):
-        if self.is_downloading:
-            if messagebox.askokcancel("Quit", "Download is in progress. Are you sure you want to quit?"):
-                self.progress_bar.stop()
-                
-                for process in self.processes:
-                    try:
-                        if process.poll() is None:  # Still running
-                            if os.name == 'nt':
-                                process.send_signal(signal.CTRL_BREAK_EVENT)
-                            else:
-                                process.terminate()
-                            process.wait(timeout=2)
-                    except subprocess.TimeoutExpired:
-                        process.kill()
-                    except Exception as e:
-                        print(f"Error terminating process: {e}")
-
-                self.processes = []
-                self.is_downloading = False
-                self.download_btn.config(state="normal", text="🚀 Start Download")
-                self.progress_var.set("Download cancelled.")
-                self.root.destroy()
+                sort['column'], sort['reverse'] = column, False
+            apply_sort()
+        
+        def apply_sort():
+            if sort['column'] is None:
+                return
+            ordered = sorted(rows, key=lambda iid: sort_key(iid, sort['column']), reverse=sort['reverse'])
+            for position, iid in enumerate(ordered):
+                tree.move(iid, "", position)
+        
+        def refresh():
+            """Show the latest state of the preview, on the Tk thread"""
+            if not window.winfo_exists():
+                return
+            result = state['result']
+            if state['error']:
+                summary_var.set(f"Preview failed: {self.describe_error(state['error'])}")
+            elif result is None:
+                summary_var.set(state['status'])
+                return
+            title_var.set(result.title)
+            for position, entry in enumerate(list(result.entries)):
+                iid = str(position)
+                values = (entry.status, format_eta(entry.duration) if entry.duration else "",
+                          format_bytes(entry.expected_bytes) if entry.expected_bytes is not None else "?",
+                          entry.title)
+                if iid not in rows:
+                    tree.insert("", "end", iid=iid, text=entry.index or "", values=values, tags=(entry.status,))
+                elif shown[iid] != values:
+                    tree.item(iid, values=values, tags=(entry.status,))
+                rows[iid] = entry
+                shown[iid] = values
+            if result.done:
+                summary_var.set(f"{result.summary()} (in {result.elapsed:.1f}s)")
+                queue_btn.config(state="normal")
+                apply_sort()
+            elif not state['error']:
+                summary_var.set(f"{result.summary()} — {state['status']}")
+        
+        def publish(result=None):
+            if result is not None:
+                state['result'] = result
+            self.events.publish('preview', refresh, key=id(window))
+        
+        def set_status(message):
+            state['status'] = message
+            publish()
+        
+        def run():
+            try:
+                self.job_queue.engine.preview(options, status=set_status, on_update=publish, control=control)
+            except JobCancelled:
+                return
+            except Exception as e:
+                state['error'] = str(e)
+            publish()
+        
+        def close():
+            control.cancel()
+            window.destroy()
+        
+        def queue():
+            close()
+            self.add_job(options)
+        
+        buttons = tk.Frame(frame, bg="#f8f9fa")
+        buttons.pack(pady=(15, 0))
+        queue_btn = tk.Button(buttons, text="➕ Add to Queue", command=queue, bg="#27ae60", fg="white",
+                              font=("Arial", 11, "bold"), cursor="hand2", relief="flat", state="disabled")
+        queue_btn.pack(side="left", padx=5)
+        tk.Button(buttons, text="Close", command=close, bg="#95a5a6", fg="white",
+                  font=("Arial", 11, "bold"), width=10, cursor="hand2", relief="flat").pack(side="left", padx=5)
+        window.protocol("WM_DELETE_WINDOW", close)
+        
+        threading.Thread(target=run, daemon=True, name='preview').start()
+    
+    def selected_job(self):
+        selection = self.jobs_tree.selection()
+        if not selection:
+            return None
+        job_id = int(selection[0])
+        return next((job for job in self.job_queue.jobs() if job.id == job_id), None)
+    
+    def pause_job(self):
+        job = self.selected_job()
+        if job:
+            self.job_queue.pause(job)
+    
+    def resume_job(self):
+        job = self.selected_job()
+        if job:
+            self.job_queue.resume(job)
+    
+    def cancel_job(self):
+        job = self.selected_job()
+        if job and not job.finished:
+            if messagebox.askyesno("Cancel Job", f"Cancel '{job.title}'?\n"
+                                   "Files already downloaded are kept."):
+                self.job_queue.cancel(job)
+    
+    def change_priority(self, step):
+        job = self.selected_job()
+        if job and not job.finished:
+            self.job_queue.set_priority(job, job.priority + step)
+    
+    def clear_finished_jobs(self):
+        self.job_queue.remove_finished()
+        remaining = {str(job.id) for job in self.job_queue.jobs()}
+        for iid in self.jobs_tree.get_children():
+            if iid not in remaining:
+                self.jobs_tree.delete(iid)
+                self.job_rows.pop(iid, None)
+        self.refresh_overview()
+    
+    def update_max_jobs(self):
+        try:
+            max_jobs = int(self.max_jobs_var.get())
+        except ValueError:
+            return
+        if max_jobs >= 1 and hasattr(self, 'job_queue'):
+            self.job_queue.set_max_jobs(max_jobs)
+    
+    def update_bandwidth(self):
+        try:
+            limit = float(self.bandwidth_var.get())
+        except ValueError:
+            return
+        if limit >= 0 and hasattr(self, 'job_queue'):
+            self.job_queue.bandwidth.set_rate(int(limit * 1024 * 1024))
+    
+    def summarize_result(self, options, result):
+        summary = (f"Format: {options.output_format}\n"
+                   f"Range: {options.range_text}\n"
+                   f"Location: {options.directory}\n"
+                   f"Files downloaded: {result.downloaded}\n"
+                   f"Already up to date: {result.up_to_date}")
+        if result.linked:
+            summary += f"\nLinked from other playlists: {result.linked}"
+        if result.resumed:
+            summary += f"\nResumed from interrupted run: {result.resumed}"
+        if result.retried:
+            summary += f"\nRetried after temporary errors: {result.retried}"
+        savings = result.describe_savings()
+        if savings:
+            summary += f"\n{savings}"
+        return summary
+    
+    def describe_error(self, error_msg):
+        """Add a hint for common failures of a whole job"""
+        if "Requested format is not available" in error_msg:
+            error_msg += "\n\nTip: Try selecting 'Original Format' instead of MP4, or check if the videos support the requested quality."
+        elif "Private video" in error_msg:
+            error_msg += "\n\nTip: Some videos in the playlist might be private. Try using a cookies file if you have access."
+        elif "Video unavailable" in error_msg:
+            error_msg += "\n\nTip: Some videos might be region-locked or removed. The downloader will skip these."
+        return error_msg
+    
+    def show_job_summary(self):
+        """Show what a job did, or why it failed"""
+        job = self.selected_job()
+        if job is None:
+            return
+        if job.error:
+            messagebox.showerror("Error", f"Download failed:\n{self.describe_error(job.error)}")
+        elif job.result is None:
+            messagebox.showinfo(f"Job #{job.id}", f"{job.title}\n{job.state.capitalize()}: {job.status}")
+        elif job.result.failed:
+            result = job.result
+            failures = "\n".join(self.describe_failure(entry) for entry in result.failures[:5])
+            if result.failed > 5:
+                failures += f"\n... and {result.failed - 5} more"
+            messagebox.showwarning("Finished with errors", 
+                            f"Playlist '{result.title}' finished with {result.failed} failed entries.\n"
+                            f"{self.summarize_result(job.options, result)}\n\n{failures}")
         else:
-            self.root.destroy()
+            messagebox.showinfo("Success", 
+                            f"Playlist '{job.result.title}' downloaded successfully!\n"
+                            f"{self.summarize_result(job.options, job.result)}")
+    
+    def show_timings(self):
+        """Show per-stage timings of the selected job, or of the last run that recorded them"""
+        job = self.selected_job()
+        result = job.result if job and job.result and job.result.tracer else self.last_timed_result
+        if result is None:
+            return
+        window = tk.Toplevel(self.root)
+        window.title("⏱️ Stage Timings")
+        window.configure(bg="#f8f9fa")
+        window.transient(self.root)
+        
+        frame = tk.Frame(window, bg="#f8f9fa", padx=20, pady=20)
+        frame.pack(fill="both", expand=True)
+        
+        tk.Label(frame, text=f"{result.title} — {result.elapsed:.1f}s total",
+                 font=("Arial", 13, "bold"), bg="#f8f9fa", fg="#2c3e50").pack(anchor="w", pady=(0, 10))
+        
+        columns = ("count", "total", "mean", "p95", "max")
+        tree = ttk.Treeview(frame, columns=columns, height=7)
+        tree.heading("#0", text="Stage")
+        tree.column("#0", width=110)
+        for column, heading in zip(columns, ("Count", "Total (s)", "Mean (s)", "p95 (s)", "Max (s)")):
+            tree.heading(column, text=heading)
+            tree.column(column, width=90, anchor="e")
+        for stage, count, total, mean, p95, longest in result.tracer.summary():
+            tree.insert("", "end", text=stage,
+                        values=(count, f"{total:.2f}", f"{mean:.3f}", f"{p95:.3f}", f"{longest:.3f}"))
+        tree.pack(fill="both", expand=True)
+        
+        tk.Label(frame, text="Stages overlap across parallel downloads, so totals can exceed the run time.",
+                 font=("Arial", 9), bg="#f8f9fa", fg="gray").pack(anchor="w", pady=(5, 0))
+        
+        def save_trace():
+            path = filedialog.asksaveasfilename(
+                parent=window, title="Save Trace", defaultextension=".json",
+                filetypes=[("Chrome trace", "*.json"), ("CSV", "*.csv")])
+            if path:
+                result.tracer.write(path)
+        
+        buttons = tk.Frame(frame, bg="#f8f9fa")
+        buttons.pack(pady=(15, 0))
+        tk.Button(buttons, text="💾 Save Trace...", command=save_trace, bg="#3498db", fg="white",
+                  font=("Arial", 11, "bold"), cursor="hand2", relief="flat").pack(side="left", padx=5)
+        tk.Button(buttons, text="Close", command=window.destroy, bg="#95a5a6", fg="white",
+                  font=("Arial", 11, "bold"), width=10, cursor="hand2", relief="flat").pack(side="left", padx=5)
+    
+    def describe_failure(self, entry):
+        """One line of the failure list shown after a download"""
+        line = f"• {entry.index or ''} {entry.title or entry.url}: {entry.error}"
+        if entry.error_kind != 'permanent' and entry.attempts > 1:
+            line += f" (gave up after {entry.attempts} attempts)"
+        return line
+    
+    def drain_events(self):
+        """Apply the events published since the last frame, on the Tk thread"""
+        started = time.perf_counter()
+        events = self.events.drain()
+        for kind, value in events:
+            if kind == 'preview':
+                value()
+                continue
+            self.refresh_job_row(value)
+            if value.finished and value.id not in self.announced_jobs:
+                self.announce_finished(value)
+        if any(kind == 'job' for kind, _ in events):
+            self.refresh_overview()
+        # Hold a steady frame rate however long this batch took
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.root.after(max(1, int(FRAME_MS - elapsed_ms)), self.drain_events)
+    
+    def set_text(self, var, text):
+        # Setting a Tk variable redraws its widgets even when the text is unchanged
+        if var.get() != text:
+            var.set(text)
+    
+    def refresh_job_row(self, job):
+        options = job.options
+        snapshot = job.snapshot
+        progress = f"{snapshot.percent:.0f}%" if snapshot else ""
+        details = job.status
+        if job.state == RUNNING and snapshot and snapshot.total_bytes:
+            details = f"{format_bytes(snapshot.current_speed)}/s • ETA {format_eta(snapshot.eta)}"
+            if snapshot.convert_total:
+                details += f" • {snapshot.convert_label} {snapshot.converted}/{snapshot.convert_total}"
+        elif job.result:
+            details = f"{job.result.downloaded} downloaded, {job.result.up_to_date} up to date"
+            if job.result.linked:
+                details += f", {job.result.linked} linked"
+            if job.result.failed:
+                details += f", {job.result.failed} failed"
+        values = (job.title, options.output_format,
+                  f"{options.start_index}–{options.end_index or 'end'}", job.priority,
+                  job.state.capitalize(), progress, details)
+        iid = str(job.id)
+        if iid in self.job_rows:
+            if self.job_rows[iid] != values:
+                self.jobs_tree.item(iid, values=values, tags=(job.state,))
+                self.job_rows[iid] = values
+        elif job in self.job_queue.jobs():
+            self.jobs_tree.insert("", "end", iid=iid, text=iid, values=values, tags=(job.state,))
+            self.job_rows[iid] = values
+    
+    def announce_finished(self, job):
+        self.announced_jobs.add(job.id)
+        if job.result and job.result.tracer:
+            self.last_timed_result = job.result
+            self.timings_btn.config(state="normal")
+        if job.state == FAILED and job.result is None:
+            self.set_text(self.progress_var, f"Job #{job.id} failed. Double-click it for details.")
+        elif job.state != CANCELLED:
+            self.set_text(self.progress_var, f"Job #{job.id} finished: {job.title}")
+    
+    def refresh_overview(self):
+        """Aggregate progress of the running jobs"""
+        jobs = self.job_queue.jobs()
+        running = [job for job in jobs if job.state == RUNNING]
+        waiting = sum(1 for job in jobs if not job.finished and job.state != RUNNING)
+        snapshots = [job.snapshot for job in running if job.snapshot]
+        if snapshots:
+            percent = sum(s.percent for s in snapshots) / len(running)
+            speed = sum(s.current_speed or 0 for s in snapshots)
+            stats = (f"{len(running)} running • {waiting} waiting or paused"
+                     f" • {format_bytes(speed)}/s total")
+        elif running or waiting:
+            percent = 0
+            stats = f"{len(running)} running • {waiting} waiting or paused"
+        else:
+            percent = 100 if jobs else 0
+            stats = ""
+            if jobs:
+                self.set_text(self.progress_var, "All jobs finished. Double-click a job for its summary.")
+        if self.progress_bar['value'] != percent:
+            self.progress_bar['value'] = percent
+        self.set_text(self.stats_var, stats)
+        
+    def start_metrics(self):
+        """Serve live metrics if MEDIA_DOWNLOADER_METRICS_PORT is set; returns ``(metrics, server)``"""
+        port = os.environ.get("MEDIA_DOWNLOADER_METRICS_PORT")
+        if not port:
+            return None, None
+        # Only imported when asked for, to keep start-up quick
+        from downloader.metrics import DEFAULT_METRICS_HOST, Metrics, MetricsServer
+        metrics = Metrics()
+        host = os.environ.get("MEDIA_DOWNLOADER_METRICS_HOST", DEFAULT_METRICS_HOST)
+        try:
+            server = MetricsServer(metrics, int(port), host).start()
+        except (OSError, ValueError) as e:
+            print(f"Could not serve metrics on {host}:{port}: {e}", file=sys.stderr)
+            return None, None
+        return metrics, server
+    
+    def on_closing(self):
+        if self.job_queue.busy:
+            if not messagebox.askokcancel("Quit", "Downloads are in progress. Are you sure you want to quit?"):
+                return
+            self.progress_var.set("Download cancelled.")
+        self.job_queue.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+        self.root.destroy()
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,104 @@
+"""Benchmark how the GUI's event delivery holds up under a flood of progress events.
+
+Worker threads publish job updates as fast as they can while a consumer
+thread stands in for the Tk loop: every frame it drains what arrived and
+"applies" each event at a fixed cost. The coalescing
+:class:`~downloader.events.EventBus` is compared with a plain queue that
+delivers every event::
+
+    python -m benchmarks.bench_events --publishers 16 --jobs 4 --seconds 3
+"""
+import argparse
+import queue
+import statistics
+import threading
+import time
+
+from downloader.events import EventBus
+
+FRAME_MS = 40
+
+
+class QueueBus:
+    """Every event delivered, as with the queue the GUI used before"""
+
+    def __init__(self):
+        self.published = 0
+        self._queue = queue.Queue()
+
+    def publish(self, kind, value, key=None):
+        self._queue.put((kind, value))
+        self.published += 1
+
+    def drain(self):
+        events = []
+        try:
+            while True:
+                events.append(self._queue.get_nowait())
+        except queue.Empty:
+            return events
+
+
+def run(bus, args):
+    stop = threading.Event()
+
+    def publisher(number):
+        job = number % args.jobs
+        while not stop.is_set():
+            bus.publish('job', job, key=job)
+            # Let other threads run, as real progress hooks do between reads
+            time.sleep(0)
+
+    threads = [threading.Thread(target=publisher, args=(i,), daemon=True) for i in range(args.publishers)]
+    for thread in threads:
+        thread.start()
+    frames, applied = [], []
+    deadline = time.perf_counter() + args.seconds
+    next_frame = time.perf_counter()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        events = bus.drain()
+        for _ in events:
+            # Stand-in for updating one Treeview row
+            end = time.perf_counter() + args.apply_us / 1e6
+            while time.perf_counter() < end:
+                pass
+        elapsed = time.perf_counter() - started
+        frames.append(elapsed * 1000)
+        applied.append(len(events))
+        next_frame = max(next_frame + FRAME_MS / 1000, time.perf_counter())
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    frames.sort()
+    return {
+        'published_per_sec': bus.published / args.seconds,
+        'frames_per_sec': len(frames) / args.seconds,
+        'events_per_frame': statistics.mean(applied),
+        'frame_ms_p50': frames[len(frames) // 2],
+        'frame_ms_p95': frames[min(len(frames) - 1, int(0.95 * len(frames)))],
+        'frame_ms_max': frames[-1],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--publishers', type=int, default=16, help='publishing threads (default: 16)')
+    parser.add_argument('--jobs', type=int, default=4, help='distinct jobs published about (default: 4)')
+    parser.add_argument('--seconds', type=float, default=3.0, help='duration of each run (default: 3)')
+    parser.add_argument('--apply-us', type=float, default=50.0,
+                        help='microseconds to apply one event in the consumer (default: 50)')
+    args = parser.parse_args(argv)
+
+    print(f"{'Bus':<10} {'Published/s':>12} {'Frames/s':>9} {'Events/frame':>13} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'Max ms':>8}")
+    for name, bus in (('queue', QueueBus()), ('coalesced', EventBus())):
+        r = run(bus, args)
+        print(f"{name:<10} {r['published_per_sec']:>12.0f} {r['frames_per_sec']:>9.1f} "
+              f"{r['events_per_frame']:>13.1f} {r['frame_ms_p50']:>8.2f} {r['frame_ms_p95']:>8.2f} "
+              f"{r['frame_ms_max']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
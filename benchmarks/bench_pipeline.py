@@ -0,0 +1,238 @@
+"""Benchmark the download engine and MP3 conversion against local fixtures.
+
+Runs every mode in a fresh subprocess (so peak RSS is per mode) against a
+local stand-in server, prints a summary table and writes the results as
+JSON. Pass an earlier results file with ``--compare`` to see the change
+per metric::
+
+    python -m benchmarks.bench_pipeline --count 40 --size-mb 2 -o bench.json
+    python -m benchmarks.bench_pipeline --latency 0.05 --bandwidth-mb 4 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORMATS = {'original': "Original Format", 'mp3': "MP3"}
+MODES = ('serial', 'concurrent')
+
+# Metrics where a larger value is better; the rest are better when smaller
+HIGHER_IS_BETTER = ('entries_per_sec', 'mb_per_sec', 'files_per_sec', 'realtime_factor')
+
+
+def measure():
+    """CPU seconds used by this process and its children, and their peak RSS in bytes"""
+    if resource is None:
+        return {'cpu': time.process_time(), 'rss': None, 'children_rss': None}
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu': own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        'rss': own.ru_maxrss * scale,
+        'children_rss': children.ru_maxrss * scale,
+    }
+
+
+def finish(stats, before, wall):
+    after = measure()
+    cpu = after['cpu'] - before['cpu']
+    stats.update(
+        wall_seconds=round(wall, 3),
+        cpu_seconds=round(cpu, 3),
+        # Percent of one core; above 100 means more than one core was busy
+        cpu_percent=round(100 * cpu / wall, 1) if wall else None,
+        peak_rss_mb=round(after['rss'] / 2 ** 20, 1) if after['rss'] else None,
+        peak_child_rss_mb=round(after['children_rss'] / 2 ** 20, 1) if after['children_rss'] else None,
+    )
+    return stats
+
+
+def run_download(args):
+    from downloader.engine import DownloadEngine, DownloadOptions
+
+    workers = 1 if args.mode == 'serial' else args.workers
+    directory = tempfile.mkdtemp(prefix='bench-download-')
+    # Leave the user's run history and media store alone; linking from the
+    # store would also turn later runs into no-ops
+    engine = DownloadEngine(media_store=False, history=False)
+    try:
+        before = measure()
+        started = time.perf_counter()
+        result = engine.run(DownloadOptions(
+            args.url, directory, output_format=FORMATS[args.format],
+            max_workers=workers, per_host_limit=workers, use_cache=False, dedupe=False, quiet=True))
+        wall = time.perf_counter() - started
+    finally:
+        engine.close()
+        shutil.rmtree(directory, ignore_errors=True)
+    return finish({
+        'entries': result.downloaded,
+        'failed': result.failed,
+        'entries_per_sec': round(result.downloaded / wall, 2),
+        'mb_per_sec': round(args.bytes / 2 ** 20 / wall, 2),
+    }, before, wall)
+
+
+def run_convert(args):
+    from benchmarks.fixtures import make_wav, wav_duration
+    from downloader.convert import ConversionPipeline
+    from downloader.scheduler import PlaylistEntry
+
+    media = make_wav(args.size)
+    directory = tempfile.mkdtemp(prefix='bench-convert-')
+    entries = []
+    for i in range(1, args.count + 1):
+        entry = PlaylistEntry(i, {'url': f'file:{i}'})
+        entry.filepath = os.path.join(directory, f'{i}.wav')
+        entry.info = {'duration': wav_duration(len(media))}
+        with open(entry.filepath, 'wb') as f:
+            f.write(media)
+        entries.append(entry)
+
+    workers = 1 if args.mode == 'serial' else None
+    try:
+        before = measure()
+        started = time.perf_counter()
+        with ConversionPipeline(max_workers=workers) as pipeline:
+            for entry in entries:
+                pipeline.submit(entry)
+            pipeline.wait()
+        wall = time.perf_counter() - started
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return finish({
+        'files': pipeline.converted,
+        'failed': pipeline.failed,
+        'files_per_sec': round(pipeline.converted / wall, 2),
+        'mb_per_sec': round(len(media) * args.count / 2 ** 20 / wall, 2),
+        # Seconds of audio converted per second of wall time
+        'realtime_factor': round(wav_duration(len(media)) * pipeline.converted / wall, 1),
+    }, before, wall)
+
+
+def run_child(phase, mode, args, extra=()):
+    cmd = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--child', phase, '--mode', mode,
+           '--count', str(args.count), '--size', str(args.size), '--workers', str(args.workers),
+           '--format', args.format, *extra]
+    output = subprocess.run(cmd, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median_run(runs):
+    """Combine repeated runs: the median of every numeric metric"""
+    combined = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if isinstance(run.get(key), (int, float))]
+        combined[key] = statistics.median(values) if values else runs[0][key]
+    return combined
+
+
+def compare(results, baseline):
+    lines = []
+    for name, metrics in results['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            continue
+        for key, value in metrics.items():
+            before = old.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or not before:
+                continue
+            change = 100 * (value - before) / before
+            better = change > 0 if key in HIGHER_IS_BETTER else change < 0
+            mark = ' ' if abs(change) < 5 else '+' if better else '-'
+            lines.append(f"{mark} {name:<22} {key:<18} {before:>10} -> {value:<10} ({change:+.1f}%)")
+    return lines
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20, help='entries in the playlist (default: 20)')
+    parser.add_argument('--size-mb', type=float, default=2.0, help='size of each media file (default: 2)')
+    parser.add_argument('--workers', type=int, default=4, help='workers in concurrent mode (default: 4)')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='original',
+                        help='output format of the download phase (mp3 needs ffmpeg)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--bandwidth-mb', type=float, default=0.0,
+                        help='per-connection bandwidth cap in MB/s (default: unlimited)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per mode; the median is reported')
+    parser.add_argument('--skip-convert', action='store_true', help='skip the conversion phase')
+    parser.add_argument('-o', '--output', default='bench-results.json', help='where to write the results')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    # Used internally to run one measurement in a fresh process
+    parser.add_argument('--child', choices=('download', 'convert'), help=argparse.SUPPRESS)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--bytes', type=int, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.child:
+        stats = run_download(args) if args.child == 'download' else run_convert(args)
+        print(json.dumps(stats))
+        return 0
+
+    from benchmarks.fixtures import FixtureServer
+    import yt_dlp
+
+    args.size = int(args.size_mb * 2 ** 20)
+    results = {
+        'params': {'count': args.count, 'size_mb': args.size_mb, 'workers': args.workers,
+                   'format': args.format, 'latency': args.latency,
+                   'bandwidth_mb': args.bandwidth_mb, 'repeat': args.repeat},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'yt_dlp': yt_dlp.version.__version__},
+        'results': {},
+    }
+
+    with FixtureServer(args.count, args.size, latency=args.latency,
+                       bandwidth=int(args.bandwidth_mb * 2 ** 20)) as server:
+        for mode in MODES:
+            print(f"download/{mode}...", file=sys.stderr)
+            runs = [run_child('download', mode, args,
+                              ('--url', server.feed_url, '--bytes', str(server.total_bytes)))
+                    for _ in range(args.repeat)]
+            results['results'][f'download/{mode}'] = median_run(runs)
+
+    if args.skip_convert:
+        pass
+    elif shutil.which('ffmpeg') is None:
+        print("ffmpeg not found; skipping the conversion phase", file=sys.stderr)
+    else:
+        for mode in MODES:
+            print(f"convert/{mode}...", file=sys.stderr)
+            runs = [run_child('convert', mode, args) for _ in range(args.repeat)]
+            results['results'][f'convert/{mode}'] = median_run(runs)
+
+    for name, metrics in results['results'].items():
+        print(f"{name:<22} " + '  '.join(f"{key}={value}" for key, value in metrics.items()))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (+ better, - worse, by 5% or more):")
+        for line in compare(results, baseline) or ["no common results"]:
+            print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Benchmark how long the app takes to start, from source or as a frozen build.
+
+Every measurement runs in a fresh process and the median of ``--repeat``
+runs is reported:
+
+* ``import``: importing ``app`` (everything loaded before the window is built)
+* ``warmup``: the one-off yt-dlp work the first download needs, which the
+  app now does on a background thread once the window is up
+* ``launch``: starting the app until its window is shown and idle (needs a
+  display); with ``--exe`` the frozen build is launched instead and timed
+  until ``xdotool`` sees its window
+
+The app's per-user cache (metadata cache, media store, run history) is
+pointed at a temporary directory for the benchmark's lifetime, so the
+real one is neither touched nor measured.
+
+Point ``--app`` at another checkout to measure it, and use ``--compare``
+to see the change::
+
+    git worktree add ../before HEAD~1
+    python -m benchmarks.bench_startup --app ../before -o startup-before.json
+    python -m benchmarks.bench_startup --compare startup-before.json
+    python -m benchmarks.bench_startup --exe dist/app/app --compare startup-before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_pipeline import ROOT, compare, median_run
+
+IMPORT_CHILD = """
+import time
+started = time.perf_counter()
+import app
+print(time.perf_counter() - started)
+"""
+
+WARMUP_CHILD = """
+import time
+started = time.perf_counter()
+from downloader.engine import DownloadEngine
+engine = DownloadEngine()
+if hasattr(engine, 'prewarm'):
+    engine.prewarm().join()
+else:
+    from downloader.engine import DownloadOptions
+    with engine.sessions.session(engine.build_ydl_opts(DownloadOptions(url='', directory=''))):
+        from yt_dlp.extractor import gen_extractor_classes
+        for ie in gen_extractor_classes():
+            ie.suitable('')
+print(time.perf_counter() - started)
+"""
+
+# Runs app.py with its main loop cut short once the window is shown and idle
+LAUNCH_CHILD = """
+import os, runpy, sys, tkinter
+mainloop = tkinter.Tk.mainloop
+
+def mainloop_until_shown(root, n=0):
+    root.after_idle(root.destroy)
+    mainloop(root, n)
+    # Don't wait for the app's background threads
+    os._exit(0)
+
+tkinter.Tk.mainloop = mainloop_until_shown
+sys.argv = [{app!r}]
+runpy.run_path({app!r}, run_name='__main__')
+"""
+
+WINDOW_TITLE = "Media Playlist Downloader"
+
+
+def cache_env(cache_dir):
+    """The environment with the app's per-user cache directory moved to ``cache_dir``"""
+    env = dict(os.environ, XDG_CACHE_HOME=cache_dir, LOCALAPPDATA=cache_dir)
+    if sys.platform == 'darwin':
+        # The cache lives under ~/Library/Caches there
+        env['HOME'] = cache_dir
+    return env
+
+
+def run_python(code, app_dir, env):
+    """Wall time of a fresh interpreter running ``code``, and the time it reports"""
+    env = dict(env, PYTHONPATH=app_dir)
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], cwd=app_dir, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    wall = time.perf_counter() - started
+    return {'process_s': round(wall, 4), 'seconds': round(float(output.strip().splitlines()[-1]), 4)}
+
+
+def run_launch(app_dir, env):
+    """Seconds from launching app.py until it has shown its window and exited"""
+    code = LAUNCH_CHILD.format(app=os.path.join(app_dir, 'app.py'))
+    env = dict(env, PYTHONPATH=app_dir)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], cwd=app_dir, env=env,
+                               capture_output=True, text=True, timeout=120)
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip()
+                           else f"exit status {completed.returncode}")
+    return {'process_s': round(wall, 4)}
+
+
+def run_exe_launch(exe, cwd, env):
+    """Seconds from launching a frozen build until its window is shown; the build can't
+    be told to quit, so ``xdotool`` waits for the window and the process is killed"""
+    process = subprocess.Popen([exe], cwd=cwd, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    started = time.perf_counter()
+    try:
+        subprocess.run(['xdotool', 'search', '--sync', '--onlyvisible', '--name', WINDOW_TITLE],
+                       check=True, capture_output=True, timeout=120)
+        wall = time.perf_counter() - started
+    finally:
+        process.kill()
+        process.wait()
+    return {'process_s': round(wall, 4)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', default=ROOT, help='checkout to measure (default: this one)')
+    parser.add_argument('--exe', help='frozen build to launch instead of app.py')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (default: 5)')
+    parser.add_argument('-o', '--output', default='startup-results.json', help='where to write the results')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args(argv)
+    app_dir = os.path.abspath(args.app)
+
+    results = {
+        'params': {'app': app_dir, 'exe': args.exe, 'repeat': args.repeat},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='bench-startup-cache-') as cache_dir:
+        env = cache_env(cache_dir)
+        if not args.exe:
+            # Prime the OS file cache, bytecode and the stores so every run
+            # measures the same thing, as for a returning user
+            run_python(IMPORT_CHILD, app_dir, env)
+            run_python(WARMUP_CHILD, app_dir, env)
+            for name, code in (('import', IMPORT_CHILD), ('warmup', WARMUP_CHILD)):
+                print(f"{name}...", file=sys.stderr)
+                results['results'][name] = median_run([run_python(code, app_dir, env)
+                                                       for _ in range(args.repeat)])
+
+        name = 'launch/exe' if args.exe else 'launch'
+        print(f"{name}...", file=sys.stderr)
+        try:
+            if args.exe:
+                runs = [run_exe_launch(os.path.abspath(args.exe), app_dir, env) for _ in range(args.repeat)]
+            else:
+                runs = [run_launch(app_dir, env) for _ in range(args.repeat)]
+            results['results'][name] = median_run(runs)
+        except (RuntimeError, OSError, subprocess.SubprocessError) as e:
+            print(f"Skipping {name}: {e}", file=sys.stderr)
+
+    for name, metrics in results['results'].items():
+        print(f"{name:<12} " + '  '.join(f"{key}={value}" for key, value in metrics.items()))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (+ better, - worse, by 5% or more):")
+        for line in compare(results, baseline) or ["no common results"]:
+            print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
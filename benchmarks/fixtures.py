@@ -0,0 +1,143 @@
+"""Local stand-in server serving a synthetic playlist, so benchmarks need no network.
+
+The playlist is an RSS feed (handled by yt-dlp's generic extractor) whose
+entries are WAV files of a fixed size. Optional per-request latency and
+per-connection bandwidth emulate a remote host.
+"""
+import http.server
+import re
+import struct
+import threading
+import time
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+
+
+def make_wav(size):
+    """Return a WAV file of roughly ``size`` bytes holding a noisy tone"""
+    frames = max(1, (size - 44) // (CHANNELS * SAMPLE_WIDTH))
+    # A short deterministic pattern repeated: cheap to build, not trivially compressible
+    pattern = bytes((i * 7919 + (i >> 3) * 104729) & 0xff for i in range(4093))
+    data_size = frames * CHANNELS * SAMPLE_WIDTH
+    data = (pattern * (data_size // len(pattern) + 1))[:data_size]
+    header = struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16, 1,
+                         CHANNELS, SAMPLE_RATE, SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH,
+                         CHANNELS * SAMPLE_WIDTH, SAMPLE_WIDTH * 8, b'data', data_size)
+    return header + data
+
+
+def wav_duration(size):
+    return size / (SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH)
+
+
+class FixtureServer:
+    """Serve ``/feed.xml`` with ``count`` entries of ``size`` bytes each.
+
+    ``latency`` (seconds) is added before every response and ``bandwidth``
+    (bytes per second, per connection) caps the transfer rate; ``0``
+    disables either. Use as a context manager; :attr:`feed_url` is the
+    playlist URL.
+    """
+
+    def __init__(self, count=20, size=2 * 1024 * 1024, latency=0.0, bandwidth=0, port=0):
+        self.count = count
+        self.size = size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.media = make_wav(size)
+        self.requests = 0
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def feed_url(self):
+        return f"{self.base_url}/feed.xml"
+
+    @property
+    def total_bytes(self):
+        return self.count * len(self.media)
+
+    def feed(self):
+        items = ''.join(
+            f'<item><title>Track {i}</title><guid>track-{i}</guid>'
+            f'<enclosure url="{self.base_url}/media/{i}.wav" type="audio/wav" length="{len(self.media)}"/>'
+            f'</item>' for i in range(1, self.count + 1))
+        return (f'<?xml version="1.0"?><rss version="2.0"><channel><title>Benchmark</title>'
+                f'<link>{self.base_url}/</link>{items}</channel></rss>').encode('utf-8')
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def respond(self, head):
+                fixture.requests += 1
+                if fixture.latency:
+                    time.sleep(fixture.latency)
+                if self.path == '/feed.xml':
+                    body, content_type = fixture.feed(), 'application/rss+xml'
+                elif re.fullmatch(r'/media/\d+\.wav', self.path):
+                    body, content_type = fixture.media, 'audio/wav'
+                else:
+                    self.send_error(404)
+                    return
+
+                start, end = 0, len(body) - 1
+                match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if match:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2) or end), end)
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+                if not head:
+                    self.send_body(memoryview(body)[start:end + 1])
+
+            def send_body(self, data):
+                chunk = 64 * 1024
+                started = time.monotonic()
+                for offset in range(0, len(data), chunk):
+                    try:
+                        self.wfile.write(data[offset:offset + chunk])
+                    except (BrokenPipeError, ConnectionResetError):
+                        # yt-dlp sniffs the start of a file and hangs up
+                        self.close_connection = True
+                        return
+                    if fixture.bandwidth:
+                        ahead = (offset + chunk) / fixture.bandwidth - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1 @@
+"""Download engine used by the Media Playlist Downloader GUI."""
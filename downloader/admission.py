@@ -0,0 +1,179 @@
+"""Disk and memory budgets that downloads and conversions reserve before they start."""
+import os
+import shutil
+import sys
+import threading
+from contextlib import contextmanager
+
+from .progress import format_bytes
+
+# Free space always left on the output file system
+DEFAULT_DISK_MARGIN = 512 * 1024 * 1024
+# Share of the memory available at start-up that conversions may take
+MEMORY_SHARE = 0.5
+# Resident memory of one streaming ffmpeg job, generously (typically 20-60 MB)
+FFMPEG_MEMORY = 96 * 1024 * 1024
+# Assumed size of an entry the extractor reports no size or bitrate for
+UNKNOWN_ENTRY_BYTES = 64 * 1024 * 1024
+
+
+class InsufficientSpace(Exception):
+    pass
+
+
+def available_memory():
+    """Bytes of memory available to new processes, or None if unknown"""
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+        status = MEMORYSTATUSEX(dwLength=ctypes.sizeof(MEMORYSTATUSEX))
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+    try:
+        # MemAvailable counts reclaimable page cache, unlike SC_AVPHYS_PAGES
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class Budget:
+    """Bytes of a resource that work reserves before it starts and releases after.
+
+    :meth:`reserve` blocks while a reservation does not fit beside the ones
+    already held, so work queues up instead of failing. A reservation
+    larger than the whole budget is let through once nothing else holds
+    one, so it runs alone rather than never. ``limit`` ``None`` means
+    unlimited.
+    """
+
+    def __init__(self, name, limit=None):
+        self.name = name
+        self.limit = limit
+        self.reserved = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def available(self):
+        """Bytes that can still be reserved, or None if unlimited"""
+        if self.limit is None:
+            return None
+        return self.limit - self.reserved
+
+    def _admit(self, amount):
+        available = self.available()
+        return available is None or amount <= available or not self.reserved
+
+    def reserve(self, amount, check=None, on_wait=None):
+        """Reserve ``amount`` bytes, waiting until they fit; returns the amount reserved.
+
+        ``on_wait(budget, amount)`` is called once if the reservation has
+        to wait, and ``check`` every quarter second while it does, so a
+        pause or cancel (which raises) is not held up.
+        """
+        amount = max(0, int(amount))
+        with self._cond:
+            if not self._admit(amount):
+                self.waiting += 1
+                try:
+                    if on_wait:
+                        on_wait(self, amount)
+                    while not self._admit(amount):
+                        if check:
+                            check()
+                        self._cond.wait(0.25)
+                finally:
+                    self.waiting -= 1
+            self.reserved += amount
+        return amount
+
+    def release(self, amount):
+        with self._cond:
+            self.reserved = max(0, self.reserved - amount)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reservation(self, amount, check=None, on_wait=None):
+        amount = self.reserve(amount, check, on_wait)
+        try:
+            yield amount
+        finally:
+            self.release(amount)
+
+
+class DiskBudget(Budget):
+    """Free space on the file system holding ``path``, less ``margin``.
+
+    The free space is read again on every check, so space freed by other
+    programs is picked up. Files still being written count both in their
+    reservation and in the space they already take, which only errs on the
+    safe side. When nothing is reserved and an entry still does not fit,
+    waiting cannot help and :class:`InsufficientSpace` is raised instead.
+    """
+
+    def __init__(self, path, margin=DEFAULT_DISK_MARGIN):
+        super().__init__(f"disk space on {path}")
+        self.path = path
+        self.margin = margin
+
+    def available(self):
+        try:
+            free = shutil.disk_usage(self.path).free
+        except OSError:
+            return None
+        return free - self.margin - self.reserved
+
+    def _admit(self, amount):
+        available = self.available()
+        if available is None or amount <= available:
+            return True
+        if not self.reserved:
+            raise InsufficientSpace(f"Not enough free space in {self.path}: {format_bytes(amount)} "
+                                    f"needed, {format_bytes(max(available, 0))} available after "
+                                    f"keeping {format_bytes(self.margin)} free")
+        return False
+
+
+class AdmissionController:
+    """Disk budgets per output file system and one memory budget, shared by every job.
+
+    Downloads reserve their estimated size (see :meth:`disk`) and ffmpeg
+    jobs reserve :data:`FFMPEG_MEMORY` from :attr:`memory` before they
+    start. ``memory_limit`` defaults to :data:`MEMORY_SHARE` of the memory
+    available when the controller is created; ``0`` means unlimited.
+    """
+
+    def __init__(self, disk_margin=DEFAULT_DISK_MARGIN, memory_limit=None):
+        if memory_limit is None:
+            available = available_memory()
+            memory_limit = int(available * MEMORY_SHARE) if available else 0
+        self.disk_margin = disk_margin
+        self.memory = Budget('memory', memory_limit or None)
+        self._disks = {}
+        self._lock = threading.Lock()
+
+    def disk(self, directory):
+        """The :class:`DiskBudget` of the file system ``directory`` is on"""
+        try:
+            device = os.stat(directory).st_dev
+        except OSError:
+            device = os.path.abspath(directory)
+        with self._lock:
+            budget = self._disks.get(device)
+            if budget is None:
+                budget = self._disks[device] = DiskBudget(directory, self.disk_margin)
+        return budget
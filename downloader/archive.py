@@ -0,0 +1,126 @@
+"""Persistent per-directory download archive for incremental playlist syncs."""
+import json
+import os
+import sys
+import threading
+import time
+
+ARCHIVE_FILENAME = '.media-downloader-archive.json'
+# Records added since the archive was last rewritten, one JSON object per line
+ARCHIVE_LOG_FILENAME = '.media-downloader-archive.jsonl'
+
+
+class DownloadArchive:
+    """Index of finished entries, keyed by extractor and video ID.
+
+    Each record holds the output path (relative to the directory), the
+    output format and the file size. An entry is considered up to date when
+    a record with the same format exists and the file is still on disk with
+    the recorded size, so converted files whose originals were deleted are
+    not fetched again.
+
+    New records are appended to a log beside the archive, so a save costs
+    only what was added since the last one; the log is folded into the
+    archive once it holds as many records as the archive itself.
+    """
+
+    def __init__(self, directory, save_interval=2.0):
+        self.directory = directory
+        self.path = os.path.join(directory, ARCHIVE_FILENAME)
+        self.log_path = os.path.join(directory, ARCHIVE_LOG_FILENAME)
+        self.save_interval = save_interval
+        self._records = {}
+        self._lock = threading.Lock()
+        # Records not yet appended to the log, and records in the log
+        self._pending = {}
+        self._logged = 0
+        self._last_save = 0.0
+        self.load()
+
+    def load(self):
+        self._records = {}
+        self._logged = 0
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._records = json.load(f).get('entries', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable download archive {self.path}: {e}", file=sys.stderr)
+        try:
+            with open(self.log_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Partially written last line
+                    self._records[record.pop('key')] = record
+                    self._logged += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Ignoring unreadable download archive log {self.log_path}: {e}", file=sys.stderr)
+
+    def lookup(self, key, output_format, files=None):
+        """Return the absolute output path if ``key`` is up to date, else None.
+
+        ``files`` (from :func:`~downloader.preview.scan_directory`) answers
+        for files directly in the directory from that listing alone: they
+        count if present, as their sizes would take a ``stat`` each. Only
+        previews use it; a download checks the size too.
+        """
+        if not key:
+            return None
+        with self._lock:
+            record = self._records.get(key)
+        if not record or record.get('format') != output_format:
+            return None
+        path = os.path.join(self.directory, record['path'])
+        if files is not None and os.path.dirname(record['path']) == '':
+            return path if record['path'] in files else None
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        if size != record.get('size'):
+            return None
+        return path
+
+    def add(self, key, file_path, output_format, **extra):
+        if not key or not file_path or not os.path.exists(file_path):
+            return
+        record = dict(extra, path=os.path.relpath(file_path, self.directory),
+                      format=output_format, size=os.path.getsize(file_path))
+        with self._lock:
+            self._records[key] = record
+            self._pending[key] = record
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """Append the records added since the last save to the log, folding
+        the log into the archive once it has grown as large."""
+        with self._lock:
+            if not self._pending:
+                return
+            data = ''.join(json.dumps(dict(record, key=key), ensure_ascii=False) + '\n'
+                           for key, record in self._pending.items())
+            self._logged += len(self._pending)
+            self._pending = {}
+            self._last_save = time.monotonic()
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(data)
+            if self._logged >= len(self._records) - self._logged:
+                self._compact()
+
+    def _compact(self):
+        data = json.dumps({'version': 1, 'entries': self._records}, indent=1, ensure_ascii=False)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        os.remove(self.log_path)
+        self._logged = 0
+
+    def __len__(self):
+        return len(self._records)
@@ -0,0 +1,112 @@
+"""Local cache of extracted entry metadata, bounded by age and size."""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def default_cache_dir():
+    """Per-user cache directory for the app"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'media-downloader')
+
+
+class MetadataCache:
+    """Extractor results keyed by entry ID (see ``PlaylistEntry.archive_key``).
+
+    Entries older than ``ttl`` seconds are ignored, since the media URLs in
+    them expire. Once the stored data exceeds ``max_bytes`` the least
+    recently used entries are evicted. The cache is a single SQLite file, so
+    it is shared by concurrent jobs and by separate processes.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'metadata.sqlite')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, '
+                         'created REAL NOT NULL, accessed REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self._db.commit()
+
+    def get(self, key):
+        """Return the cached info for ``key``, or None if missing or expired"""
+        if not key:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT data, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                    self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            self._db.commit()
+            self.hits += 1
+        try:
+            return json.loads(zlib.decompress(row[0]))
+        except (zlib.error, ValueError):
+            self.discard(key)
+            return None
+
+    def put(self, key, info):
+        """Store ``info`` (a JSON-serializable dict) under ``key``"""
+        if not key:
+            return
+        data = zlib.compress(json.dumps(info, default=str).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                             (key, data, len(data), now, now))
+            self._evict(now)
+            self._db.commit()
+
+    def discard(self, key):
+        with self._lock:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute('DELETE FROM entries WHERE created < ?', (now - self.ttl,))
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until back under the limit
+        excess = total - self.max_bytes
+        for key, size in self._db.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            if excess <= 0:
+                break
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            excess -= size
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,292 @@
+"""Headless command-line entry point for batch and cron use.
+
+Runs the same engine as the desktop app without importing tkinter::
+
+    python -m downloader URL [URL ...] -o ~/Music --format mp3 --json
+    python -m downloader --file playlists.txt --jobs 4 --json > results.jsonl
+    python -m downloader --file playlists.txt --metrics-port 9464
+    python -m downloader --show-history 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .admission import DEFAULT_DISK_MARGIN, AdmissionController
+from .convert import LOUDNESS_TARGET
+from .engine import DownloadEngine, DownloadOptions
+from .history import RunHistory
+from .metrics import DEFAULT_METRICS_HOST, Metrics, MetricsServer
+from .progress import format_bytes, format_eta
+from .segmented import DEFAULT_CONNECTIONS
+from .throughput import DEFAULT_SYNC_INTERVAL, FsyncBatcher, TokenBucket
+
+FORMAT_CHOICES = {'mp3': "MP3", 'mp4': "MP4", 'original': "Original Format"}
+QUALITY_CHOICES = {'best': "Best Available", 'good': "Good", 'normal': "Normal"}
+
+
+def read_url_file(path):
+    """Read one URL per line, ignoring blank lines and # comments."""
+    handle = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    with handle:
+        return [line.strip() for line in handle
+                if line.strip() and not line.lstrip().startswith('#')]
+
+
+def byte_size(value):
+    """argparse type for sizes and rates such as ``500K`` or ``2M``"""
+    from yt_dlp.utils import parse_bytes
+    size = parse_bytes(value)
+    if size is None or size < 0:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}")
+    return int(size)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m downloader',
+        description='Download playlists without the GUI.')
+    parser.add_argument('urls', nargs='*', metavar='URL', help='playlist or track URLs')
+    parser.add_argument('-f', '--file', action='append', default=[],
+                        help="file with one URL per line ('-' for stdin); may be repeated")
+    parser.add_argument('-o', '--output', default=os.path.join(os.path.expanduser('~'), 'Downloads'),
+                        help='output directory (default: ~/Downloads)')
+    parser.add_argument('--format', choices=sorted(FORMAT_CHOICES), default='mp3',
+                        help='output format (default: mp3)')
+    parser.add_argument('--quality', choices=list(QUALITY_CHOICES), default='best',
+                        help='quality preset; lower tiers fetch smaller streams (default: best)')
+    parser.add_argument('--start', type=int, default=1, help='first playlist index (default: 1)')
+    parser.add_argument('--end', type=int, help='last playlist index (default: all)')
+    parser.add_argument('--cookies', help='cookies.txt file')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='parallel downloads per playlist (default: 4)')
+    parser.add_argument('--per-host', type=int, default=2,
+                        help='parallel downloads per host (default: 2)')
+    parser.add_argument('--segments', type=int, default=DEFAULT_CONNECTIONS, metavar='N',
+                        help='parallel range requests per large file, where the server allows; '
+                             f'1 disables (default: {DEFAULT_CONNECTIONS})')
+    parser.add_argument('--limit-rate', type=byte_size, metavar='RATE',
+                        help='cap the combined download rate of all playlists, '
+                             'in bytes per second (e.g. 500K, 2M)')
+    parser.add_argument('--buffer-size', type=byte_size, metavar='SIZE',
+                        help='fixed read/write block size (e.g. 1M); larger blocks mean '
+                             'fewer writes to network storage (default: adaptive)')
+    parser.add_argument('--sync-interval', type=float, default=DEFAULT_SYNC_INTERVAL, metavar='SECONDS',
+                        help='batch job journal fsyncs this often; 0 syncs every change '
+                             f'(default: {DEFAULT_SYNC_INTERVAL:g})')
+    parser.add_argument('--min-free', type=byte_size, default=DEFAULT_DISK_MARGIN, metavar='SIZE',
+                        help='free space to leave on the output drive; downloads wait for space '
+                             'beyond it (default: 512M)')
+    parser.add_argument('--memory-limit', type=byte_size, metavar='SIZE',
+                        help='memory the ffmpeg jobs may use together; 0 for no limit '
+                             '(default: half the available memory)')
+    parser.add_argument('--normalize', type=float, nargs='?', const=LOUDNESS_TARGET, metavar='LUFS',
+                        help='normalize MP3 loudness (EBU R128, two-pass) to LUFS '
+                             f'(default target: {LOUDNESS_TARGET:g})')
+    parser.add_argument('--no-tags', action='store_true',
+                        help="do not write ID3 tags from the tracks' metadata to MP3s")
+    parser.add_argument('--embed-thumbnail', action='store_true',
+                        help="embed each track's thumbnail in the MP3 as cover art")
+    parser.add_argument('--lazy', action='store_true',
+                        help='stream entries while the playlist is still being listed '
+                             '(for very large playlists and channels)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='always run the extractor instead of reusing cached entry metadata')
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='download tracks again even if another playlist already fetched them')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write per-entry stage timings (Chrome trace JSON, or CSV for .csv)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write a cProfile capture of the run (pstats format)')
+    parser.add_argument('--preview', action='store_true',
+                        help='only show what would be downloaded: entries that are new, '
+                             'unavailable or already on disk, with sizes and durations')
+    parser.add_argument('--flat', action='store_true',
+                        help='with --preview, use the playlist listing alone; much faster '
+                             'for large playlists, but most sizes stay unknown')
+    parser.add_argument('--no-history', action='store_true',
+                        help='do not record the runs in the local run history')
+    parser.add_argument('--show-history', type=int, nargs='?', const=20, metavar='N',
+                        help='list the last N recorded runs (default: 20) and exit')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='serve live metrics in the Prometheus text format at '
+                             'http://HOST:PORT/metrics while the downloads run')
+    parser.add_argument('--metrics-host', default=DEFAULT_METRICS_HOST, metavar='HOST',
+                        help='address to serve metrics on; 0.0.0.0 for other machines '
+                             f'(default: {DEFAULT_METRICS_HOST})')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='playlists to process concurrently (default: 1)')
+    parser.add_argument('--json', action='store_true',
+                        help='print one JSON result object per playlist on stdout')
+    parser.add_argument('-q', '--quiet', action='store_true', help='suppress progress messages')
+    return parser
+
+
+def numbered(path, index, total):
+    """``trace.json`` -> ``trace-2.json`` when several playlists are traced"""
+    if not path or total == 1:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}-{index}{ext}"
+
+
+def run_job(engine, options, quiet):
+    def status(message):
+        if not quiet:
+            print(f"[{options.url}] {message}", file=sys.stderr)
+
+    try:
+        job = engine.run(options, status=status)
+        if job.tracer and not quiet:
+            print(f"[{options.url}] Stage timings:\n{job.tracer.format_summary()}", file=sys.stderr)
+        result = job.to_dict()
+        result['ok'] = result['failed'] == 0
+    except Exception as e:
+        result = {'url': options.url, 'ok': False, 'error': str(e)}
+    return result
+
+
+def run_preview(engine, options, quiet, resolve_sizes=True):
+    def status(message):
+        if not quiet:
+            print(f"[{options.url}] {message}", file=sys.stderr)
+
+    try:
+        preview = engine.preview(options, status=status, resolve_sizes=resolve_sizes)
+        result = preview.to_dict()
+        result['summary'] = preview.summary()
+        result['ok'] = True
+    except Exception as e:
+        result = {'url': options.url, 'ok': False, 'error': str(e)}
+    return result
+
+
+def print_preview(result):
+    """The preview of one playlist as a table"""
+    print(f"{result['title']} ({result['url']})")
+    print(f"  {'#':>5}  {'Status':<12} {'Duration':>8} {'Size':>10}  Title")
+    for entry in result['entries']:
+        size = format_bytes(entry['expected_bytes']) if entry['expected_bytes'] is not None else '?'
+        print(f"  {entry['index'] or '':>5}  {entry['status']:<12} {format_eta(entry['duration']):>8} "
+              f"{size:>10}  {entry['title']}")
+    print(f"  {result['summary']}")
+
+
+def show_history(limit, as_json):
+    """Print the last ``limit`` recorded runs, newest first"""
+    with RunHistory() as history:
+        runs = history.runs(limit)
+    if as_json:
+        for run in runs:
+            print(json.dumps(run, ensure_ascii=False))
+        return 0
+    print(f"{'Run':>6}  {'Started':<16} {'Host':<12} {'Status':<9} {'Done':>5} {'Failed':>6} "
+          f"{'Received':>10} {'Time':>8}  Playlist")
+    for run in runs:
+        started = time.strftime('%Y-%m-%d %H:%M', time.localtime(run['started']))
+        received = format_bytes(run['received_bytes']) if run['received_bytes'] is not None else '?'
+        print(f"{run['id']:>6}  {started:<16} {(run['host'] or '')[:12]:<12} {run['status']:<9} "
+              f"{run['downloaded'] or 0:>5} {run['failed'] or 0:>6} {received:>10} "
+              f"{format_eta(run['elapsed']):>8}  {run['title'] or run['url']}")
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.show_history is not None:
+        return show_history(args.show_history, args.json)
+    urls = list(args.urls)
+    for path in args.file:
+        urls += read_url_file(path)
+    if not urls:
+        parser.error('no URLs given')
+    if args.start < 1 or (args.end is not None and args.end < args.start):
+        parser.error('invalid playlist range')
+    if args.profile and args.jobs > 1:
+        parser.error('--profile needs --jobs 1')
+    if args.sync_interval < 0:
+        parser.error('--sync-interval must not be negative')
+    if args.flat and not args.preview:
+        parser.error('--flat needs --preview')
+
+    jobs = [DownloadOptions(
+        url=url,
+        directory=args.output,
+        output_format=FORMAT_CHOICES[args.format],
+        quality=QUALITY_CHOICES[args.quality],
+        start_index=args.start,
+        end_index=args.end,
+        cookies_file=args.cookies,
+        max_workers=args.workers,
+        per_host_limit=args.per_host,
+        segments=args.segments,
+        lazy=args.lazy,
+        write_buffer=args.buffer_size,
+        use_cache=not args.no_cache,
+        dedupe=not args.no_dedupe,
+        loudness=args.normalize,
+        tags=not args.no_tags,
+        embed_thumbnail=args.embed_thumbnail,
+        trace_file=numbered(args.trace, index, len(urls)),
+        profile_file=numbered(args.profile, index, len(urls)),
+        # yt-dlp's own console output would interleave across jobs
+        quiet=True,
+    ) for index, url in enumerate(urls, start=1)]
+
+    failures = 0
+    # Shared by all jobs: the rate limit and the disk and memory budgets
+    # apply to them together
+    bandwidth = TokenBucket(args.limit_rate)
+    syncer = FsyncBatcher(args.sync_interval)
+    admission = AdmissionController(disk_margin=args.min_free, memory_limit=args.memory_limit)
+    metrics = server = None
+    if args.metrics_port is not None:
+        metrics = Metrics()
+        try:
+            server = MetricsServer(metrics, args.metrics_port, args.metrics_host).start()
+        except OSError as e:
+            parser.error(f'cannot serve metrics on {args.metrics_host}:{args.metrics_port}: {e}')
+        if not args.quiet:
+            print(f"Serving metrics at {server.url}", file=sys.stderr)
+    # One engine for all jobs: one session pool, so connections and cookies
+    # carry over, one set of stores and one ffmpeg pool sized to the cores
+    conversions = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='convert')
+    engine = DownloadEngine(conversion_executor=conversions, bandwidth=bandwidth, syncer=syncer,
+                            admission=admission, history=False if args.no_history else None,
+                            metrics=metrics)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            def run(options):
+                if args.preview:
+                    return run_preview(engine, options, args.quiet, resolve_sizes=not args.flat)
+                return run_job(engine, options, args.quiet)
+
+            for result in pool.map(run, jobs):
+                if not result['ok']:
+                    failures += 1
+                if args.json:
+                    print(json.dumps(result, ensure_ascii=False), flush=True)
+                elif 'error' in result:
+                    print(f"FAILED {result['url']}: {result['error']}")
+                elif args.preview:
+                    print_preview(result)
+                else:
+                    print(f"{result['url']}: {result['downloaded']} downloaded, "
+                          f"{result['linked']} linked, "
+                          f"{result['up_to_date']} up to date, {result['failed']} failed, "
+                          f"{result['bytes_saved_vs_best']} bytes saved versus best quality")
+    finally:
+        conversions.shutdown(wait=False, cancel_futures=True)
+        engine.close()
+        syncer.close()
+        if server:
+            server.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Cooperative pause and cancel for a running download job."""
+import threading
+
+
+class JobInterrupted(Exception):
+    """Raised inside a download when its job is paused or cancelled."""
+
+
+class JobCancelled(JobInterrupted):
+    """Raised when a job has been cancelled."""
+
+
+class JobControl:
+    """Pause/cancel flags checked by the engine while a job runs.
+
+    :meth:`check` never blocks and is called from progress hooks: it
+    aborts the transfer in flight, which is then resumed from its
+    ``.part`` file. :meth:`wait` is called between entries and blocks
+    while the job is paused.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wake anything waiting for a resume so it sees the cancellation
+        self._running.set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise JobCancelled("Cancelled")
+        if not self._running.is_set():
+            raise JobInterrupted("Paused")
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled("Cancelled")
+
+    def wait(self):
+        self._running.wait()
+        self.check_cancelled()
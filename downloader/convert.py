@@ -0,0 +1,469 @@
+"""Streaming ffmpeg stage (MP3 transcodes and stream merges) that runs alongside the downloads."""
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from .admission import FFMPEG_MEMORY
+from .retry import PERMANENT
+from .trace import NULL_TRACER
+
+# Default encoder settings: LAME VBR quality 2 (~190 kbps). Pass ``bitrate``
+# (e.g. '192k') instead for constant bitrate output.
+DEFAULT_BITRATE = None
+DEFAULT_VBR_QUALITY = 2
+
+# EBU R128 normalization: integrated loudness target (LUFS), true peak
+# ceiling (dBTP) and loudness range (LU). -16 LUFS suits music players;
+# broadcast uses -23.
+LOUDNESS_TARGET = -16.0
+TRUE_PEAK = -1.5
+LOUDNESS_RANGE = 11.0
+# loudnorm works at 192 kHz internally; resample its output back down
+NORMALIZED_SAMPLE_RATE = 44100
+# Share of a normalized conversion's progress taken by the analysis pass,
+# which only decodes and so runs much faster than the encode
+ANALYSIS_SHARE = 0.25
+
+# Thumbnail extensions yt-dlp writes beside the download
+COVER_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp')
+
+# Keep ffmpeg from flashing a console window in the windowed Windows build
+CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+# Running ffmpeg processes, so they can be stopped when the app closes
+_processes = set()
+_processes_lock = threading.Lock()
+
+
+class ConversionError(Exception):
+    pass
+
+
+def find_ffmpeg(name='ffmpeg'):
+    path = shutil.which(name)
+    if not path:
+        raise ConversionError(f"{name} was not found. Make sure ffmpeg is installed and on your PATH.")
+    return path
+
+
+def needs_conversion(file_path):
+    return bool(file_path) and os.path.exists(file_path) and not file_path.endswith('.mp3')
+
+
+def probe_audio_codec(file_path):
+    """Return the codec name of the first audio stream, or None if unknown."""
+    try:
+        result = subprocess.run(
+            [find_ffmpeg('ffprobe'), '-v', 'error', '-select_streams', 'a:0',
+             '-show_entries', 'stream=codec_name', '-of', 'default=nw=1:nk=1', file_path],
+            capture_output=True, text=True, creationflags=CREATE_NO_WINDOW)
+    except (ConversionError, OSError):
+        return None
+    return result.stdout.strip() or None
+
+
+def find_cover(file_path):
+    """The thumbnail yt-dlp wrote beside ``file_path``, or None"""
+    base = os.path.splitext(file_path)[0]
+    for ext in COVER_EXTENSIONS:
+        if os.path.exists(f"{base}.{ext}"):
+            return f"{base}.{ext}"
+    return None
+
+
+def id3_tags(info, shared=False):
+    """ID3 tags for a track from its yt-dlp info dict.
+
+    Tracks that belong to an album are tagged with it; other tracks are
+    filed under their playlist, numbered by playlist position. With
+    ``shared`` (the file may be linked into other playlists) that fallback
+    is left out, so every tag describes the track itself.
+    """
+    if info.get('album'):
+        album, track, total = info['album'], info.get('track_number'), None
+    elif shared:
+        album = track = total = None
+    else:
+        album = info.get('playlist_title') or info.get('playlist')
+        track, total = info.get('playlist_index'), info.get('n_entries')
+    artists = info.get('artists')
+    genres = info.get('genres')
+    tags = {
+        'title': info.get('track') or info.get('title'),
+        'artist': (info.get('artist') or (', '.join(artists) if artists else None)
+                   or info.get('creator') or info.get('uploader') or info.get('channel')),
+        'album': album,
+        'album_artist': info.get('album_artist'),
+        'track': f"{track}/{total}" if track and total else track,
+        'date': info.get('release_year') or (info.get('release_date') or info.get('upload_date') or '')[:4],
+        'genre': info.get('genre') or (', '.join(genres) if genres else None),
+        'comment': info.get('webpage_url'),
+    }
+    return {key: str(value) for key, value in tags.items() if value}
+
+
+def loudnorm_filter(target=LOUDNESS_TARGET, measured=None):
+    """The ``loudnorm`` filter for ``target`` LUFS.
+
+    Without ``measured`` it is the analysis pass; with the measurements of
+    that pass it applies a single linear gain, so dynamics are untouched.
+    """
+    text = f"loudnorm=I={target:g}:TP={TRUE_PEAK:g}:LRA={LOUDNESS_RANGE:g}"
+    if measured is None:
+        return text + ':print_format=json'
+    return text + (f":measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+                   f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+                   f":offset={measured['target_offset']}:linear=true")
+
+
+def measure_loudness(file_path, target=LOUDNESS_TARGET, duration=None, on_progress=None):
+    """Analysis pass: decode ``file_path`` and return loudnorm's measurements.
+
+    Returns None for silent tracks, which have no loudness to correct.
+    """
+    cmd = [find_ffmpeg(), '-nostdin', '-hide_banner', '-nostats', '-loglevel', 'info',
+           '-i', file_path, '-map', '0:a:0', '-af', loudnorm_filter(target), '-f', 'null', '-']
+    stderr = run_ffmpeg(cmd, duration=duration, on_progress=on_progress)
+    match = re.search(r'\{[^{}]*"input_i"[^{}]*\}', stderr or '')
+    if not match:
+        raise ConversionError("Loudness analysis returned no measurements")
+    measured = json.loads(match.group(0))
+    try:
+        if not math.isfinite(float(measured['input_i'])):
+            return None
+    except (KeyError, ValueError):
+        raise ConversionError("Loudness analysis returned no measurements")
+    return measured
+
+
+def build_mp3_command(src, dst, bitrate=DEFAULT_BITRATE, vbr_quality=DEFAULT_VBR_QUALITY, copy=False,
+                      metadata=None, cover=None, audio_filter=None):
+    """Build an ffmpeg command that streams ``src`` to an MP3 at ``dst``.
+
+    ``metadata`` tags, a ``cover`` image and an ``audio_filter`` are all
+    applied in the same pass. ``copy`` (no re-encode) cannot be combined
+    with a filter.
+    """
+    cmd = [find_ffmpeg(), '-nostdin', '-hide_banner', '-loglevel', 'error', '-y', '-i', src]
+    if cover:
+        cmd += ['-i', cover]
+    cmd += ['-map', '0:a:0', '-map_metadata', '0']
+    if cover:
+        # ID3 cover art must be JPEG or PNG; YouTube thumbnails are often WebP
+        cmd += ['-map', '1:v:0', '-c:v', 'mjpeg', '-disposition:v:0', 'attached_pic',
+                '-metadata:s:v', 'title=Album cover', '-metadata:s:v', 'comment=Cover (front)']
+    if copy:
+        cmd += ['-c:a', 'copy']
+    elif bitrate:
+        cmd += ['-c:a', 'libmp3lame', '-b:a', str(bitrate)]
+    else:
+        cmd += ['-c:a', 'libmp3lame', '-q:a', str(vbr_quality)]
+    if audio_filter:
+        cmd += ['-af', audio_filter, '-ar', str(NORMALIZED_SAMPLE_RATE)]
+    for key, value in (metadata or {}).items():
+        cmd += ['-metadata', f'{key}={value}']
+    if metadata or cover:
+        # ID3v2.3 is the version Windows and most players read
+        cmd += ['-id3v2_version', '3']
+    cmd += ['-f', 'mp3', dst]
+    return cmd
+
+
+def run_ffmpeg(cmd, duration=None, on_progress=None):
+    """Run an ffmpeg command, reporting the fraction done to ``on_progress``; returns its log."""
+    if on_progress and duration:
+        # Machine-readable progress on stdout: "out_time_us=..." lines
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True, creationflags=CREATE_NO_WINDOW)
+    with _processes_lock:
+        _processes.add(process)
+    try:
+        for line in process.stdout:
+            if on_progress and duration and line.startswith('out_time_us='):
+                try:
+                    on_progress(int(line.split('=', 1)[1]) / 1e6 / duration)
+                except ValueError:
+                    pass
+        stderr = process.stderr.read()
+        returncode = process.wait()
+    except BaseException:
+        # Raised by on_progress (e.g. a cancelled job): do not leave ffmpeg running
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        with _processes_lock:
+            _processes.discard(process)
+    if returncode != 0:
+        message = (stderr or '').strip().splitlines()
+        raise ConversionError(message[-1] if message else f"ffmpeg exited with code {returncode}")
+    return stderr
+
+
+def terminate_processes():
+    """Stop every running ffmpeg process"""
+    with _processes_lock:
+        processes = list(_processes)
+    for process in processes:
+        try:
+            process.terminate()
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        except OSError:
+            pass
+
+
+def merge_streams(parts, dst, duration=None, on_progress=None):
+    """Remux separately downloaded video/audio ``parts`` into ``dst`` and delete them.
+
+    ``parts`` is a list of ``(path, format_dict)`` pairs as left on
+    :attr:`PlaylistEntry.parts`. Streams are copied, never re-encoded.
+    """
+    base, ext = os.path.splitext(dst)
+    tmp_path = f"{base}.temp{ext}"
+    cmd = [find_ffmpeg(), '-nostdin', '-hide_banner', '-loglevel', 'error', '-y']
+    for path, _ in parts:
+        cmd += ['-i', path]
+    for i, (_, fmt) in enumerate(parts):
+        if fmt.get('vcodec') != 'none':
+            cmd += ['-map', f'{i}:v:0?']
+        if fmt.get('acodec') != 'none':
+            cmd += ['-map', f'{i}:a:0?']
+    cmd += ['-c', 'copy']
+    if ext.lower() in ('.mp4', '.m4a', '.mov'):
+        cmd += ['-movflags', '+faststart']
+    cmd.append(tmp_path)
+    try:
+        run_ffmpeg(cmd, duration=duration, on_progress=on_progress)
+        os.replace(tmp_path, dst)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    for path, _ in parts:
+        os.remove(path)
+    return dst
+
+
+def _scaled(on_progress, start, end):
+    """Report a step's progress as the ``start``-``end`` part of the whole"""
+    if on_progress is None:
+        return None
+    return lambda fraction: on_progress(start + (end - start) * fraction)
+
+
+def convert_to_mp3(file_path, bitrate=DEFAULT_BITRATE, vbr_quality=DEFAULT_VBR_QUALITY,
+                   duration=None, on_progress=None, metadata=None, cover=None, loudness=None):
+    """Transcode ``file_path`` to an MP3 beside it and delete the source.
+
+    ffmpeg streams the audio, so memory use does not grow with track length.
+    Sources that already carry an MP3 stream are remuxed without re-encoding.
+    With ``loudness`` (a target in LUFS) the track is first analysed, then
+    normalized while it is encoded; ``metadata`` tags and the ``cover``
+    image (deleted once embedded) go into that same pass, so the output is
+    encoded exactly once. The output is written to a temporary name and
+    renamed into place, so a crash never leaves a truncated MP3 beside its
+    source.
+    """
+    base = os.path.splitext(file_path)[0]
+    mp3_path = base + '.mp3'
+    tmp_path = base + '.temp.mp3'
+    audio_filter = None
+    if loudness is not None:
+        measured = measure_loudness(file_path, loudness, duration, _scaled(on_progress, 0, ANALYSIS_SHARE))
+        if measured:
+            audio_filter = loudnorm_filter(loudness, measured)
+        on_progress = _scaled(on_progress, ANALYSIS_SHARE, 1)
+    copy = audio_filter is None and probe_audio_codec(file_path) == 'mp3'
+    try:
+        try:
+            run_ffmpeg(build_mp3_command(file_path, tmp_path, bitrate, vbr_quality, copy=copy,
+                                         metadata=metadata, cover=cover, audio_filter=audio_filter),
+                       duration=duration, on_progress=on_progress)
+        except ConversionError as e:
+            if not cover:
+                raise
+            # A thumbnail ffmpeg cannot read should not cost the track
+            print(f"Could not embed cover art {cover}: {e}", file=sys.stderr)
+            run_ffmpeg(build_mp3_command(file_path, tmp_path, bitrate, vbr_quality, copy=copy,
+                                         metadata=metadata, audio_filter=audio_filter),
+                       duration=duration, on_progress=on_progress)
+        os.replace(tmp_path, mp3_path)
+    except Exception:
+        # Keep the source and drop any half-written output
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if cover:
+        try:
+            os.remove(cover)
+        except OSError:
+            pass
+    if file_path != mp3_path:
+        os.remove(file_path)
+    return mp3_path
+
+
+class ConversionPipeline:
+    """Run ffmpeg post-processing for finished downloads while others download.
+
+    Entries with separately downloaded streams are merged; with ``to_mp3``
+    other non-MP3 files are transcoded, normalized to ``loudness`` LUFS if
+    given, tagged from the entry's metadata with ``tags`` and given the
+    downloaded thumbnail as cover art with ``cover``; with ``shared`` the
+    files may be linked into other playlists, so tags name no playlist
+    (see :func:`id3_tags`). With any of those,
+    MP3 downloads go through the same pass (remuxed unless normalized).
+    Call :meth:`submit` as each entry
+    finishes downloading, then :meth:`wait` once the downloads are done.
+    Each job is an ffmpeg process, so the pool only needs threads; it is
+    sized to the core count unless ``max_workers`` is given, or shared with
+    other pipelines when an ``executor`` is passed (it is then left open).
+    Each job reserves :data:`~downloader.admission.FFMPEG_MEMORY` from the
+    ``memory`` budget before starting ffmpeg, waiting (and calling
+    ``on_wait``) while it is spent. Merges and conversions are recorded as
+    spans on ``tracer``.
+    """
+
+    def __init__(self, max_workers=None, on_converted=None, on_progress=None, to_mp3=True,
+                 bitrate=DEFAULT_BITRATE, vbr_quality=DEFAULT_VBR_QUALITY, tracer=None,
+                 executor=None, loudness=None, tags=False, cover=False, memory=None, on_wait=None,
+                 shared=False):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.tracer = tracer or NULL_TRACER
+        self.on_converted = on_converted
+        self.on_progress = on_progress
+        self.to_mp3 = to_mp3
+        self.bitrate = bitrate
+        self.vbr_quality = vbr_quality
+        self.loudness = loudness
+        self.tags = tags
+        self.cover = cover
+        self.shared = shared
+        self.memory = memory
+        self.on_wait = on_wait
+        self._owns_pool = executor is None
+        self._pool = executor or ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='convert')
+        # Only unfinished futures are kept, so long jobs do not accumulate them
+        self._futures = set()
+        self._idle = threading.Condition()
+        self.converted = 0
+        self.failed = 0
+
+    def submit(self, entry):
+        """Queue ``entry`` for merging or conversion; returns None if there is nothing to do."""
+        if not entry.ok:
+            return None
+        on_progress = None
+        if self.on_progress:
+            on_progress = lambda fraction: self.on_progress(entry, fraction)
+        duration = (entry.info or {}).get('duration')
+        if entry.parts:
+            future = self._pool.submit(self._traced, 'merge', entry, merge_streams, entry.parts,
+                                       entry.filepath, duration, on_progress)
+        elif self.to_mp3 and self._needs_mp3_pass(entry.filepath):
+            metadata = None
+            if self.tags:
+                metadata = id3_tags({**entry.extra_info, **entry.item, **(entry.info or {})}, self.shared)
+            cover = find_cover(entry.filepath) if self.cover else None
+            future = self._pool.submit(self._traced, 'convert', entry, convert_to_mp3, entry.filepath,
+                                       self.bitrate, self.vbr_quality, duration, on_progress,
+                                       metadata, cover, self.loudness)
+        else:
+            return None
+        with self._idle:
+            self._futures.add(future)
+        future.add_done_callback(lambda f: self._done(entry, f))
+        return future
+
+    def _needs_mp3_pass(self, file_path):
+        if needs_conversion(file_path):
+            return True
+        rewrites = self.loudness is not None or self.tags or self.cover
+        return rewrites and bool(file_path) and os.path.exists(file_path)
+
+    def _traced(self, stage, entry, func, *args):
+        admitted = nullcontext()
+        if self.memory:
+            admitted = self.memory.reservation(FFMPEG_MEMORY, on_wait=self.on_wait)
+        # The span starts once the memory is granted, so it times ffmpeg alone
+        with admitted, self.tracer.span(stage, entry):
+            return func(*args)
+
+    def _done(self, entry, future):
+        if future.cancelled():
+            self._finished(future)
+            return
+        try:
+            entry.filepath = future.result()
+            entry.parts = []
+            self._count(converted=1)
+        except Exception as e:
+            self._count(failed=1)
+            # Without the merge or conversion there is no file in the output format
+            entry.error = f"{'Merging streams' if entry.parts else 'Converting to MP3'} failed: {e}"
+            entry.error_kind = PERMANENT
+            print(f"Error converting file {entry.index}: {e}", file=sys.stderr)
+        try:
+            if self.on_converted:
+                self.on_converted(entry)
+        except Exception as e:
+            # Otherwise the entry would be lost, or wait() would never return
+            if entry.error is None:
+                self._count(failed=1)
+            entry.error = f"Finishing after conversion failed: {e}"
+            entry.error_kind = PERMANENT
+            print(f"Error finishing file {entry.index}: {e}", file=sys.stderr)
+        finally:
+            self._finished(future)
+
+    def _count(self, converted=0, failed=0):
+        # Callbacks run on whichever worker finished the job
+        with self._idle:
+            self.converted += converted
+            self.failed += failed
+
+    def _finished(self, future):
+        with self._idle:
+            self._futures.discard(future)
+            self._idle.notify_all()
+
+    @property
+    def pending(self):
+        return len(self._futures)
+
+    def wait(self):
+        """Block until every queued conversion has finished."""
+        if self._owns_pool:
+            self._pool.shutdown(wait=True)
+        with self._idle:
+            self._idle.wait_for(lambda: not self._futures)
+
+    def close(self):
+        """Drop conversions that have not started yet"""
+        if self._owns_pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            with self._idle:
+                futures = list(self._futures)
+            for future in futures:
+                future.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.wait()
+        else:
+            self.close()
@@ -0,0 +1,168 @@
+"""Index of finished media shared across playlists, so a track is fetched once."""
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from .cache import default_cache_dir
+
+HASH_CHUNK = 1024 * 1024
+# ioctl that clones a file's extents on copy-on-write file systems (Btrfs, XFS)
+FICLONE = 0x40049409
+
+
+def file_hash(path):
+    """BLAKE2b digest of the file's content"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def reflink(src, dst):
+    """Clone ``src`` to ``dst`` without copying data; False where unsupported"""
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    try:
+        with open(src, 'rb') as source, open(dst, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def materialize(src, dst, allow_copy=True):
+    """Make ``dst`` hold the content of ``src``; returns how, or None.
+
+    Tries a hardlink, then a reflink, then (with ``allow_copy``) a plain
+    copy. ``dst`` is replaced atomically, so a crash never leaves a
+    partial file under the final name.
+    """
+    tmp_path = dst + '.link'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+        method = 'hardlink'
+    except OSError:
+        if reflink(src, tmp_path):
+            method = 'reflink'
+        elif allow_copy:
+            shutil.copyfile(src, tmp_path)
+            method = 'copy'
+        else:
+            return None
+    try:
+        os.replace(tmp_path, dst)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+    return method
+
+
+class MediaStore:
+    """Finished media files by entry ID, output format and quality.
+
+    Every file an entry ends up as is recorded with its size, mtime and
+    content hash, so a later playlist containing the same track can link
+    to it instead of downloading and converting it again. :meth:`find` is
+    one indexed query plus a ``stat``; files that were moved, deleted or
+    edited since are dropped from the index. :meth:`add` also links a new
+    file to an existing one with the same content (same hash) when both
+    are on the same file system. Like the metadata cache this is a single
+    SQLite file shared by concurrent jobs and processes.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'media.sqlite')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS media ('
+                         'key TEXT NOT NULL, format TEXT NOT NULL, quality TEXT NOT NULL, '
+                         'path TEXT NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL, '
+                         'hash TEXT NOT NULL, added REAL NOT NULL, '
+                         'PRIMARY KEY (key, format, quality, path))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS media_hash ON media (hash, size)')
+        self._db.commit()
+
+    def find(self, key, output_format, quality):
+        """Return ``(path, hash)`` of an intact copy of the entry, or None"""
+        if not key:
+            return None
+        with self._lock:
+            rows = self._db.execute('SELECT path, size, mtime, hash FROM media '
+                                    'WHERE key = ? AND format = ? AND quality = ?',
+                                    (key, output_format, quality)).fetchall()
+        for path, size, mtime, content_hash in rows:
+            if self._intact(path, size, mtime):
+                self.hits += 1
+                return path, content_hash
+            self._forget(path)
+        return None
+
+    def add(self, key, output_format, quality, path, content_hash=None):
+        """Record ``path`` as the entry's file; returns how it was deduplicated, if it was"""
+        if not key:
+            return None
+        if content_hash is None:
+            content_hash = file_hash(path)
+        method = None
+        stat = os.stat(path)
+        with self._lock:
+            rows = self._db.execute('SELECT path, mtime FROM media WHERE hash = ? AND size = ? AND path != ?',
+                                    (content_hash, stat.st_size, path)).fetchall()
+        for other, mtime in rows:
+            try:
+                other_stat = os.stat(other)
+            except OSError:
+                self._forget(other)
+                continue
+            if other_stat.st_ino == stat.st_ino and other_stat.st_dev == stat.st_dev:
+                break  # Already the same file
+            if other_stat.st_mtime != mtime or other_stat.st_dev != stat.st_dev:
+                continue
+            # Same bytes fetched under another ID: keep one copy on disk
+            method = materialize(other, path, allow_copy=False)
+            if method:
+                stat = os.stat(path)
+                break
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (key, output_format, quality, path, stat.st_size, stat.st_mtime,
+                              content_hash, time.time()))
+            self._db.commit()
+        return method
+
+    def _intact(self, path, size, mtime):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == size and stat.st_mtime == mtime
+
+    def _forget(self, path):
+        with self._lock:
+            self._db.execute('DELETE FROM media WHERE path = ?', (path,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
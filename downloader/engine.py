@@ -0,0 +1,829 @@
+"""GUI-independent download engine shared by the desktop app and the CLI."""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .admission import UNKNOWN_ENTRY_BYTES, AdmissionController
+from .archive import DownloadArchive
+from .cache import MetadataCache
+from .control import JobCancelled
+from .dedupe import MediaStore, materialize
+from .history import CANCELLED as RUN_CANCELLED, DONE as RUN_DONE, FAILED as RUN_FAILED, RunHistory
+from .convert import ConversionPipeline, terminate_processes
+from .journal import CONVERTING, DONE, DOWNLOADED, DOWNLOADING, FAILED, QUEUED, JobJournal, job_id
+from .preview import (IN_LIBRARY, NEW, ON_DISK, PARTIAL, TO_FETCH, UNAVAILABLE, DirectoryIndex,
+                      PreviewEntry, PreviewResult, is_unavailable, scan_directory)
+from .progress import ProgressTracker, format_bytes
+from .quality import DEFAULT_QUALITY, best_quality_size, format_size, get_preset
+from .retry import CANCELLED, PERMANENT, THROTTLED, classify_error
+from .scheduler import PlaylistScheduler
+from .segmented import DEFAULT_CONNECTIONS
+from .session import SessionPool
+from .trace import Tracer
+
+FORMATS = ("MP3", "MP4", "Original Format")
+# Extension of the finished file; original-format downloads keep the source's
+OUTPUT_EXTENSIONS = {"MP3": "mp3", "MP4": "mp4"}
+
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+
+
+def is_youtube_url(url):
+    """Check if the URL is from YouTube"""
+    youtube_domains = ['youtube.com', 'youtu.be', 'm.youtube.com', 'www.youtube.com']
+    return any(domain in url.lower() for domain in youtube_domains)
+
+
+def entry_outcome(entry):
+    """How an entry that reached its final state ended"""
+    return 'failed' if entry.error else 'skipped' if entry.skipped else 'linked' if entry.linked else 'done'
+
+
+def has_output_extension(path, output_format):
+    """Whether ``path`` is a file of ``output_format`` (any file for the original format)"""
+    ext = OUTPUT_EXTENSIONS.get(output_format)
+    return ext is None or os.path.splitext(path)[1][1:].lower() == ext
+
+
+def media_variant(options):
+    """Quality key finished files are indexed under in the media store"""
+    variant = options.quality
+    if options.output_format == "MP3":
+        if options.loudness is not None:
+            # Normalized files are not interchangeable with files at their original level
+            variant += f" @ {options.loudness:g} LUFS"
+        # Nor are files with different tags or cover art written into them
+        if not options.tags:
+            variant += " untagged"
+        if options.embed_thumbnail:
+            variant += " +cover"
+    return variant
+
+
+class DownloadOptions:
+    """Everything needed to download one playlist."""
+
+    def __init__(self, url, directory, output_format="MP3", quality=DEFAULT_QUALITY,
+                 start_index=1, end_index=None,
+                 cookies_file=None, max_workers=4, per_host_limit=2, fragment_workers=4,
+                 lazy=False, use_cache=True, trace=False, trace_file=None, profile_file=None,
+                 quiet=False, write_buffer=None, dedupe=True, loudness=None, tags=True,
+                 embed_thumbnail=False, segments=DEFAULT_CONNECTIONS):
+        self.url = url
+        self.directory = directory
+        self.output_format = output_format
+        self.quality = quality
+        self.start_index = start_index or 1
+        self.end_index = end_index
+        self.cookies_file = cookies_file
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.fragment_workers = fragment_workers
+        # Stream entries from the extractor instead of listing the playlist first
+        self.lazy = lazy
+        # Reuse recently extracted entry metadata (see downloader.cache)
+        self.use_cache = use_cache
+        # Record per-stage timings; written to trace_file (.json or .csv) if given,
+        # with a cProfile capture written to profile_file
+        self.trace = trace or bool(trace_file or profile_file)
+        self.trace_file = trace_file
+        self.profile_file = profile_file
+        self.quiet = quiet
+        # Bytes read and written per block; fixed, so slow or rate-limited
+        # transfers still write large blocks (None lets yt-dlp adapt it)
+        self.write_buffer = write_buffer
+        # Link tracks already fetched for another playlist instead of
+        # downloading them again (see downloader.dedupe)
+        self.dedupe = dedupe
+        # MP3 post-processing, done while transcoding: normalize to this
+        # loudness in LUFS (None leaves levels alone), write ID3 tags from
+        # the entry's metadata, and embed its thumbnail as cover art
+        self.loudness = loudness
+        self.tags = tags
+        self.embed_thumbnail = embed_thumbnail
+        # Parallel range requests per large single file (see
+        # downloader.segmented); 1 leaves every transfer to yt-dlp
+        self.segments = segments
+
+    @property
+    def range_text(self):
+        return f"from {self.start_index}" + (f" to {self.end_index}" if self.end_index else " to end")
+
+
+class JobResult:
+    """Outcome of one playlist download.
+
+    Entries are added with :meth:`add` as they reach a final state. With
+    ``keep_entries=False`` (streaming mode) only failed entries are kept,
+    so memory does not grow with the playlist size.
+    """
+
+    def __init__(self, options, title=None, keep_entries=True):
+        self.options = options
+        self.title = title
+        self.keep_entries = keep_entries
+        self.entries = []
+        self.failures = []
+        self.downloaded = 0
+        self.up_to_date = 0
+        self.linked = 0
+        self.resumed = 0
+        self.retried = 0
+        self.selected_bytes = 0
+        self.bytes_saved = 0
+        self.received_bytes = 0
+        # ID of the run in the run history, if it is kept
+        self.run_id = None
+        # Wall time of the run, and its Tracer when timings were recorded
+        self.elapsed = None
+        self.tracer = None
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            if entry.attempts > 1:
+                self.retried += 1
+            self.received_bytes += entry.received_bytes
+            if entry.error:
+                self.failures.append(entry)
+            elif entry.skipped:
+                self.up_to_date += 1
+            elif entry.linked:
+                self.linked += 1
+            else:
+                self.downloaded += 1
+                self.selected_bytes += entry.expected_bytes or 0
+                if entry.best_bytes and entry.expected_bytes:
+                    # Bytes not fetched compared to best quality
+                    self.bytes_saved += max(entry.best_bytes - entry.expected_bytes, 0)
+            if self.keep_entries or entry.error:
+                self.entries.append(entry)
+
+    @property
+    def failed(self):
+        return len(self.failures)
+
+    def describe_savings(self):
+        if not self.bytes_saved:
+            return None
+        return (f"Saved {format_bytes(self.bytes_saved)} versus best quality "
+                f"({format_bytes(self.selected_bytes)} fetched)")
+
+    def to_dict(self):
+        entries = sorted(self.entries, key=lambda e: e.index or 0)
+        return {
+            'url': self.options.url,
+            'title': self.title,
+            'run_id': self.run_id,
+            'format': self.options.output_format,
+            'quality': self.options.quality,
+            'directory': self.options.directory,
+            'start': self.options.start_index,
+            'end': self.options.end_index,
+            'downloaded': self.downloaded,
+            'up_to_date': self.up_to_date,
+            'linked': self.linked,
+            'resumed': self.resumed,
+            'retried': self.retried,
+            'failed': self.failed,
+            'elapsed': round(self.elapsed, 3) if self.elapsed is not None else None,
+            'bytes_fetched_estimate': self.selected_bytes,
+            'bytes_saved_vs_best': self.bytes_saved,
+            'received_bytes': self.received_bytes,
+            'entries': [{
+                'index': e.index,
+                'title': e.title,
+                'path': e.filepath,
+                'status': entry_outcome(e),
+                'error': e.error,
+                'error_kind': e.error_kind,
+                'attempts': e.attempts,
+                'received_bytes': e.received_bytes,
+            } for e in entries],
+            'timings': [{'stage': stage, 'count': count, 'total': round(total, 3),
+                         'mean': round(mean, 3), 'p95': round(p95, 3), 'max': round(longest, 3)}
+                        for stage, count, total, mean, p95, longest in self.tracer.summary()]
+                       if self.tracer else None,
+        }
+
+
+class DownloadEngine:
+    """Download playlists described by :class:`DownloadOptions`.
+
+    ``status`` is called with short human-readable progress messages and
+    ``progress`` with throttled :class:`~downloader.progress.ProgressSnapshot`
+    objects. Both are called from worker threads.
+
+    ``metadata_cache`` and ``media_store`` (the index of finished files used
+    to deduplicate tracks across playlists) are shared by every run of the
+    engine; by default the per-user ones are opened on first use. ``sessions`` is the
+    :class:`~downloader.session.SessionPool` every run draws its yt-dlp
+    sessions from; pass one pool to several engines to share connections
+    and cookies between them.
+
+    ``download_slots`` (a semaphore) and ``conversion_executor`` are shared
+    by every run, to bound downloads and ffmpeg processes across
+    concurrent runs; by default each run has its own. ``bandwidth`` (a
+    :class:`~downloader.throughput.TokenBucket`) caps the combined transfer
+    rate and ``syncer`` (a :class:`~downloader.throughput.FsyncBatcher`)
+    batches the journal fsyncs of every run. ``admission`` (an
+    :class:`~downloader.admission.AdmissionController`) holds the disk and
+    memory budgets that downloads and conversions of every run reserve
+    before they start.
+
+    Every run is recorded in ``history`` (a
+    :class:`~downloader.history.RunHistory`; the per-user one by default,
+    ``False`` for none) and, given ``metrics`` (a
+    :class:`~downloader.metrics.Metrics`), counted in its live counters
+    and histograms.
+    """
+
+    def __init__(self, status=None, progress=None, metadata_cache=None, sessions=None,
+                 download_slots=None, conversion_executor=None, bandwidth=None, syncer=None,
+                 media_store=None, admission=None, history=None, metrics=None):
+        self.status = status or (lambda message: None)
+        self.progress = progress
+        self.download_slots = download_slots
+        self.conversion_executor = conversion_executor
+        self.bandwidth = bandwidth
+        self.syncer = syncer
+        self.admission = admission or AdmissionController()
+        self.metrics = metrics
+        self._owns_sessions = sessions is None
+        self.sessions = SessionPool() if sessions is None else sessions
+        self._metadata_cache = metadata_cache
+        self._media_store = media_store
+        self._history = history
+        # Stores opened by the engine itself, closed by close()
+        self._opened = []
+        self._cache_lock = threading.Lock()
+
+    @property
+    def metadata_cache(self):
+        with self._cache_lock:
+            if self._metadata_cache is None:
+                try:
+                    self._metadata_cache = MetadataCache()
+                    self._opened.append(self._metadata_cache)
+                except Exception as e:
+                    # The cache only saves time; run without it
+                    print(f"Metadata cache unavailable: {e}", file=sys.stderr)
+                    self._metadata_cache = False
+            return self._metadata_cache or None
+
+    @property
+    def media_store(self):
+        with self._cache_lock:
+            if self._media_store is None:
+                try:
+                    self._media_store = MediaStore()
+                    self._opened.append(self._media_store)
+                except Exception as e:
+                    print(f"Media store unavailable: {e}", file=sys.stderr)
+                    self._media_store = False
+            return self._media_store or None
+
+    @property
+    def history(self):
+        with self._cache_lock:
+            if self._history is None:
+                try:
+                    self._history = RunHistory()
+                    self._opened.append(self._history)
+                except Exception as e:
+                    print(f"Run history unavailable: {e}", file=sys.stderr)
+                    self._history = False
+            return self._history or None
+
+    def run(self, options, status=None, progress=None, control=None):
+        """Download one playlist; ``status`` and ``progress`` override the engine's callbacks
+
+        With a ``control`` (:class:`~downloader.control.JobControl`) the run
+        can be paused, and cancelled, which raises
+        :class:`~downloader.control.JobCancelled`.
+        """
+        os.makedirs(options.directory, exist_ok=True)
+        return self.download_playlist(options, status or self.status, progress or self.progress,
+                                      control)
+
+    @staticmethod
+    def restore_entry(entry, record):
+        """Pick up an entry whose download finished before an interruption"""
+        parts = [(path, fmt) for path, fmt in record.get('parts') or []]
+        path = record.get('path')
+        if parts and all(os.path.exists(part) for part, _ in parts):
+            entry.parts = parts
+        elif not path or not os.path.exists(path):
+            return False
+        entry.filepath = path
+        entry.title = record.get('title') or entry.title
+        entry.info = {'duration': record.get('duration')}
+        entry.expected_bytes = record.get('expected_bytes')
+        entry.best_bytes = record.get('best_bytes')
+        return True
+
+    def prewarm(self):
+        """Load yt-dlp, a session and the caches on a background thread.
+
+        Call once the UI is up, so the first download does not wait for
+        the one-off start-up work.
+        """
+        opts = self.build_ydl_opts(DownloadOptions(url='', directory=''))
+
+        def warm():
+            try:
+                self.sessions.prewarm(opts)
+                self.metadata_cache
+                self.media_store
+            except Exception as e:
+                # The first download does the same work, and reports errors properly
+                print(f"Prewarm failed: {e}", file=sys.stderr)
+
+        thread = threading.Thread(target=warm, daemon=True, name='prewarm')
+        thread.start()
+        return thread
+
+    def build_ydl_opts(self, options):
+        ydl_opts = {
+            'format': get_preset(options.quality).format_for(options.output_format),
+            'outtmpl': os.path.join(options.directory, '%(playlist_index)s - %(title)s.%(ext)s'),
+            'noplaylist': False,
+            'postprocessors': [],
+            'http_headers': {'User-Agent': USER_AGENT},
+            'playliststart': options.start_index,
+            'ignoreerrors': True,
+            'no_warnings': False,
+            'extractaudio': False,
+            'embed_subs': False,
+            'writeautomaticsub': False,
+            'concurrent_fragment_downloads': options.fragment_workers,
+        }
+        if options.output_format == "MP4":
+            ydl_opts['merge_output_format'] = 'mp4'
+        if options.end_index:
+            ydl_opts['playlistend'] = options.end_index
+        if options.embed_thumbnail and options.output_format == "MP3":
+            # Written beside the download; embedded and deleted by the conversion
+            ydl_opts['writethumbnail'] = True
+        if options.write_buffer:
+            ydl_opts['buffersize'] = options.write_buffer
+            ydl_opts['noresizebuffer'] = True
+        if options.cookies_file and os.path.exists(options.cookies_file):
+            ydl_opts['cookiefile'] = options.cookies_file
+        if options.quiet:
+            ydl_opts.update({'quiet': True, 'noprogress': True})
+        return ydl_opts
+
+    def download_playlist(self, options, status, progress=None, control=None):
+        """Download every entry in range, then merge/convert each as it finishes"""
+        output_format = options.output_format
+        status(f"Extracting playlist information... (Range: {options.range_text})")
+
+        started = time.perf_counter()
+        metrics = self.metrics
+        run_id = self._start_run(options)
+
+        def on_span(name, entry, duration):
+            if entry is not None:
+                entry.timings[name] = entry.timings.get(name, 0) + duration
+            if metrics:
+                metrics.observe('media_downloader_stage_duration_seconds', duration, stage=name)
+
+        # Stage timings always feed the run history and metrics; spans are
+        # only kept when a trace was asked for
+        tracer = Tracer(profile=bool(options.profile_file), on_span=on_span, record=options.trace)
+        preset = get_preset(options.quality)
+        journal = JobJournal(options.directory, job_id(
+            options.url, output_format, options.quality, options.start_index, options.end_index),
+            syncer=self.syncer)
+        disk = self.admission.disk(options.directory)
+        # Disk space reserved per entry until it is finished
+        reserved = {}
+        # Entries between selecting their formats and their download ending
+        downloading = set()
+
+        def on_wait(budget, amount):
+            status(f"Waiting for {budget.name} ({format_bytes(amount)} needed)...")
+
+        def reserve_disk(entry):
+            size = entry.expected_bytes or UNKNOWN_ENTRY_BYTES
+            if to_mp3 or entry.info.get('requested_formats'):
+                # The download and the file made from it sit side by side until it is done
+                size *= 2
+            part_path = entry.filepath + '.part'
+            if os.path.exists(part_path):
+                size -= os.path.getsize(part_path)
+            reserved[entry] = disk.reserve(size, check=control.check if control else None,
+                                           on_wait=on_wait)
+
+        def before_download(ydl, entry):
+            entry.expected_bytes = format_size(entry.info, entry.info.get('duration'))
+            if preset.is_best:
+                entry.best_bytes = entry.expected_bytes
+            else:
+                try:
+                    entry.best_bytes = best_quality_size(ydl, entry.info, output_format)
+                except Exception:
+                    entry.best_bytes = None
+            if entry not in reserved:
+                # Retries keep the reservation of their first attempt
+                reserve_disk(entry)
+            if metrics and entry not in downloading:
+                downloading.add(entry)
+                metrics.inc('media_downloader_downloads_active')
+            journal.record(entry.archive_key, DOWNLOADING, path=entry.filepath)
+
+        def on_retry(entry, delay):
+            if metrics:
+                metrics.inc('media_downloader_retries_total')
+            reason = "rate limited" if entry.error_kind == THROTTLED else "temporary error"
+            status(f"Retrying '{entry.title or entry.url}' in {delay:.0f}s ({reason}, "
+                        f"attempt {entry.attempts + 1})...")
+
+        def on_received(entry, amount):
+            metrics.inc('media_downloader_received_bytes_total', amount)
+            metrics.set('media_downloader_last_progress_timestamp_seconds', round(time.time(), 3))
+
+        tracker = ProgressTracker(on_update=progress)
+        scheduler = PlaylistScheduler(self.build_ydl_opts(options), max_workers=options.max_workers,
+                                      per_host_limit=options.per_host_limit,
+                                      progress_hook=tracker.download_hook, defer_merge=True,
+                                      before_download=before_download,
+                                      metadata_cache=self.metadata_cache if options.use_cache else None,
+                                      sessions=self.sessions, on_retry=on_retry, tracer=tracer,
+                                      download_slots=self.download_slots, control=control,
+                                      bandwidth=self.bandwidth, segments=options.segments,
+                                      on_received=on_received if metrics else None)
+        try:
+            if options.lazy:
+                info_dict, entries = scheduler.resolve_lazy(options.url)
+            else:
+                info_dict, entries = scheduler.resolve(options.url)
+        except Exception as e:
+            self._finish_run(run_id, None, control, time.perf_counter() - started, str(e))
+            raise
+        result = JobResult(options, title=info_dict.get('title', 'playlist'),
+                           keep_entries=not options.lazy)
+        result.run_id = run_id
+        total_text = '?' if options.lazy else str(len(entries))
+        discovered = [0]
+        finished = [0]
+
+        archive = DownloadArchive(options.directory)
+        store = self.media_store if options.dedupe else None
+        indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='index') if store else None
+        to_mp3 = output_format == "MP3"
+        variant = media_variant(options)
+        tracker.set_entries(0 if options.lazy else len(entries), convert=True,
+                            convert_label="Converted" if to_mp3 else "Merged")
+        def conversion_progress(entry, fraction):
+            if control:
+                # Stops ffmpeg when the job is cancelled
+                control.check_cancelled()
+            tracker.conversion_progress(entry, fraction)
+
+        # Merges of separately downloaded streams always go through the pool
+        pipeline = ConversionPipeline(to_mp3=to_mp3, on_progress=conversion_progress,
+                                      vbr_quality=preset.mp3_vbr_quality, tracer=tracer,
+                                      executor=self.conversion_executor, loudness=options.loudness,
+                                      tags=options.tags, cover=options.embed_thumbnail,
+                                      memory=self.admission.memory, on_wait=on_wait,
+                                      shared=store is not None)
+        if journal.resumed:
+            status("Resuming interrupted job...")
+
+        def finish_entry(entry):
+            """Record an entry that reached its final state and drop its metadata"""
+            if control and control.cancelled:
+                # Leave the journal as it is so the entry resumes next time
+                return
+            with tracer.span('finalize', entry):
+                if entry.ok and not has_output_extension(entry.filepath, output_format):
+                    # Never archive a download that did not become the output format
+                    entry.error = f"Not converted to {output_format}: {os.path.basename(entry.filepath)}"
+                    entry.error_kind = PERMANENT
+                if entry.ok:
+                    archive.add(entry.archive_key, entry.filepath, output_format, title=entry.title)
+                    journal.record(entry.archive_key, DONE, path=entry.filepath)
+                    if store and not (entry.skipped or entry.linked):
+                        remember(entry)
+                else:
+                    journal.record(entry.archive_key, FAILED, error=entry.error,
+                                   error_kind=entry.error_kind)
+            result.add(entry)
+            disk.release(reserved.pop(entry, 0))
+            outcome = entry_outcome(entry)
+            if metrics:
+                metrics.inc('media_downloader_entries_total', outcome=outcome)
+            if run_id is not None:
+                self._record(self.history.add_entry, run_id, entry, outcome)
+            entry.release()
+
+        def index(key, path, content_hash=None):
+            try:
+                store.add(key, output_format, variant, path, content_hash)
+            except Exception as e:
+                # Deduplication only saves work; the entry itself is fine
+                print(f"Could not index '{path}' for deduplication: {e}", file=sys.stderr)
+
+        def remember(entry, content_hash=None):
+            """Index a finished file so other playlists can link to it"""
+            if not has_output_extension(entry.filepath, output_format):
+                # Only files that became the output format may stand in for it
+                return
+            path = os.path.abspath(entry.filepath)
+            if content_hash is None:
+                # Hashing a large file takes a while; keep it off the threads
+                # that dispatch downloads and run conversions
+                indexer.submit(index, entry.archive_key, path)
+            else:
+                index(entry.archive_key, path, content_hash)
+
+        def link_duplicate(entry):
+            """Materialize an entry from a copy fetched for another playlist; returns whether it was"""
+            with tracer.span('dedupe', entry):
+                found = store.find(entry.archive_key, output_format, variant)
+                if found is None:
+                    return False
+                source, content_hash = found
+                try:
+                    target = scheduler.target_path(entry, os.path.splitext(source)[1][1:])
+                    if os.path.abspath(target) == source:
+                        # Already here, just missing from this folder's archive
+                        entry.skipped = True
+                    else:
+                        materialize(source, target)
+                        entry.linked = True
+                except Exception as e:
+                    print(f"Could not link '{entry.title or entry.url}' from {source}: {e}", file=sys.stderr)
+                    return False
+                entry.filepath = target
+                if entry.linked:
+                    remember(entry, content_hash)
+            return True
+
+        def report_progress(entry=None):
+            text = f"Downloading... ({finished[0]}/{discovered[0] if options.lazy else total_text})"
+            if to_mp3:
+                text += f" | Converted to MP3: {pipeline.converted}"
+            elif pipeline.converted:
+                text += f" | Merged: {pipeline.converted}"
+            status(text)
+
+        def on_entry_done(entry):
+            if entry in downloading:
+                downloading.discard(entry)
+                metrics.inc('media_downloader_downloads_active', -1)
+            if entry.error_kind == CANCELLED:
+                return
+            finished[0] += 1
+            if entry.ok:
+                journal.record(entry.archive_key, DOWNLOADED, path=entry.filepath,
+                               parts=[(path, {'vcodec': fmt.get('vcodec'), 'acodec': fmt.get('acodec')})
+                                      for path, fmt in entry.parts],
+                               title=entry.title, duration=(entry.info or {}).get('duration'),
+                               expected_bytes=entry.expected_bytes, best_bytes=entry.best_bytes)
+            else:
+                print(f"Error downloading entry {entry.index} ({entry.error_kind}, "
+                      f"{entry.attempts} attempt{'s' if entry.attempts != 1 else ''}): {entry.error}",
+                      file=sys.stderr)
+            # Hand the file straight to the conversion stage; files that
+            # need no conversion are finished right away
+            converting = pipeline.submit(entry) is not None
+            if converting:
+                journal.record(entry.archive_key, CONVERTING)
+            else:
+                finish_entry(entry)
+            tracker.entry_finished(entry, converting=converting)
+            report_progress()
+
+        def on_converted(entry):
+            tracker.conversion_finished(entry)
+            finish_entry(entry)
+            report_progress()
+
+        pipeline.on_converted = on_converted
+
+        def plan(entries):
+            """Yield the entries that still need downloading, handling the rest inline"""
+            for entry in entries:
+                if control:
+                    # Hold back new entries while paused; stop when cancelled
+                    control.wait()
+                discovered[0] += 1
+                if options.lazy:
+                    tracker.add_entries(1)
+                # Skip entries the archive says are already on disk in this format
+                archived_path = archive.lookup(entry.archive_key, output_format)
+                if archived_path:
+                    entry.filepath = archived_path
+                    entry.skipped = True
+                    finished[0] += 1
+                    tracker.entry_finished(entry)
+                    finish_entry(entry)
+                    continue
+                # Tracks already fetched for another playlist are linked, not downloaded
+                if store and link_duplicate(entry):
+                    finished[0] += 1
+                    tracker.entry_finished(entry)
+                    finish_entry(entry)
+                    continue
+                # Entries downloaded before an interruption go straight to
+                # post-processing; the rest download again, continuing .part files
+                if (journal.state(entry.archive_key) in (DOWNLOADED, CONVERTING)
+                        and self.restore_entry(entry, journal.get(entry.archive_key))):
+                    result.resumed += 1
+                    on_entry_done(entry)
+                    continue
+                journal.record(entry.archive_key, QUEUED)
+                yield entry
+
+        report_progress()
+        error = None
+        try:
+            scheduler.download(plan(entries), on_entry_done=on_entry_done)
+            if pipeline.pending:
+                action = "Converting to MP3" if to_mp3 else "Merging streams"
+                status(f"{action}... ({pipeline.pending} remaining)")
+            pipeline.wait()
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            pipeline.close()
+            if indexer:
+                # Files still being hashed are indexed before the run ends
+                indexer.shutdown(wait=True, cancel_futures=bool(control and control.cancelled))
+            # Entries left unfinished by a cancel or an error
+            disk.release(sum(reserved.values()))
+            archive.save()
+            journal.close()
+            result.elapsed = time.perf_counter() - started
+            if options.trace:
+                result.tracer = tracer
+                self.export_trace(tracer, options)
+            if downloading:
+                metrics.inc('media_downloader_downloads_active', -len(downloading))
+            self._finish_run(run_id, result, control, result.elapsed, error)
+        if control and control.cancelled:
+            status("Cancelled.")
+            raise JobCancelled("Cancelled")
+        # Everything reached a final state; nothing left to resume
+        journal.remove()
+
+        tracker.publish(force=True)
+        if result.failed:
+            status(f"Finished with {result.failed} failed entr{'y' if result.failed == 1 else 'ies'}.")
+        elif to_mp3:
+            status("Download and conversion completed successfully!")
+        elif output_format == "MP4":
+            status("MP4 files downloaded successfully!")
+        else:
+            status("Files downloaded in original format!")
+        return result
+
+    def preview(self, options, status=None, on_update=None, control=None, resolve_sizes=True):
+        """Work out what :meth:`run` would do with ``options`` without downloading anything.
+
+        The playlist is listed flat, and each entry in range is checked
+        against the download archive, a single listing of the output
+        directory and the media store. With ``resolve_sizes`` the entries
+        that would be fetched are then extracted ``options.max_workers`` at
+        a time for their size and duration; that fills the metadata cache,
+        so the download itself skips the work. ``on_update(result)`` is
+        called from worker threads once the listing is checked and as each
+        size comes in.
+        """
+        status = status or self.status
+        on_update = on_update or (lambda result: None)
+        started = time.perf_counter()
+        output_format = options.output_format
+        ext = OUTPUT_EXTENSIONS.get(output_format)
+        status(f"Listing playlist... (Range: {options.range_text})")
+        scheduler = PlaylistScheduler(self.build_ydl_opts(options),
+                                      metadata_cache=self.metadata_cache if options.use_cache else None,
+                                      sessions=self.sessions)
+        info, entries = scheduler.resolve(options.url)
+        result = PreviewResult(options, title=info.get('title', 'playlist'))
+
+        files = scan_directory(options.directory)
+        on_disk = DirectoryIndex(files)
+        archive = DownloadArchive(options.directory)
+        store = self.media_store if options.dedupe else None
+        variant = media_variant(options)
+        pending = []
+        for entry in entries:
+            item = entry.item
+            row = PreviewEntry(entry.index, entry.title or entry.url, NEW, duration=item.get('duration'),
+                               expected_bytes=format_size(item, item.get('duration')))
+            row.path = archive.lookup(entry.archive_key, output_format, files)
+            if row.path:
+                row.status = ON_DISK
+            else:
+                target = scheduler.target_path(entry, ext or 'tmp')
+                found = on_disk.status(os.path.splitext(os.path.basename(target))[0], ext)
+                linkable = store.find(entry.archive_key, output_format, variant) if store else None
+                if found == ON_DISK:
+                    row.status = ON_DISK
+                    row.path = target if ext else None
+                elif linkable:
+                    row.status = IN_LIBRARY
+                    row.path = linkable[0]
+                elif is_unavailable(item):
+                    row.status = UNAVAILABLE
+                elif found == PARTIAL:
+                    row.status = PARTIAL
+            result.entries.append(row)
+            if row.status in TO_FETCH and row.expected_bytes is None:
+                pending.append((entry, row))
+        on_update(result)
+
+        if resolve_sizes and pending:
+            lock = threading.Lock()
+
+            def look_up(pair):
+                entry, row = pair
+                if control:
+                    control.check_cancelled()
+                try:
+                    info = scheduler.extract(entry)
+                except Exception as e:
+                    row.error = str(e)
+                    if classify_error(e)[0] == PERMANENT:
+                        row.status = UNAVAILABLE
+                else:
+                    row.title = info.get('title') or row.title
+                    row.duration = info.get('duration') or row.duration
+                    row.expected_bytes = format_size(info, info.get('duration'))
+                with lock:
+                    result.sized += 1
+                    sized = result.sized
+                status(f"Looking up sizes... ({sized}/{len(pending)})")
+                on_update(result)
+
+            with ThreadPoolExecutor(max_workers=max(1, options.max_workers),
+                                    thread_name_prefix='preview') as pool:
+                for _ in pool.map(look_up, pending):
+                    pass
+
+        result.done = True
+        result.elapsed = time.perf_counter() - started
+        status(result.summary())
+        on_update(result)
+        return result
+
+    def _start_run(self, options):
+        """Count a run as started; returns its run history ID, if history is kept"""
+        if self.metrics:
+            self.metrics.inc('media_downloader_jobs_running')
+        history = self.history
+        return self._record(history.start_run, options) if history else None
+
+    def _finish_run(self, run_id, result, control, elapsed, error=None):
+        if control and control.cancelled:
+            outcome = RUN_CANCELLED
+        elif error or result is None or result.failed:
+            outcome = RUN_FAILED
+        else:
+            outcome = RUN_DONE
+        if self.metrics:
+            self.metrics.inc('media_downloader_jobs_running', -1)
+            self.metrics.inc('media_downloader_jobs_total', outcome=outcome)
+            self.metrics.observe('media_downloader_job_duration_seconds', elapsed)
+        if run_id is not None:
+            self._record(self.history.finish_run, run_id, result, outcome, elapsed, error)
+
+    def _record(self, action, *args):
+        """Write to the run history; a failure there never fails a download"""
+        try:
+            return action(*args)
+        except Exception as e:
+            print(f"Could not update run history: {e}", file=sys.stderr)
+            return None
+
+    def export_trace(self, tracer, options):
+        """Write the trace and profile files asked for in ``options``"""
+        try:
+            if options.trace_file:
+                tracer.write(options.trace_file)
+            if options.profile_file:
+                tracer.write_profile(options.profile_file)
+        except OSError as e:
+            print(f"Could not write trace: {e}", file=sys.stderr)
+
+    def close(self):
+        """Close the engine's sessions, saving cookies back to the cookie file, and the stores it opened"""
+        if self._owns_sessions:
+            self.sessions.close()
+        with self._cache_lock:
+            opened, self._opened = self._opened, []
+        for store in opened:
+            store.close()
+
+    def cancel(self):
+        """Terminate any running ffmpeg processes"""
+        terminate_processes()
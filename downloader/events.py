@@ -0,0 +1,40 @@
+"""Coalescing event bus between worker threads and a single consumer (the GUI)."""
+import itertools
+import threading
+
+
+class EventBus:
+    """Hand events from any thread to one consumer in coalesced batches.
+
+    ``publish(kind, value, key)`` never blocks on the consumer. Events
+    published with a ``key`` replace a still-pending event of the same kind
+    and key, since only the latest state matters (a job's progress, say);
+    events without a key are all delivered. :meth:`drain` returns the
+    pending ``(kind, value)`` pairs in the order they were first published.
+    However fast workers publish, a drain never holds more than one event
+    per key.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self.delivered = 0
+        self._pending = {}
+        self._serial = itertools.count()
+        self._lock = threading.Lock()
+
+    def publish(self, kind, value, key=None):
+        if key is None:
+            key = ('#', next(self._serial))
+        with self._lock:
+            self._pending[(kind, key)] = value
+            self.published += 1
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self.delivered += len(pending)
+        return [(kind, value) for (kind, _), value in pending.items()]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
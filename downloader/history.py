@@ -0,0 +1,132 @@
+"""Local database of past runs: per job and per entry bytes, stage timings and failures."""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from .cache import default_cache_dir
+
+# Runs kept; older ones are dropped with their entries
+DEFAULT_MAX_RUNS = 1000
+
+# Outcomes of a run
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+RUN_COLUMNS = ('id', 'host', 'url', 'title', 'format', 'quality', 'directory', 'started', 'elapsed',
+               'status', 'error', 'downloaded', 'up_to_date', 'linked', 'resumed', 'retried',
+               'failed', 'received_bytes')
+ENTRY_COLUMNS = ('run_id', 'idx', 'key', 'title', 'status', 'error', 'error_kind', 'attempts',
+                 'received_bytes', 'expected_bytes', 'timings', 'finished')
+
+
+class RunHistory:
+    """Every run of the engine and what became of each of its entries.
+
+    A run is added by :meth:`start_run` when it starts, so runs that
+    crashed or hung show up as ``running``; entries are added as they
+    reach a final state and :meth:`finish_run` fills in the totals. Only
+    the last ``max_runs`` runs are kept. Like the metadata cache this is a
+    single SQLite file shared by concurrent jobs and processes.
+    """
+
+    def __init__(self, path=None, max_runs=DEFAULT_MAX_RUNS):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'history.sqlite')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_runs = max_runs
+        self.host = socket.gethostname()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # Entries are committed one by one; WAL keeps that to an append
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS runs ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, host TEXT, url TEXT NOT NULL, '
+                         'title TEXT, format TEXT, quality TEXT, directory TEXT, '
+                         'started REAL NOT NULL, elapsed REAL, status TEXT NOT NULL, error TEXT, '
+                         'downloaded INTEGER, up_to_date INTEGER, linked INTEGER, resumed INTEGER, '
+                         'retried INTEGER, failed INTEGER, received_bytes INTEGER)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'run_id INTEGER NOT NULL, idx INTEGER, key TEXT, title TEXT, '
+                         'status TEXT NOT NULL, error TEXT, error_kind TEXT, attempts INTEGER, '
+                         'received_bytes INTEGER, expected_bytes INTEGER, timings TEXT, '
+                         'finished REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_run ON entries (run_id)')
+        self._db.commit()
+
+    def start_run(self, options):
+        """Record a run of ``options`` as started; returns its ID"""
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO runs (host, url, format, quality, directory, started, status) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.host, options.url, options.output_format, options.quality,
+                 os.path.abspath(options.directory), time.time(), RUNNING))
+            self._db.commit()
+            return cursor.lastrowid
+
+    def add_entry(self, run_id, entry, status):
+        with self._lock:
+            self._db.execute(
+                f'INSERT INTO entries ({", ".join(ENTRY_COLUMNS)}) '
+                f'VALUES ({", ".join("?" * len(ENTRY_COLUMNS))})',
+                (run_id, entry.index, entry.archive_key, entry.title, status, entry.error,
+                 entry.error_kind, entry.attempts, entry.received_bytes, entry.expected_bytes,
+                 json.dumps({stage: round(seconds, 4) for stage, seconds in entry.timings.items()}),
+                 time.time()))
+            self._db.commit()
+
+    def finish_run(self, run_id, result, status, elapsed, error=None):
+        """Store the outcome and the totals of ``result`` (a :class:`~downloader.engine.JobResult`,
+        or None if the run failed before it had one)"""
+        with self._lock:
+            if result is not None:
+                self._db.execute('UPDATE runs SET title = ?, downloaded = ?, up_to_date = ?, linked = ?, '
+                                 'resumed = ?, retried = ?, failed = ?, received_bytes = ? WHERE id = ?',
+                                 (result.title, result.downloaded, result.up_to_date, result.linked,
+                                  result.resumed, result.retried, result.failed, result.received_bytes,
+                                  run_id))
+            self._db.execute('UPDATE runs SET status = ?, elapsed = ?, error = ? WHERE id = ?',
+                             (status, elapsed, error, run_id))
+            self._prune()
+            self._db.commit()
+
+    def _prune(self):
+        row = self._db.execute('SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?',
+                               (self.max_runs,)).fetchone()
+        if row is not None:
+            self._db.execute('DELETE FROM entries WHERE run_id <= ?', (row[0],))
+            self._db.execute('DELETE FROM runs WHERE id <= ?', (row[0],))
+
+    def runs(self, limit=20):
+        """The last ``limit`` runs, newest first, as dicts"""
+        with self._lock:
+            rows = self._db.execute(f'SELECT {", ".join(RUN_COLUMNS)} FROM runs ORDER BY id DESC LIMIT ?',
+                                    (limit,)).fetchall()
+        return [dict(zip(RUN_COLUMNS, row)) for row in rows]
+
+    def entries(self, run_id):
+        """Entries of a run in playlist order, as dicts"""
+        with self._lock:
+            rows = self._db.execute(f'SELECT {", ".join(ENTRY_COLUMNS)} FROM entries '
+                                    'WHERE run_id = ? ORDER BY idx', (run_id,)).fetchall()
+        entries = [dict(zip(ENTRY_COLUMNS, row)) for row in rows]
+        for entry in entries:
+            entry['timings'] = json.loads(entry['timings'] or '{}')
+        return entries
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,221 @@
+"""Queue of playlist jobs run concurrently under shared download and CPU budgets."""
+import itertools
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .control import JobCancelled, JobControl
+from .engine import DownloadEngine
+from .throughput import DEFAULT_SYNC_INTERVAL, FsyncBatcher, TokenBucket
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+    """One playlist download in a :class:`JobQueue`.
+
+    Higher ``priority`` jobs start first; jobs of equal priority start in
+    the order they were added. ``status`` and ``snapshot`` hold the latest
+    status message and :class:`~downloader.progress.ProgressSnapshot`.
+    """
+
+    def __init__(self, options, priority=0):
+        self.id = next(_job_ids)
+        self.options = options
+        self.priority = priority
+        self.state = QUEUED
+        self.status = "Waiting..."
+        self.snapshot = None
+        self.result = None
+        self.error = None
+        self.control = JobControl()
+        # Whether the job has been handed to the engine
+        self.started = False
+        self._done = threading.Event()
+
+    @property
+    def title(self):
+        if self.result and self.result.title:
+            return self.result.title
+        return self.options.url
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; returns whether it has"""
+        return self._done.wait(timeout)
+
+
+class JobQueue:
+    """Run queued :class:`Job` objects, ``max_jobs`` at a time.
+
+    All jobs share one :class:`~downloader.engine.DownloadEngine` (and so
+    its sessions and metadata cache), at most ``max_downloads`` downloads
+    across every running job, and one ffmpeg pool of ``max_conversions``
+    processes (the core count by default). Their transfers together are
+    capped at ``bandwidth_limit`` bytes per second (unlimited by default;
+    change it live through :attr:`bandwidth`), and their journals are
+    fsynced in batches every ``sync_interval`` seconds. ``on_update(job)``
+    is called from worker threads whenever a job's state, status or
+    progress changes. Every job is counted in ``metrics`` (a
+    :class:`~downloader.metrics.Metrics`), if given.
+    """
+
+    def __init__(self, max_jobs=2, max_downloads=8, max_conversions=None, on_update=None,
+                 sessions=None, bandwidth_limit=None, sync_interval=DEFAULT_SYNC_INTERVAL,
+                 metrics=None):
+        self.max_jobs = max(1, int(max_jobs))
+        self.on_update = on_update or (lambda job: None)
+        self.bandwidth = TokenBucket(bandwidth_limit)
+        self._conversions = ThreadPoolExecutor(max_workers=max_conversions or os.cpu_count() or 1,
+                                               thread_name_prefix='convert')
+        self._syncer = FsyncBatcher(sync_interval)
+        self.engine = DownloadEngine(sessions=sessions,
+                                     download_slots=threading.BoundedSemaphore(max(1, int(max_downloads))),
+                                     conversion_executor=self._conversions,
+                                     bandwidth=self.bandwidth, syncer=self._syncer, metrics=metrics)
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, options, priority=0):
+        """Add a job; it starts as soon as a job slot is free"""
+        job = Job(options, priority)
+        with self._lock:
+            self._jobs.append(job)
+        self.on_update(job)
+        self._dispatch()
+        return job
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    @property
+    def busy(self):
+        return any(not job.finished for job in self.jobs())
+
+    def set_max_jobs(self, max_jobs):
+        """Change how many jobs run at once; running jobs are never stopped"""
+        self.max_jobs = max(1, int(max_jobs))
+        self._dispatch()
+
+    def set_priority(self, job, priority):
+        job.priority = priority
+        self.on_update(job)
+        self._dispatch()
+
+    def pause(self, job):
+        """Pause a job; a running job stops its transfers and resumes them later"""
+        if job.finished:
+            return
+        job.control.pause()
+        with self._lock:
+            if job.state in (QUEUED, RUNNING):
+                job.state = PAUSED
+        job.status = "Paused"
+        self.on_update(job)
+        # A paused job does not hold a job slot
+        self._dispatch()
+
+    def resume(self, job):
+        if job.state != PAUSED:
+            return
+        job.control.resume()
+        with self._lock:
+            job.state = RUNNING if job.started else QUEUED
+        job.status = "Resuming..." if job.state == RUNNING else "Waiting..."
+        self.on_update(job)
+        self._dispatch()
+
+    def cancel(self, job):
+        if job.finished:
+            return
+        job.control.cancel()
+        with self._lock:
+            started = job.started
+            if not started:
+                job.state = CANCELLED
+        if not started:
+            job.status = "Cancelled"
+            job._done.set()
+        self.on_update(job)
+        self._dispatch()
+
+    def remove_finished(self):
+        """Forget jobs that have finished"""
+        with self._lock:
+            self._jobs = [job for job in self._jobs if not job.finished]
+
+    def _dispatch(self):
+        """Start the highest-priority queued jobs while job slots are free"""
+        to_start = []
+        with self._lock:
+            if self._closed:
+                return
+            running = sum(1 for job in self._jobs if job.state == RUNNING)
+            queued = sorted((job for job in self._jobs if job.state == QUEUED),
+                            key=lambda job: (-job.priority, job.id))
+            for job in queued[:max(0, self.max_jobs - running)]:
+                job.state = RUNNING
+                job.started = True
+                to_start.append(job)
+        for job in to_start:
+            threading.Thread(target=self._run, args=(job,), daemon=True,
+                             name=f'job-{job.id}').start()
+
+    def _run(self, job):
+        def status(message):
+            job.status = message
+            self.on_update(job)
+
+        def progress(snapshot):
+            job.snapshot = snapshot
+            self.on_update(job)
+
+        try:
+            job.result = self.engine.run(job.options, status=status, progress=progress,
+                                         control=job.control)
+            state = FAILED if job.result.failed else DONE
+        except JobCancelled:
+            state = CANCELLED
+            job.status = "Cancelled"
+        except Exception as e:
+            state = FAILED
+            job.error = str(e)
+            job.status = f"Failed: {e}"
+            print(f"Job {job.id} failed: {e}", file=sys.stderr)
+        with self._lock:
+            job.state = state
+        job._done.set()
+        self.on_update(job)
+        self._dispatch()
+
+    def close(self):
+        """Cancel every unfinished job and release the shared resources once
+        the running jobs have stopped using them"""
+        with self._lock:
+            self._closed = True
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.control.cancel()
+        self.engine.cancel()
+        self._conversions.shutdown(wait=False, cancel_futures=True)
+        # Cancelled jobs still record their state in the shared stores on the way out
+        for job in jobs:
+            if job.started:
+                job.wait()
+        self.engine.close()
+        self._syncer.close()
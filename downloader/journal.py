@@ -0,0 +1,150 @@
+"""Crash-safe per-job journal so interrupted playlist runs resume where they stopped."""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+JOURNAL_DIRNAME = '.media-downloader-jobs'
+
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+DOWNLOADED = 'downloaded'
+CONVERTING = 'converting'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (QUEUED, DOWNLOADING, DOWNLOADED, CONVERTING, DONE, FAILED)
+# States nothing resumes from; their records are dropped
+FINAL_STATES = (DONE, FAILED)
+
+
+def job_id(*parts):
+    """Stable ID for a job from whatever defines it (URL, format, range, ...)"""
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+class JobJournal:
+    """Append-only JSON-lines journal of per-entry states for one job.
+
+    Every state change is appended and fsynced before the call returns, so
+    after a crash or reboot replaying the file gives the last state each
+    entry reached. A torn final line is ignored. Only entries that have
+    not reached a final state are kept in memory, so it stays as small as
+    the work in flight; :meth:`close` compacts the file down to them, and
+    it is removed when the job completes normally.
+
+    With a ``syncer`` (a :class:`~downloader.throughput.FsyncBatcher`) the
+    fsyncs are batched with those of other jobs instead.
+    """
+
+    def __init__(self, directory, key, syncer=None):
+        self.path = os.path.join(directory, JOURNAL_DIRNAME, f"{key}.jsonl")
+        self.syncer = syncer
+        self._records = {}
+        self._lock = threading.Lock()
+        self._file = None
+        # Lines in the file; more than there are records means it can shrink
+        self._lines = 0
+        self.resumed = False
+        self.load()
+
+    def load(self):
+        """Replay the journal; :attr:`resumed` tells whether it had any state"""
+        self._records = {}
+        lines = 0
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Partially written last line
+                    lines += 1
+                    self._apply(record)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Ignoring unreadable job journal {self.path}: {e}", file=sys.stderr)
+        self.resumed = lines > 0
+        self._lines = lines
+
+    def _apply(self, record):
+        if record.get('state') in FINAL_STATES:
+            self._records.pop(record['key'], None)
+        else:
+            self._records.setdefault(record['key'], {}).update(record)
+
+    def get(self, key):
+        with self._lock:
+            return dict(self._records.get(key) or {})
+
+    def state(self, key):
+        return self.get(key).get('state')
+
+    def record(self, key, state, **fields):
+        self.record_many([key], state, **fields)
+
+    def record_many(self, keys, state, **fields):
+        """Record the same state for several entries with a single fsync."""
+        now = time.time()
+        records = [dict(fields, key=key, state=state, time=now) for key in keys if key]
+        if not records:
+            return
+        data = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records)
+        with self._lock:
+            for record in records:
+                self._apply(record)
+            self._lines += len(records)
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(data)
+            self._file.flush()
+            if self.syncer:
+                self.syncer.sync(self._file)
+            else:
+                os.fsync(self._file.fileno())
+
+    def _close_file(self):
+        if self._file is not None:
+            if self.syncer:
+                self.syncer.flush(self._file)
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """Close the file, rewriting it with only the entries that can still resume."""
+        with self._lock:
+            self._close_file()
+            if self._lines <= len(self._records):
+                return
+            try:
+                if not self._records:
+                    self._remove_file()
+                else:
+                    tmp_path = self.path + '.tmp'
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        for record in self._records.values():
+                            f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.path)
+                self._lines = len(self._records)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not compact job journal {self.path}: {e}", file=sys.stderr)
+
+    def remove(self):
+        """Delete the journal once the job has run to completion."""
+        with self._lock:
+            self._close_file()
+            self._remove_file()
+
+    def _remove_file(self):
+        try:
+            os.remove(self.path)
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            pass  # Already gone, or other jobs still have journals here
@@ -0,0 +1,166 @@
+"""Live counters and histograms, served over HTTP in the Prometheus text format."""
+import http.server
+import threading
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+
+# Upper bounds (seconds) of the histogram buckets
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+JOB_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'media_downloader_jobs_running': ('gauge', 'Playlist jobs running', None),
+    'media_downloader_jobs_total': ('counter', 'Playlist jobs finished, by outcome', None),
+    'media_downloader_job_duration_seconds': ('histogram', 'Wall time of finished playlist jobs',
+                                              JOB_BUCKETS),
+    'media_downloader_entries_total': ('counter', 'Playlist entries finished, by outcome', None),
+    'media_downloader_retries_total': ('counter', 'Downloads retried after a temporary failure', None),
+    'media_downloader_downloads_active': ('gauge', 'Entries being downloaded', None),
+    'media_downloader_received_bytes_total': ('counter', 'Bytes received from media servers', None),
+    'media_downloader_last_progress_timestamp_seconds': (
+        'gauge', 'Unix time bytes were last received; stalls when workers are stuck', None),
+    'media_downloader_stage_duration_seconds': ('histogram', 'Time entries spend in each stage',
+                                                STAGE_BUCKETS),
+}
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                      .replace('\n', '\\n'))
+                     for key, value in labels)
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Process-wide metrics of every engine that shares this object.
+
+    Metrics are declared in :data:`METRICS`; series are created on first
+    use for each combination of labels. Updates are one lock and a dict
+    lookup, so they are cheap enough for progress hooks.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        """Add ``amount`` to a counter or gauge"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        """Count ``value`` in a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(buckets), 0, 0.0]
+            counts = histogram[0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            histogram[1] += 1
+            histogram[2] += value
+
+    def render(self):
+        """Every series in the Prometheus text exposition format"""
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: ([*counts], count, total)
+                          for key, (counts, count, total) in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (series, labels), (counts, count, total) in sorted(histograms.items()):
+                    if series != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {_number(total)}")
+                    lines.append(f"{name}_count{_label_text(labels)} {count}")
+            else:
+                for (series, labels), value in sorted(values.items()):
+                    if series == name:
+                        lines.append(f"{name}{_label_text(labels)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serve ``metrics`` at ``http://host:port/metrics`` from a background thread.
+
+    ``port`` 0 picks a free port; :attr:`port` holds the one in use. Bind
+    to ``0.0.0.0`` to let a Prometheus server on another machine scrape it.
+    """
+
+    def __init__(self, metrics, port, host=DEFAULT_METRICS_HOST):
+        self.metrics = metrics
+        self._server = http.server.ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        host = self._server.server_address[0]
+        return f"http://{host}:{self.port}/metrics"
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name='metrics')
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,167 @@
+"""Dry run of a playlist download: what would be fetched, without fetching it."""
+import os
+
+from .progress import format_bytes, format_eta
+
+# What a download would do with an entry
+NEW = 'new'
+PARTIAL = 'partial'
+ON_DISK = 'on disk'
+IN_LIBRARY = 'in library'
+UNAVAILABLE = 'unavailable'
+
+STATUSES = (NEW, PARTIAL, ON_DISK, IN_LIBRARY, UNAVAILABLE)
+# Entries a download would fetch (partial ones only in part)
+TO_FETCH = (NEW, PARTIAL)
+
+# Titles YouTube lists in place of videos that can no longer be played
+UNAVAILABLE_TITLES = ('[Private video]', '[Deleted video]', '[Unavailable video]')
+UNAVAILABLE_AVAILABILITY = ('private', 'premium_only', 'subscriber_only')
+# Files left beside downloads that are not media themselves
+SIDE_EXTENSIONS = {'part', 'ytdl', 'json', 'jpg', 'jpeg', 'png', 'webp', 'link', 'tmp'}
+
+
+def scan_directory(directory):
+    """Files directly in ``directory`` by name, from a single listing.
+
+    The values are :class:`os.DirEntry` objects; nothing is ``stat``-ed
+    beyond what the listing itself reports.
+    """
+    try:
+        with os.scandir(directory) as it:
+            return {entry.name: entry for entry in it if entry.is_file()}
+    except FileNotFoundError:
+        return {}
+
+
+class DirectoryIndex:
+    """Which output files exist in a directory, by file name stem.
+
+    Built from :func:`scan_directory`, so checking thousands of entries
+    costs one directory listing instead of a ``stat`` per entry.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self._extensions = {}
+        self._partial = set()
+        for name in files:
+            if name.endswith('.part'):
+                # "1 - Title.webm.part" is a partial download of "1 - Title"
+                self._partial.add(os.path.splitext(name[:-len('.part')])[0])
+                continue
+            stem, ext = os.path.splitext(name)
+            if stem.endswith('.temp'):
+                continue
+            self._extensions.setdefault(stem, set()).add(ext[1:].lower())
+
+    def status(self, stem, ext=None):
+        """:data:`ON_DISK` if ``stem`` exists as ``ext`` (any media file if None),
+        :data:`PARTIAL` if it was started, else None"""
+        extensions = self._extensions.get(stem, set()) - SIDE_EXTENSIONS
+        if (ext in extensions) if ext else extensions:
+            return ON_DISK
+        if extensions or stem in self._partial:
+            # Downloaded but not yet converted, or a .part to continue
+            return PARTIAL
+        return None
+
+
+def is_unavailable(item):
+    """Whether a flat playlist item is listed as private, deleted or paid-only"""
+    return (item.get('title') in UNAVAILABLE_TITLES
+            or item.get('availability') in UNAVAILABLE_AVAILABILITY)
+
+
+class PreviewEntry:
+    """One playlist entry in a :class:`PreviewResult`."""
+
+    def __init__(self, index, title, status, duration=None, expected_bytes=None, path=None):
+        self.index = index
+        self.title = title
+        self.status = status
+        self.duration = duration
+        self.expected_bytes = expected_bytes
+        self.path = path
+        self.error = None
+
+
+class PreviewResult:
+    """What downloading a playlist would do, entry by entry.
+
+    ``entries`` are in playlist order. ``sized`` counts the entries to
+    fetch whose size has been looked up so far.
+    """
+
+    def __init__(self, options, title=None):
+        self.options = options
+        self.title = title
+        self.entries = []
+        self.sized = 0
+        self.done = False
+        self.elapsed = None
+
+    def count(self, status):
+        return sum(1 for entry in self.entries if entry.status == status)
+
+    @property
+    def to_fetch(self):
+        return [entry for entry in self.entries if entry.status in TO_FETCH]
+
+    @property
+    def expected_bytes(self):
+        """Estimated bytes to fetch, over the entries whose size is known"""
+        return sum(entry.expected_bytes or 0 for entry in self.to_fetch)
+
+    @property
+    def unknown_sizes(self):
+        return sum(1 for entry in self.to_fetch if entry.expected_bytes is None)
+
+    @property
+    def duration(self):
+        """Seconds of media to fetch, over the entries whose duration is known"""
+        return sum(entry.duration or 0 for entry in self.to_fetch)
+
+    def summary(self):
+        """One line: what would be fetched, how much and how long"""
+        partial = self.count(PARTIAL)
+        text = f"{len(self.to_fetch)} to fetch"
+        if partial:
+            text += f" ({partial} partly downloaded)"
+        text += (f", {self.count(ON_DISK)} on disk, {self.count(IN_LIBRARY)} in library, "
+                 f"{self.count(UNAVAILABLE)} unavailable")
+        unknown = self.unknown_sizes
+        if len(self.to_fetch) > unknown:
+            text += f" • ~{format_bytes(self.expected_bytes)}"
+            if unknown:
+                text += f" + {unknown} of unknown size"
+        elif unknown:
+            text += " • size unknown"
+        if self.duration:
+            text += f" • {format_eta(self.duration)} of media"
+        return text
+
+    def to_dict(self):
+        return {
+            'url': self.options.url,
+            'title': self.title,
+            'format': self.options.output_format,
+            'quality': self.options.quality,
+            'directory': self.options.directory,
+            'start': self.options.start_index,
+            'end': self.options.end_index,
+            'counts': {status: self.count(status) for status in STATUSES},
+            'expected_bytes': self.expected_bytes,
+            'unknown_sizes': self.unknown_sizes,
+            'duration': round(self.duration, 1),
+            'elapsed': round(self.elapsed, 3) if self.elapsed is not None else None,
+            'entries': [{
+                'index': e.index,
+                'title': e.title,
+                'status': e.status,
+                'duration': e.duration,
+                'expected_bytes': e.expected_bytes,
+                'path': e.path,
+                'error': e.error,
+            } for e in self.entries],
+        }
@@ -0,0 +1,237 @@
+"""Byte-level progress, throughput and ETA for a playlist run."""
+import threading
+import time
+from collections import deque
+
+# Window used for the "current" speed
+SPEED_WINDOW = 3.0
+# An active entry with no new bytes for this long is reported as stalled
+STALL_AFTER = 30.0
+
+
+def format_bytes(num):
+    for unit in ('B', 'KB', 'MB'):
+        if abs(num) < 1024:
+            return f"{num:.0f} B" if unit == 'B' else f"{num:.1f} {unit}"
+        num /= 1024.0
+    return f"{num:.1f} GB"
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressSnapshot:
+    """Immutable view of the progress model, safe to hand to another thread."""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    @property
+    def percent(self):
+        return round(self.fraction * 100, 1)
+
+    def describe(self):
+        text = (f"{format_bytes(self.downloaded_bytes)} / ~{format_bytes(self.total_bytes)}"
+                f" • {format_bytes(self.current_speed)}/s (avg {format_bytes(self.average_speed)}/s)"
+                f" • ETA {format_eta(self.eta)}")
+        if self.convert_total:
+            text += f" • {self.convert_label} {self.converted}/{self.convert_total}"
+        if self.stalled:
+            text += f" • {self.stalled} stalled"
+        return text
+
+
+class _EntryProgress:
+    def __init__(self):
+        self.files = {}  # filename -> [downloaded, total]
+        self.finished = False
+        self.last_change = time.monotonic()
+        self.convert_fraction = 0.0
+
+    @property
+    def downloaded(self):
+        return sum(done for done, total in self.files.values())
+
+    @property
+    def total(self):
+        totals = [total for done, total in self.files.values()]
+        return sum(totals) if totals and all(totals) else None
+
+    @property
+    def fraction(self):
+        if self.finished:
+            return 1.0
+        total = self.total
+        return min(self.downloaded / total, 1.0) if total else 0.0
+
+
+class ProgressTracker:
+    """Aggregate yt-dlp progress hooks and conversion progress.
+
+    Worker threads feed the tracker through :meth:`download_hook`,
+    :meth:`entry_finished` and the conversion methods. ``on_update`` receives
+    a :class:`ProgressSnapshot` at most every ``interval`` seconds, so it can
+    cheaply forward snapshots to a UI queue.
+
+    Only entries still downloading or converting are tracked one by one;
+    finished ones are folded into running totals, so memory and snapshot
+    cost depend on the work in flight, not on the playlist size.
+    """
+
+    def __init__(self, on_update=None, interval=0.25):
+        self.on_update = on_update
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        # Totals of the entries folded away by _fold
+        self._done_entries = 0
+        self._done_bytes = 0
+        self._done_sizes = 0
+        self._done_sized = 0
+        self._done_convert = 0.0
+        self._entries_total = 0
+        self._convert = False
+        self._convert_total = 0
+        self._converted = 0
+        self._convert_label = "Converted"
+        self._started = time.monotonic()
+        self._samples = deque()
+        self._last_emit = 0.0
+
+    def set_entries(self, count, convert=False, convert_label="Converted"):
+        """Set the number of entries, and whether each may have a post-processing step."""
+        with self._lock:
+            self._entries_total = count
+            self._convert = convert
+            self._convert_total = count if convert else 0
+            self._convert_label = convert_label
+        self.publish(force=True)
+
+    def add_entries(self, count=1):
+        """Grow the entry count as a streamed playlist is discovered."""
+        with self._lock:
+            self._entries_total += count
+            if self._convert:
+                self._convert_total += count
+        self.publish()
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _EntryProgress()
+        return entry
+
+    def _fold(self, key):
+        """Fold a finished entry into the running totals and stop tracking it"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._done_entries += 1
+        self._done_bytes += entry.downloaded
+        total = entry.total
+        if total:
+            self._done_sizes += total
+            self._done_sized += 1
+        self._done_convert += entry.convert_fraction
+
+    def download_hook(self, key, d):
+        """Record a yt-dlp progress hook dict for the entry ``key``."""
+        filename = d.get('filename') or d.get('tmpfilename') or ''
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded = d.get('downloaded_bytes') or 0
+        with self._lock:
+            entry = self._entry(key)
+            if d.get('status') == 'finished':
+                downloaded = total = d.get('total_bytes') or downloaded or (entry.files.get(filename) or [0])[0]
+            if entry.files.get(filename, [None])[0] != downloaded:
+                entry.last_change = time.monotonic()
+            entry.files[filename] = [downloaded, total]
+        self.publish()
+
+    def entry_finished(self, key, converting=False):
+        with self._lock:
+            self._entry(key).finished = True
+            if not converting:
+                if self._convert_total:
+                    # Nothing to post-process for this entry (already MP3, single stream or failed)
+                    self._convert_total -= 1
+                self._fold(key)
+        self.publish()
+
+    def conversion_progress(self, key, fraction):
+        with self._lock:
+            self._entry(key).convert_fraction = max(0.0, min(fraction, 1.0))
+        self.publish()
+
+    def conversion_finished(self, key):
+        with self._lock:
+            self._entry(key).convert_fraction = 1.0
+            self._converted += 1
+            self._fold(key)
+        self.publish()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._entries.values())
+            downloaded = self._done_bytes + sum(e.downloaded for e in entries)
+            known = [e.total for e in entries if e.total]
+            known_count = self._done_sized + len(known)
+            known_bytes = self._done_sizes + sum(known)
+            unknown = max(self._entries_total - known_count, 0)
+            average_size = known_bytes / known_count if known_count else 0
+            total = max(known_bytes + average_size * unknown, downloaded)
+
+            self._samples.append((now, downloaded))
+            while len(self._samples) > 2 and now - self._samples[0][0] > SPEED_WINDOW:
+                self._samples.popleft()
+            first_time, first_bytes = self._samples[0]
+            current_speed = (downloaded - first_bytes) / (now - first_time) if now > first_time else 0.0
+            elapsed = now - self._started
+            average_speed = downloaded / elapsed if elapsed > 0 else 0.0
+
+            finished = self._done_entries + sum(1 for e in entries if e.finished)
+            download_fraction = ((self._done_entries + sum(e.fraction for e in entries)) / self._entries_total
+                                 if self._entries_total else 1.0)
+            fraction = download_fraction
+            if self._convert_total:
+                convert_fraction = ((self._done_convert + sum(e.convert_fraction for e in entries))
+                                    / self._convert_total)
+                fraction = (download_fraction + min(convert_fraction, 1.0)) / 2
+            speed = current_speed or average_speed
+            eta = (total - downloaded) / speed if speed > 0 and total else None
+            stalled = sum(1 for e in entries
+                          if not e.finished and e.files and now - e.last_change > STALL_AFTER)
+
+            return ProgressSnapshot(
+                fraction=min(fraction, 1.0),
+                downloaded_bytes=downloaded,
+                total_bytes=total,
+                current_speed=current_speed,
+                average_speed=average_speed,
+                eta=eta,
+                entries_done=finished,
+                entries_total=self._entries_total,
+                converted=self._converted,
+                convert_total=self._convert_total,
+                convert_label=self._convert_label,
+                stalled=stalled,
+                elapsed=elapsed,
+            )
+
+    def publish(self, force=False):
+        """Send a snapshot to ``on_update`` unless one was sent very recently."""
+        if not self.on_update:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_emit < self.interval:
+                return
+            self._last_emit = now
+        self.on_update(self.snapshot())
@@ -0,0 +1,85 @@
+"""Quality presets: yt-dlp format selectors and matching MP3 encoder settings."""
+
+MP4_BEST = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4'
+
+
+class QualityPreset:
+    """Format selectors and MP3 settings behind one "Audio Quality" choice.
+
+    ``max_abr`` (kbps) caps the audio stream that is fetched. For MP3
+    output, MP3 sources within the cap are preferred, since they are
+    remuxed without re-encoding. ``mp3_vbr_quality`` is the LAME ``-q:a``
+    value used when a transcode is needed.
+    """
+
+    def __init__(self, name, max_abr=None, max_height=None, mp3_vbr_quality=2):
+        self.name = name
+        self.max_abr = max_abr
+        self.max_height = max_height
+        self.mp3_vbr_quality = mp3_vbr_quality
+
+    def audio_format(self, prefer_mp3=False):
+        if not self.max_abr:
+            return 'bestaudio/best'
+        cap = f'[abr<={self.max_abr}]'
+        # Fall back to the default selection when bitrates are not advertised
+        selectors = [f'bestaudio{cap}', 'bestaudio', 'best']
+        if prefer_mp3:
+            selectors.insert(0, f'bestaudio[acodec=mp3]{cap}')
+        return '/'.join(selectors)
+
+    def video_format(self):
+        if not self.max_height:
+            return MP4_BEST
+        height = f'[height<={self.max_height}]'
+        audio = f'[abr<={self.max_abr}]' if self.max_abr else ''
+        return (f'bestvideo[ext=mp4]{height}+bestaudio[ext=m4a]{audio}'
+                f'/bestvideo[ext=mp4]{height}+bestaudio[ext=m4a]'
+                f'/mp4{height}/{MP4_BEST}')
+
+    def format_for(self, output_format):
+        if output_format == "MP4":
+            return self.video_format()
+        return self.audio_format(prefer_mp3=output_format == "MP3")
+
+    @property
+    def is_best(self):
+        return not self.max_abr and not self.max_height
+
+
+QUALITY_PRESETS = {
+    "Best Available": QualityPreset("Best Available", mp3_vbr_quality=0),
+    "Good": QualityPreset("Good", max_abr=160, max_height=720, mp3_vbr_quality=2),
+    "Normal": QualityPreset("Normal", max_abr=96, max_height=480, mp3_vbr_quality=5),
+}
+DEFAULT_QUALITY = "Best Available"
+
+
+def get_preset(name):
+    return QUALITY_PRESETS.get(name) or QUALITY_PRESETS[DEFAULT_QUALITY]
+
+
+def format_size(fmt, duration=None):
+    """Best-effort byte size of a selected format (or merged format pair)."""
+    if fmt.get('requested_formats'):
+        sizes = [format_size(f, duration) for f in fmt['requested_formats']]
+        return None if None in sizes else sum(sizes)
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return int(size) if size else None
+
+
+def best_quality_size(ydl, info, output_format):
+    """Size the best-quality preset would have fetched for this entry."""
+    formats = info.get('formats') or []
+    if not formats:
+        return format_size(info, info.get('duration'))
+    selector = ydl.build_format_selector(QUALITY_PRESETS[DEFAULT_QUALITY].format_for(output_format))
+    selected = list(selector({
+        'formats': formats,
+        'has_merged_format': any('none' not in (f.get('acodec'), f.get('vcodec')) for f in formats),
+        'incomplete_formats': (all(f.get('vcodec') == 'none' for f in formats)
+                               or all(f.get('acodec') == 'none' for f in formats)),
+    }))
+    return format_size(selected[-1], info.get('duration')) if selected else None
@@ -0,0 +1,165 @@
+"""Failure classification, retry backoff and adaptive per-host concurrency."""
+import random
+import socket
+import threading
+import time
+
+THROTTLED = 'throttled'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+# Not a failure of the entry: its job was cancelled
+CANCELLED = 'cancelled'
+
+# Messages of failures that will not go away by retrying
+PERMANENT_MESSAGES = (
+    'private video', 'video unavailable', 'this video is unavailable', 'has been removed',
+    'account associated with this video has been terminated', 'copyright',
+    'sign in to confirm your age', 'members-only', 'join this channel',
+    'requested format is not available', 'unsupported url', 'is not a valid url',
+    'not available in your country', 'premieres in', 'this live event will begin',
+)
+TRANSIENT_MESSAGES = (
+    'timed out', 'timeout', 'connection reset', 'connection aborted', 'connection refused',
+    'temporary failure in name resolution', 'remote end closed connection', 'incomplete read',
+    'got server http error', 'unable to download webpage', 'unable to download video data',
+    'unable to download json metadata', 'network is unreachable', 'read operation timed out',
+)
+
+
+def _causes(error):
+    """Yield ``error`` and every exception wrapped inside it"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        wrapped = exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None
+        error = (wrapped or getattr(error, 'cause', None)
+                 or error.__cause__ or error.__context__)
+        if not isinstance(error, BaseException):
+            error = None
+
+
+def classify_error(error):
+    """Return ``(kind, retry_after)`` for a failed download.
+
+    ``kind`` is :data:`THROTTLED` for rate limiting (HTTP 429),
+    :data:`TRANSIENT` for network problems and server errors that are worth
+    retrying, and :data:`PERMANENT` otherwise. ``retry_after`` is the delay
+    in seconds the server asked for, if any.
+    """
+    # Only needed once something has failed, by which time yt-dlp is loaded
+    from yt_dlp.networking.exceptions import HTTPError, TransportError
+    from yt_dlp.utils import ContentTooShortError, GeoRestrictedError, UnsupportedError
+
+    for cause in _causes(error):
+        if isinstance(cause, HTTPError):
+            if cause.status == 429:
+                return THROTTLED, _retry_after(cause)
+            if cause.status >= 500 or cause.status in (403, 408):
+                # 403 here is usually an expired or throttled media URL
+                return TRANSIENT, _retry_after(cause)
+            return PERMANENT, None
+        if isinstance(cause, (GeoRestrictedError, UnsupportedError)):
+            return PERMANENT, None
+        if isinstance(cause, (TransportError, ContentTooShortError, socket.timeout,
+                              ConnectionError, TimeoutError)):
+            return TRANSIENT, None
+
+    message = str(error).lower()
+    if 'http error 429' in message or 'too many requests' in message:
+        return THROTTLED, None
+    if any(text in message for text in PERMANENT_MESSAGES):
+        return PERMANENT, None
+    if any(text in message for text in TRANSIENT_MESSAGES) or 'http error 5' in message:
+        return TRANSIENT, None
+    return PERMANENT, None
+
+
+def _retry_after(error):
+    try:
+        value = error.response.headers.get('Retry-After')
+        return min(float(value), 600.0) if value else None
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """How often and how long to wait before retrying a failed entry"""
+
+    def __init__(self, max_attempts=4, base_delay=2.0, max_delay=60.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait after the ``attempt``-th failure (full jitter)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class AdaptiveLimiter:
+    """Concurrency cap for one host that adapts to how the host responds.
+
+    The cap starts at ``limit``. Every ``increase_after`` successes in a row
+    raise it by one, up to ``limit``; a throttled response halves it (down
+    to ``minimum``) and holds off new requests for ``cooldown`` seconds.
+    A ``limit`` of ``None`` or ``0`` means unlimited.
+    """
+
+    def __init__(self, limit, minimum=1, increase_after=5, cooldown=5.0):
+        self.max_limit = limit or None
+        self.limit = self.max_limit
+        self.minimum = minimum
+        self.increase_after = increase_after
+        self.cooldown = cooldown
+        self.active = 0
+        self.successes = 0
+        self.errors = 0
+        self.throttles = 0
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait <= 0 and (self.limit is None or self.active < self.limit):
+                    self.active += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def record_success(self):
+        with self._cond:
+            self.successes += 1
+            below_max = self.max_limit is None or self.limit < self.max_limit
+            if self.limit is not None and below_max and self.successes % self.increase_after == 0:
+                self.limit += 1
+                self._cond.notify_all()
+
+    def record_error(self):
+        with self._cond:
+            self.errors += 1
+
+    def record_throttle(self, retry_after=None):
+        with self._cond:
+            self.throttles += 1
+            self.successes = 0
+            current = self.limit if self.limit is not None else max(self.active, 2)
+            self.limit = max(self.minimum, current // 2)
+            self._resume_at = max(self._resume_at,
+                                  time.monotonic() + max(self.cooldown, retry_after or 0))
@@ -0,0 +1,516 @@
+"""Concurrent per-entry download scheduler for playlists."""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack, nullcontext
+from urllib.parse import urlparse
+
+from .control import JobCancelled
+from .retry import CANCELLED, PERMANENT, THROTTLED, AdaptiveLimiter, RetryPolicy, classify_error
+from .segmented import RangeNotSupported, SegmentedDownload, discard_partial
+from .session import SessionPool
+from .trace import NULL_TRACER
+
+# Playlist fields yt-dlp adds to each entry of a whole-playlist run. They are
+# passed to every per-entry download so %(playlist_index)s and friends are
+# numbered and zero-padded exactly as before.
+PLAYLIST_FIELDS = {
+    'playlist': 'title',
+    'playlist_id': 'id',
+    'playlist_title': 'title',
+    'playlist_uploader': 'uploader',
+    'playlist_uploader_id': 'uploader_id',
+    'playlist_channel': 'channel',
+    'playlist_channel_id': 'channel_id',
+    'playlist_webpage_url': 'webpage_url',
+    'playlist_count': 'playlist_count',
+}
+
+# Fields of a url_transparent result that are not copied onto the resolved entry
+TRANSPARENT_SKIP = ('_type', 'url', 'id', 'extractor', 'extractor_key', 'ie_key')
+
+
+def playlist_extra_info(playlist_info, last_index, n_entries=None):
+    """Build the per-entry extra info yt-dlp would attach inside a playlist"""
+    extra = {key: playlist_info.get(field) for key, field in PLAYLIST_FIELDS.items()}
+    extra['__last_playlist_index'] = last_index or 0
+    extra['n_entries'] = n_entries
+    return extra
+
+
+def iter_playlist_items(entries, start=1, end=None):
+    """Yield ``(index, item)`` from a flat playlist without materializing it.
+
+    ``entries`` may be a list, a generator or a yt-dlp ``PagedList``; paged
+    lists are read one page at a time with page caching turned off.
+    """
+    from yt_dlp.utils import PagedList
+
+    if isinstance(entries, PagedList):
+        page_size = getattr(entries, '_pagesize', None) or 100
+        # Pages are consumed once, in order, so there is no point caching them
+        entries._use_cache = False
+        index = start
+        while end is None or index <= end:
+            stop = index - 1 + page_size
+            if end is not None:
+                stop = min(stop, end)
+            chunk = entries.getslice(index - 1, stop)
+            if not chunk:
+                return
+            for item in chunk:
+                yield index, item
+                index += 1
+        return
+
+    for index, item in enumerate(entries, start=1):
+        if index < start:
+            continue
+        if end is not None and index > end:
+            return
+        yield index, item
+
+
+class PlaylistEntry:
+    """A single playlist entry and the outcome of downloading it."""
+
+    def __init__(self, index, item, extra_info=None):
+        self.index = index
+        self.item = item
+        self.url = item.get('webpage_url') or item.get('url') or ''
+        self.title = item.get('title')
+        self.extra_info = extra_info or {}
+        self.info = None
+        self.filepath = None
+        self.error = None
+        self.skipped = False
+        # Separately downloaded (path, format) streams still waiting to be merged
+        self.parts = []
+        # Estimated size of the selected format, and of the best-quality one
+        self.expected_bytes = None
+        self.best_bytes = None
+        # Download attempts made, and the kind of the last failure (see downloader.retry)
+        self.attempts = 0
+        self.error_kind = None
+        # Linked to a copy fetched for another playlist instead of downloaded
+        self.linked = False
+        # Bytes actually received over every attempt, and seconds spent per stage
+        self.received_bytes = 0
+        self.timings = {}
+
+    @property
+    def host(self):
+        return (urlparse(self.url).hostname or '').lower()
+
+    @property
+    def archive_key(self):
+        """Stable ID for the download archive: extractor and video ID when known"""
+        extractor = self.item.get('ie_key') or self.item.get('extractor_key')
+        video_id = self.item.get('id')
+        if extractor and video_id:
+            return f"{extractor.lower()} {video_id}"
+        return f"url {self.url}" if self.url else None
+
+    @property
+    def ok(self):
+        return self.error is None and self.filepath is not None
+
+    def release(self):
+        """Drop the bulky extractor metadata once the entry is finished with"""
+        duration = (self.info or {}).get('duration')
+        self.info = {'duration': duration} if duration else None
+        self.item = {key: self.item.get(key) for key in ('id', 'ie_key', 'extractor_key') if key in self.item}
+
+
+class PlaylistScheduler:
+    """Resolve a playlist flat, then download its entries through a worker pool.
+
+    ``max_workers`` bounds the total number of simultaneous downloads and
+    ``per_host_limit`` bounds how many of them may hit the same host.
+    ``host_limits`` overrides the cap for specific hosts (suffix match, e.g.
+    ``{'soundcloud.com': 3}``). A limit of ``None`` or ``0`` means unlimited.
+    Per-host caps adapt: they are halved when a host throttles us and grow
+    back as downloads succeed (see :class:`~downloader.retry.AdaptiveLimiter`).
+
+    Throttled and transient failures are retried with jittered exponential
+    backoff according to ``retry_policy``; ``on_retry(entry, delay)`` is
+    called before each wait. Permanent failures are not retried.
+
+    ``tracer`` (a :class:`~downloader.trace.Tracer`) records resolve,
+    extract and download spans.
+
+    ``download_slots`` is a semaphore shared with other schedulers to cap
+    the downloads of every running job together. ``control`` (a
+    :class:`~downloader.control.JobControl`) pauses and cancels the job:
+    transfers in flight are aborted and resumed later from their ``.part``
+    files, and cancelled entries are marked with ``CANCELLED``.
+    ``bandwidth`` (a :class:`~downloader.throughput.TokenBucket`) caps the
+    combined transfer rate of every scheduler that shares it.
+    ``progress_hook(entry, d)`` receives every yt-dlp progress hook dict,
+    tagged with the entry it belongs to, and ``on_received(entry, amount)``
+    the bytes received since the last one (also summed on
+    ``entry.received_bytes``).
+
+    With ``defer_merge`` the video and audio streams of a merged format are
+    downloaded in parallel and left on ``entry.parts`` for the caller to
+    merge, so the download slot is freed as soon as the bytes are on disk.
+
+    Single large files served over plain HTTP are fetched over ``segments``
+    parallel range requests (see
+    :class:`~downloader.segmented.SegmentedDownload`), falling back to
+    yt-dlp's own download when the server does not support ranges. ``1``
+    disables this.
+
+    ``before_download(ydl, entry)`` is called on the worker thread once the
+    entry's formats are selected (``entry.info`` is set) and before any
+    bytes are fetched.
+
+    ``metadata_cache`` (a :class:`~downloader.cache.MetadataCache`) is
+    consulted before running the extractor for an entry. If a download
+    from cached metadata fails, the entry is extracted afresh and retried
+    once, since the cached media URLs may have expired.
+
+    YoutubeDL instances come from ``sessions`` (a
+    :class:`~downloader.session.SessionPool`), so connections, cookies and
+    extractor state are reused across entries, and across jobs when the
+    pool is shared. Without one the scheduler uses a private pool, closed
+    by :meth:`close`.
+    """
+
+    def __init__(self, ydl_opts, max_workers=4, per_host_limit=2, host_limits=None,
+                 progress_hook=None, defer_merge=False, before_download=None,
+                 metadata_cache=None, sessions=None, retry_policy=None, on_retry=None,
+                 tracer=None, download_slots=None, control=None, bandwidth=None, segments=1,
+                 on_received=None):
+        self.ydl_opts = dict(ydl_opts)
+        self._owns_sessions = sessions is None
+        self.sessions = SessionPool() if sessions is None else sessions
+        self.metadata_cache = metadata_cache
+        self.progress_hook = progress_hook
+        self.defer_merge = defer_merge
+        self.before_download = before_download
+        self.max_workers = max(1, int(max_workers))
+        self.per_host_limit = per_host_limit
+        self.host_limits = host_limits or {}
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.on_retry = on_retry
+        self.tracer = tracer or NULL_TRACER
+        self.download_slots = download_slots
+        self.control = control
+        self.bandwidth = bandwidth
+        self.segments = max(1, int(segments or 1))
+        self.on_received = on_received
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, url):
+        """Return ``(playlist_info, entries)`` without downloading anything.
+
+        ``playliststart``/``playlistend`` from the options are applied here,
+        so only the requested range is returned.
+        """
+        opts = dict(self.ydl_opts, extract_flat='in_playlist', ignoreerrors=False)
+        with self.sessions.session(opts) as ydl, self.tracer.span('resolve'):
+            info = ydl.extract_info(url, download=False)
+
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            # Single track: reuse the extracted info instead of resolving it again
+            return info, [PlaylistEntry(None, info)]
+
+        items = info.get('entries') or []
+        start = self.ydl_opts.get('playliststart') or 1
+        requested = list(info.get('requested_entries') or range(start, start + len(items)))
+        common = playlist_extra_info(info, max(requested or (0,)), len(requested))
+        entries = []
+        for autonumber, (index, item) in enumerate(zip(requested, items), start=1):
+            if not item:
+                continue
+            extra_info = dict(common, playlist_index=index, playlist_autonumber=autonumber)
+            entries.append(PlaylistEntry(index, item, extra_info))
+        return info, entries
+
+    def resolve_lazy(self, url):
+        """Like :meth:`resolve`, but return a generator of entries.
+
+        Pages of the playlist are fetched only as the generator is consumed,
+        so downloads start as soon as the first entries are known and memory
+        does not grow with the playlist size. When the playlist size is not
+        known up front, %(playlist_index)s is not zero-padded.
+        """
+        opts = dict(self.ydl_opts, extract_flat='in_playlist', ignoreerrors=False)
+        # The session is held until the entries have all been generated
+        stack = ExitStack()
+        ydl = stack.enter_context(self.sessions.session(opts))
+        try:
+            with self.tracer.span('resolve'):
+                info = ydl.extract_info(url, download=False, process=False)
+                # Follow redirects to the actual playlist page
+                while info.get('_type') in ('url', 'url_transparent'):
+                    info = ydl.extract_info(info['url'], download=False, process=False,
+                                            ie_key=info.get('ie_key'))
+                if info.get('_type') not in ('playlist', 'multi_video'):
+                    info = ydl.process_ie_result(info, download=False)
+            if info.get('_type') not in ('playlist', 'multi_video'):
+                stack.close()
+                return info, iter([PlaylistEntry(None, info)])
+        except BaseException:
+            stack.close()
+            raise
+
+        start = self.ydl_opts.get('playliststart') or 1
+        end = self.ydl_opts.get('playlistend')
+        count = info.get('playlist_count')
+        last_index = min(count, end) if count and end else count or end
+        common = playlist_extra_info(info, last_index)
+
+        def generate():
+            try:
+                items = iter_playlist_items(info.get('entries') or [], start, end)
+                for autonumber, (index, item) in enumerate(items, start=1):
+                    if not item:
+                        continue
+                    extra_info = dict(common, playlist_index=index, playlist_autonumber=autonumber)
+                    yield PlaylistEntry(index, item, extra_info)
+            finally:
+                stack.close()
+
+        return info, generate()
+
+    def download(self, entries, on_entry_done=None):
+        """Download ``entries`` concurrently.
+
+        ``entries`` may be any iterable, including a lazy generator: only a
+        bounded number of entries are pulled from it ahead of the workers.
+        ``on_entry_done(entry)`` is called from the calling thread as each
+        entry finishes, in completion order. Failures are recorded on
+        ``entry.error`` instead of aborting the remaining entries.
+        """
+        max_in_flight = self.max_workers * 2
+        in_flight = set()
+
+        def drain():
+            nonlocal in_flight
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = future.result()
+                if on_entry_done:
+                    on_entry_done(entry)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for entry in entries:
+                while len(in_flight) >= max_in_flight:
+                    drain()
+                in_flight.add(pool.submit(self._download_entry, entry))
+            while in_flight:
+                drain()
+
+    def run(self, url, on_entry_done=None):
+        """Resolve ``url`` and download every entry in the requested range."""
+        info, entries = self.resolve(url)
+        self.download(entries, on_entry_done)
+        return info, entries
+
+    def close(self):
+        if self._owns_sessions:
+            self.sessions.close()
+
+    def extract(self, entry):
+        """Resolve ``entry`` and select its formats without downloading; returns the info dict"""
+        with self.sessions.session(self._entry_opts()) as ydl:
+            info, _ = self._extract(ydl, entry)
+        return info
+
+    def target_path(self, entry, ext):
+        """Path the entry would be saved to with extension ``ext``, without extracting it"""
+        with self.sessions.session(self._entry_opts()) as ydl:
+            return ydl.prepare_filename(dict(entry.item, **entry.extra_info, ext=ext))
+
+    def _entry_opts(self):
+        opts = dict(self.ydl_opts, ignoreerrors=False)
+        # The range has already been applied while resolving
+        opts.pop('playliststart', None)
+        opts.pop('playlistend', None)
+        return opts
+
+    def _download_entry(self, entry):
+        limiter = self.limiter(entry.host)
+        while True:
+            if self.control:
+                try:
+                    self.control.wait()
+                except JobCancelled as e:
+                    entry.error = str(e)
+                    entry.error_kind = CANCELLED
+                    return entry
+            entry.attempts += 1
+            error = None
+            with limiter, self.download_slots or nullcontext():
+                try:
+                    self._attempt(entry)
+                except Exception as e:
+                    error = e
+            if error is None:
+                limiter.record_success()
+                entry.error = entry.error_kind = None
+                return entry
+            if self.control and (self.control.paused or self.control.cancelled):
+                # Interrupted on purpose; not counted as an attempt
+                entry.attempts -= 1
+                continue
+
+            kind, retry_after = classify_error(error)
+            if kind == THROTTLED:
+                limiter.record_throttle(retry_after)
+            else:
+                limiter.record_error()
+            entry.error = str(error)
+            entry.error_kind = kind
+            if kind == PERMANENT or entry.attempts >= self.retry_policy.max_attempts:
+                return entry
+            delay = self.retry_policy.delay(entry.attempts, retry_after)
+            if self.on_retry:
+                self.on_retry(entry, delay)
+            time.sleep(delay)
+
+    def _attempt(self, entry):
+        received = {}
+        # Streams of one entry download on parallel threads
+        received_lock = threading.Lock()
+
+        def hook(d):
+            if self.control:
+                # Abort the transfer when the job is paused or cancelled
+                self.control.check()
+            if d.get('status') == 'downloading':
+                with received_lock:
+                    amount = self._received(received, d)
+                    entry.received_bytes += amount
+                if amount:
+                    if self.bandwidth:
+                        self.bandwidth.consume(amount, self.control.check if self.control else None)
+                    if self.on_received:
+                        self.on_received(entry, amount)
+            if self.progress_hook:
+                self.progress_hook(entry, d)
+
+        with self.sessions.session(self._entry_opts(), progress_hook=hook) as ydl:
+            info, cached = self._extract(ydl, entry)
+            try:
+                self._fetch(ydl, entry, info, hook)
+            except Exception:
+                if not cached:
+                    raise
+                # The cached media URLs may have expired; extract again and retry once
+                self.metadata_cache.discard(entry.archive_key)
+                info, _ = self._extract(ydl, entry, use_cache=False)
+                self._fetch(ydl, entry, info, hook)
+
+    @staticmethod
+    def _received(received, d):
+        """Bytes received since the last hook for the same file"""
+        name = d.get('tmpfilename') or d.get('filename')
+        done = d.get('downloaded_bytes') or 0
+        last = received.get(name)
+        received[name] = done
+        # The first report of a file only sets the baseline, so resumed
+        # .part bytes are not counted again
+        if last is not None and done > last:
+            return done - last
+        return 0
+
+    def _extract(self, ydl, entry, use_cache=True):
+        """Resolve ``entry`` and select its formats; returns ``(info, from_cache)``"""
+        with self.tracer.span('extract', entry, attempt=entry.attempts):
+            return self._extract_info(ydl, entry, use_cache)
+
+    def _extract_info(self, ydl, entry, use_cache):
+        item = entry.item
+        if not self.metadata_cache or item.get('_type') not in ('url', 'url_transparent'):
+            return ydl.process_ie_result(dict(item), download=False, extra_info=entry.extra_info), False
+
+        key = entry.archive_key
+        raw = self.metadata_cache.get(key) if use_cache else None
+        cached = raw is not None
+        if raw is None:
+            raw = ydl.extract_info(item['url'], download=False, process=False, ie_key=item.get('ie_key'))
+            if raw.get('_type', 'video') == 'video':
+                self.metadata_cache.put(key, ydl.sanitize_info(raw))
+        if item['_type'] == 'url_transparent':
+            # Fields from the playlist page win, as in yt-dlp's own handling
+            raw = dict(raw, **{k: v for k, v in item.items()
+                               if v is not None and k not in TRANSPARENT_SKIP})
+        return ydl.process_ie_result(raw, download=False, extra_info=entry.extra_info), cached
+
+    def _fetch(self, ydl, entry, info, hook=None):
+        """Download the formats selected in ``info``"""
+        with self.tracer.span('download', entry, attempt=entry.attempts):
+            self._fetch_formats(ydl, entry, info, hook)
+
+    def _fetch_formats(self, ydl, entry, info, hook=None):
+        entry.info = info
+        entry.title = info.get('title') or entry.title
+        entry.filepath = ydl.prepare_filename(info)
+        entry.parts = []
+        if self.before_download:
+            self.before_download(ydl, entry)
+        if self.defer_merge and info.get('requested_formats'):
+            if not os.path.exists(entry.filepath):
+                entry.parts = self._download_formats(ydl, info, entry.filepath, hook)
+        else:
+            # yt-dlp finds a segmented download already on disk and only post-processes it
+            self._download_segmented(ydl, info, entry.filepath, hook)
+            ydl.process_info(dict(info))
+
+    def _download_segmented(self, ydl, info, filepath, hook):
+        """Fetch ``info`` over parallel range requests; False to leave it to yt-dlp"""
+        if not SegmentedDownload.suitable(ydl, info, self.segments) or os.path.exists(filepath):
+            # A segmented attempt that won't be resumed leaves a full-size .part
+            discard_partial(filepath)
+            return False
+        try:
+            SegmentedDownload(ydl, info, filepath, self.segments, hook).download()
+        except RangeNotSupported:
+            return False
+        return True
+
+    def _download_formats(self, ydl, info, filepath, hook=None):
+        """Download every requested format of ``info`` to its own file in parallel"""
+        base = os.path.splitext(filepath)[0]
+        jobs = []
+        for fmt in info['requested_formats']:
+            part_info = dict(info)
+            del part_info['requested_formats']
+            part_info.update(fmt)
+            jobs.append((f"{base}.f{fmt['format_id']}.{fmt['ext']}", part_info))
+
+        def download(job):
+            if self._download_segmented(ydl, job[1], job[0], hook):
+                return True, job[0]
+            return ydl.dl(*job)
+
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            results = list(pool.map(download, jobs))
+        if not all(success for success, _ in results):
+            from yt_dlp.utils import DownloadError
+            raise DownloadError(f"Failed to download all streams of {filepath}")
+        return [(path, part_info) for path, part_info in jobs]
+
+    def _host_limit(self, host):
+        for suffix, limit in self.host_limits.items():
+            if host == suffix or host.endswith('.' + suffix):
+                return limit
+        return self.per_host_limit
+
+    def limiter(self, host):
+        """The :class:`~downloader.retry.AdaptiveLimiter` for ``host``"""
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = AdaptiveLimiter(self._host_limit(host))
+            return limiter
+
+    def host_stats(self):
+        """``{host: limiter}`` for every host downloaded from so far"""
+        with self._lock:
+            return dict(self._limiters)
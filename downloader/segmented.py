@@ -0,0 +1,274 @@
+"""Multi-connection downloads of single large files over HTTP range requests."""
+import json
+import os
+import re
+import threading
+import time
+
+# Files smaller than this are left to yt-dlp's single-connection download
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+DEFAULT_CONNECTIONS = 4
+# Bytes read per call when yt-dlp has no fixed buffer size
+DEFAULT_BLOCK_SIZE = 256 * 1024
+# Seconds between saves of the segment state that resumes use
+STATE_SAVE_INTERVAL = 1.0
+
+CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)', re.IGNORECASE)
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class Segment:
+    """Bytes ``start``-``end`` (inclusive) of the file, ``done`` of them written"""
+
+    def __init__(self, start, end, done=0):
+        self.start = start
+        self.end = end
+        self.done = done
+
+    @property
+    def length(self):
+        return self.end - self.start + 1
+
+    @property
+    def finished(self):
+        return self.done >= self.length
+
+
+def split(size, connections, min_size=MIN_SEGMENT_SIZE):
+    """Split ``size`` bytes into at most ``connections`` segments of at least ``min_size``"""
+    count = max(1, min(connections, size // min_size))
+    step = -(-size // count)
+    return [Segment(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def discard_partial(filename):
+    """Drop the preallocated ``.part`` of an unfinished segmented download of
+    ``filename``, which yt-dlp would take for a finished or resumable one"""
+    tmp_filename = filename + '.part'
+    state_filename = tmp_filename + '.segments'
+    if os.path.exists(state_filename):
+        for path in (tmp_filename, state_filename):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def preallocate(path, size):
+    """Make ``path`` ``size`` bytes long, reserving the disk blocks where the OS can"""
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                # Not supported by this file system; a sparse file will do
+                pass
+        f.truncate(size)
+
+
+class SegmentedDownload:
+    """Fetch one format over ``connections`` parallel range requests.
+
+    The ``.part`` file yt-dlp would use is preallocated to the full size
+    and every connection writes its own byte range at its offset, so the
+    file is complete when the last range is and nothing is concatenated
+    afterwards. Progress is saved beside it (``.part.segments``), so an
+    interrupted download resumes each range where it stopped; a ``.part``
+    left by an earlier single-connection attempt is kept as a finished
+    first range. ``progress_hook`` gets the same dicts yt-dlp's own
+    downloader reports, one call at a time.
+
+    :meth:`download` raises :class:`RangeNotSupported` before touching the
+    disk when the server does not honour range requests or the file is too
+    small to be worth splitting, so the caller can let yt-dlp fetch it.
+    """
+
+    def __init__(self, ydl, info, filename, connections=DEFAULT_CONNECTIONS, progress_hook=None):
+        self.ydl = ydl
+        self.info = info
+        self.filename = filename
+        self.connections = connections
+        self.progress_hook = progress_hook
+        self.tmp_filename = filename + '.part'
+        self.state_filename = self.tmp_filename + '.segments'
+        self.block_size = ydl.params.get('buffersize') or DEFAULT_BLOCK_SIZE
+        self.segments = []
+        self.size = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        # Serializes hooks without holding up the writers, as a hook may sleep
+        self._hook_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started = None
+        self._resumed_bytes = 0
+        self._last_save = 0.0
+
+    @staticmethod
+    def suitable(ydl, info, connections):
+        """Whether ``info`` is a plain HTTP format that range requests could speed up"""
+        if connections < 2 or info.get('protocol') not in ('http', 'https'):
+            return False
+        if ydl.params.get('nopart') or ydl.params.get('ratelimit'):
+            # Without a .part a preallocated file looks finished; yt-dlp's
+            # own rate limit only applies to its own downloader
+            return False
+        if info.get('is_live') or info.get('fragments') or info.get('extra_param_to_segment_url'):
+            return False
+        size = info.get('filesize') or info.get('filesize_approx')
+        # Unknown sizes are probed; known small files are not worth it
+        return size is None or size >= 2 * MIN_SEGMENT_SIZE
+
+    def _request(self, start, end):
+        from yt_dlp.networking import Request
+        headers = dict(self.info.get('http_headers') or {}, Range=f'bytes={start}-{end}')
+        return self.ydl.urlopen(Request(self.info['url'], headers=headers))
+
+    def _probe(self):
+        """Total size and a validator of the file, from a one-byte range request"""
+        response = self._request(0, 0)
+        try:
+            match = CONTENT_RANGE.match(response.headers.get('Content-Range') or '')
+            if response.status != 206 or not match:
+                raise RangeNotSupported("Server does not support range requests")
+            validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+            return int(match.group(3)), validator
+        finally:
+            response.close()
+
+    def _load_state(self, size, validator):
+        """Segments to resume, or None to start over"""
+        try:
+            with open(self.state_filename, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if state:
+            if state.get('size') == size and state.get('validator') == validator:
+                return [Segment(*segment) for segment in state['segments']]
+            return None
+        try:
+            written = os.path.getsize(self.tmp_filename)
+        except OSError:
+            return None
+        if not 0 < written < size:
+            return None
+        # A single-connection .part: its bytes are a finished first range
+        rest = split(size - written, self.connections)
+        return [Segment(0, written - 1, written)] + [Segment(s.start + written, s.end + written) for s in rest]
+
+    def _save_state(self, validator, force=False):
+        # Connections that find a save in progress skip theirs
+        if not self._save_lock.acquire(blocking=force):
+            return
+        try:
+            now = time.monotonic()
+            if not force and now - self._last_save < STATE_SAVE_INTERVAL:
+                return
+            self._last_save = now
+            with self._lock:
+                state = {'size': self.size, 'validator': validator,
+                         'segments': [[s.start, s.end, s.done] for s in self.segments]}
+            tmp_path = self.state_filename + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_filename)
+        finally:
+            self._save_lock.release()
+
+    def _discard(self):
+        discard_partial(self.filename)
+
+    def download(self):
+        """Download to ``filename``; raises :class:`RangeNotSupported` to hand back to yt-dlp"""
+        try:
+            size, validator = self._probe()
+            if size < 2 * MIN_SEGMENT_SIZE:
+                raise RangeNotSupported("File too small to split")
+        except RangeNotSupported:
+            self._discard()
+            raise
+        self.size = size
+        segments = self._load_state(size, validator)
+        if segments is None:
+            segments = split(size, self.connections)
+            if os.path.exists(self.tmp_filename):
+                os.remove(self.tmp_filename)
+        self.segments = segments
+        preallocate(self.tmp_filename, size)
+        self._resumed_bytes = sum(s.done for s in segments)
+        self._started = time.monotonic()
+        self._save_state(validator, force=True)
+
+        errors = []
+
+        def run(segment):
+            try:
+                self._fetch(segment, validator)
+            except BaseException as e:
+                errors.append(e)
+                # One failed range stops the others; the state resumes them all
+                self._stop.set()
+
+        threads = [threading.Thread(target=run, args=(segment,), daemon=True, name='segment')
+                   for segment in segments if not segment.finished]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._save_state(validator, force=True)
+        if errors:
+            if isinstance(errors[0], RangeNotSupported):
+                self._discard()
+            raise errors[0]
+
+        os.replace(self.tmp_filename, self.filename)
+        os.remove(self.state_filename)
+        self._report('finished')
+        return self.filename
+
+    def _fetch(self, segment, validator):
+        response = self._request(segment.start + segment.done, segment.end)
+        try:
+            if response.status != 206:
+                raise RangeNotSupported("Server stopped honouring range requests")
+            with open(self.tmp_filename, 'r+b') as f:
+                f.seek(segment.start + segment.done)
+                while not segment.finished and not self._stop.is_set():
+                    block = response.read(min(self.block_size, segment.length - segment.done))
+                    if not block:
+                        break
+                    f.write(block)
+                    with self._lock:
+                        segment.done += len(block)
+                    self._report('downloading')
+                    self._save_state(validator)
+        finally:
+            response.close()
+        if not segment.finished and not self._stop.is_set():
+            from yt_dlp.utils import ContentTooShortError
+            raise ContentTooShortError(segment.done, segment.length)
+
+    def _report(self, status):
+        if not self.progress_hook:
+            return
+        # Hooks are called one at a time, as from yt-dlp's own downloader,
+        # and in order, so downloaded_bytes never goes backwards
+        with self._hook_lock:
+            with self._lock:
+                downloaded = sum(s.done for s in self.segments)
+            elapsed = time.monotonic() - self._started
+            speed = (downloaded - self._resumed_bytes) / elapsed if elapsed > 0 else None
+            eta = (self.size - downloaded) / speed if speed else None
+            self.progress_hook({
+                'status': status,
+                'filename': self.filename,
+                'tmpfilename': self.tmp_filename,
+                'downloaded_bytes': downloaded,
+                'total_bytes': self.size,
+                'elapsed': elapsed,
+                'speed': speed,
+                'eta': eta,
+                'info_dict': self.info,
+            })
@@ -0,0 +1,147 @@
+"""Long-lived yt-dlp sessions shared across entries and jobs."""
+import threading
+from contextlib import contextmanager
+
+# yt-dlp is imported when the first session is created, so importing the
+# engine (and opening the GUI) does not pay for it; see SessionPool.prewarm
+
+# Options only read when a YoutubeDL instance is created. Sessions are only
+# reused for options that agree on all of these.
+INIT_OPTIONS = ('cookiefile', 'cookiesfrombrowser', 'proxy', 'source_address',
+                'postprocessors', 'logger', 'verbose')
+
+_MISSING = object()
+
+
+class Session:
+    """A YoutubeDL instance whose per-job options can be swapped between uses.
+
+    Keeping the instance alive keeps its request handlers (and with them
+    the pooled keep-alive connections), its cookie jar and its extractor
+    instances, including any player/signature data they have cached.
+    """
+
+    def __init__(self, opts, cookiejar=None):
+        import yt_dlp as youtube_dl
+
+        # Everything else is applied per use by configure()
+        self.ydl = youtube_dl.YoutubeDL({key: opts[key] for key in INIT_OPTIONS if key in opts})
+        if cookiejar is not None:
+            # Share the jar instead of loading the cookie file again
+            self.ydl.cookiejar = cookiejar
+        self.progress_hook = None
+        self.ydl.add_progress_hook(self._dispatch_progress)
+        self._defaults = {}
+        self._format = self.ydl.params.get('format')
+
+    def _dispatch_progress(self, d):
+        if self.progress_hook:
+            self.progress_hook(d)
+
+    def configure(self, opts):
+        """Apply ``opts`` on top of the options the instance was created with"""
+        from yt_dlp.utils import DEFAULT_OUTTMPL
+        from yt_dlp.utils.networking import HTTPHeaderDict, std_headers
+
+        params = self.ydl.params
+        # Undo options set by a previous use that this one does not set
+        for key in list(self._defaults):
+            if key not in opts:
+                default = self._defaults.pop(key)
+                if default is _MISSING:
+                    params.pop(key, None)
+                else:
+                    params[key] = default
+        for key, value in opts.items():
+            if key in INIT_OPTIONS or key == 'progress_hooks':
+                continue
+            self._defaults.setdefault(key, params.get(key, _MISSING))
+            if key == 'outtmpl':
+                value = dict(DEFAULT_OUTTMPL, **(value if isinstance(value, dict) else {'default': value}))
+            elif key == 'http_headers':
+                value = HTTPHeaderDict(std_headers, value)
+            params[key] = value
+        if params.get('format') != self._format:
+            fmt = params.get('format')
+            self.ydl.format_selector = (fmt if fmt in (None, '-') or callable(fmt)
+                                        else self.ydl.build_format_selector(fmt))
+            self._format = fmt
+
+    def close(self):
+        self.ydl.close()
+
+
+class SessionPool:
+    """Hand out :class:`Session` objects, reusing idle ones.
+
+    A session is used by one thread at a time; sessions created with the
+    same :data:`INIT_OPTIONS` share one cookie jar, so cookies are loaded
+    from ``cookiefile`` once and cookies set by servers are seen by every
+    download. Idle sessions beyond ``max_idle`` per option set are closed.
+    """
+
+    def __init__(self, max_idle=16):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._cookiejars = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @staticmethod
+    def _bucket(opts):
+        return repr(tuple(opts.get(key) for key in INIT_OPTIONS))
+
+    @contextmanager
+    def session(self, opts, progress_hook=None):
+        """Yield a YoutubeDL configured with ``opts``"""
+        bucket = self._bucket(opts)
+        with self._lock:
+            idle = self._idle.get(bucket)
+            session = idle.pop() if idle else None
+            cookiejar = self._cookiejars.get(bucket)
+        if session is None:
+            session = Session(opts, cookiejar)
+            if cookiejar is None:
+                with self._lock:
+                    self._cookiejars.setdefault(bucket, session.ydl.cookiejar)
+        session.configure(opts)
+        session.progress_hook = progress_hook
+        try:
+            yield session.ydl
+        finally:
+            session.progress_hook = None
+            with self._lock:
+                idle = self._idle.setdefault(bucket, [])
+                if not self._closed and len(idle) < self.max_idle:
+                    idle.append(session)
+                    session = None
+            if session is not None:
+                session.close()
+
+    def prewarm(self, opts=None):
+        """Do the one-off work of the first download ahead of time.
+
+        Imports yt-dlp, leaves an idle session for ``opts`` in the pool and
+        compiles the URL pattern of every extractor, which otherwise happens
+        while the first playlist is resolved. Meant for a background thread.
+        """
+        from yt_dlp.extractor import gen_extractor_classes
+
+        with self.session(opts or {}):
+            for ie in gen_extractor_classes():
+                ie.suitable('')
+
+    def close(self):
+        """Close every idle session, saving cookies back to the cookie file"""
+        with self._lock:
+            self._closed = True
+            sessions = [session for idle in self._idle.values() for session in idle]
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,113 @@
+"""Global bandwidth limit and batched fsyncs shared by concurrent downloads."""
+import os
+import threading
+import time
+
+# Seconds between batched journal fsyncs when several jobs write at once
+DEFAULT_SYNC_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Byte-rate limit shared by every download that draws from it.
+
+    ``rate`` is in bytes per second; ``None`` or ``0`` means unlimited. It
+    can be changed at any time with :meth:`set_rate`, which takes effect
+    for transfers already in flight. Up to ``burst`` seconds of unused rate
+    can be saved up. A large block borrows from the future: the bucket goes
+    into debt and every caller waits it off, so the long-run total stays at
+    ``rate`` whatever the block sizes.
+    """
+
+    def __init__(self, rate=None, burst=1.0):
+        self.rate = rate or None
+        self.burst = burst
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def set_rate(self, rate):
+        with self._cond:
+            self._refill()
+            self.rate = rate or None
+            if self.rate is None:
+                self._tokens = 0.0
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.rate * self.burst,
+                               self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, amount, check=None):
+        """Account for ``amount`` bytes, blocking while the bucket is in debt.
+
+        ``check`` is called while waiting, so a pause or cancel (which
+        raises) is not held up by a low rate.
+        """
+        with self._cond:
+            self._refill()
+            if not self.rate:
+                return
+            self._tokens -= amount
+            while self.rate and self._tokens < 0:
+                if check:
+                    check()
+                self._cond.wait(min(0.25, -self._tokens / self.rate))
+                self._refill()
+
+
+class FsyncBatcher:
+    """Coalesce the fsyncs of files written by many concurrent jobs.
+
+    With ``interval`` ``0`` :meth:`sync` fsyncs right away, in the caller.
+    Otherwise it only marks the file dirty and a background thread fsyncs
+    every dirty file once per ``interval`` seconds, one after another, so
+    many job journals on a network share cost one round of fsyncs per
+    interval instead of one per state change. A crash can then lose up to
+    ``interval`` seconds of journal records; the entries concerned are
+    simply checked again when the job resumes.
+    """
+
+    def __init__(self, interval=0.0):
+        self.interval = interval
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def sync(self, f):
+        if not self.interval or self._closed:
+            os.fsync(f.fileno())
+            return
+        with self._lock:
+            self._dirty[id(f)] = f
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='fsync')
+                self._thread.start()
+
+    def flush(self, f=None):
+        """Fsync ``f`` now if it is dirty, or every dirty file without ``f``"""
+        with self._lock:
+            if f is None:
+                files = list(self._dirty.values())
+                self._dirty.clear()
+            else:
+                files = [self._dirty.pop(id(f))] if id(f) in self._dirty else []
+        for dirty in files:
+            try:
+                os.fsync(dirty.fileno())
+            except (OSError, ValueError):
+                pass  # Closed meanwhile; closing flushed it
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self.flush()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
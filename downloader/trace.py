@@ -0,0 +1,185 @@
+"""Per-entry, per-stage timing spans with optional cProfile capture."""
+import cProfile
+import csv
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ('resolve', 'dedupe', 'extract', 'download', 'merge', 'convert', 'finalize')
+
+# Before 3.12 cProfile hooks one thread at a time; from 3.12 it is built on
+# sys.monitoring, which sees every thread and allows a single profiler only
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+
+class Span:
+    __slots__ = ('name', 'start', 'duration', 'thread_id', 'thread_name', 'entry', 'args')
+
+    def __init__(self, name, start, duration, entry=None, args=None):
+        thread = threading.current_thread()
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.entry = entry
+        self.args = args or {}
+
+
+class Tracer:
+    """Record how long each stage of each entry takes.
+
+    Wrap work in ``with tracer.span('download', entry):``. A disabled
+    tracer (the default everywhere) records nothing and costs one
+    attribute check per span. With ``profile=True`` the code running
+    inside outermost spans is also profiled with cProfile (one profiler
+    per thread, merged by :meth:`write_profile`; on Python 3.12+ a single
+    profiler covers every thread from the first span on).
+
+    ``on_span(name, entry, duration)`` is called as each span ends, from
+    the thread that ran it. With ``record=False`` spans are only passed to
+    it, so long runs can be monitored without keeping every span.
+    """
+
+    def __init__(self, enabled=True, profile=False, on_span=None, record=True):
+        self.enabled = enabled
+        self.profile = enabled and profile
+        self.on_span = on_span
+        self.record = record
+        self.spans = []
+        self._origin = time.perf_counter()
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = []
+
+    @contextmanager
+    def span(self, name, entry=None, **args):
+        if not self.enabled:
+            yield
+            return
+        profiler = self._enter_profile()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if profiler:
+                self._exit_profile(profiler)
+            if self.on_span:
+                self.on_span(name, entry, duration)
+            if self.record:
+                label = None
+                if entry is not None:
+                    label = f"{entry.index} {entry.title}" if entry.index is not None else entry.title
+                span = Span(name, start - self._origin, duration, label, args)
+                with self._lock:
+                    self.spans.append(span)
+
+    def _enter_profile(self):
+        if not self.profile:
+            return None
+        if not PER_THREAD_PROFILES:
+            with self._lock:
+                if not self._profiles:
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+                    self._profiles.append(profiler)
+            return None
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        if depth:
+            return True
+        # A cProfile profiler only sees the thread that enabled it
+        profiler = getattr(self._local, 'profiler', None)
+        if profiler is None:
+            profiler = self._local.profiler = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profiler)
+        profiler.enable()
+        return profiler
+
+    def _exit_profile(self, profiler):
+        self._local.depth -= 1
+        if profiler is not True:
+            profiler.disable()
+
+    def summary(self):
+        """Per-stage totals: ``[(stage, count, total, mean, p95, max)]`` in seconds"""
+        by_stage = {}
+        with self._lock:
+            for span in self.spans:
+                by_stage.setdefault(span.name, []).append(span.duration)
+        order = {name: i for i, name in enumerate(STAGES)}
+        rows = []
+        for name in sorted(by_stage, key=lambda n: (order.get(n, len(order)), n)):
+            durations = sorted(by_stage[name])
+            p95 = durations[min(len(durations) - 1, int(round(0.95 * (len(durations) - 1))))]
+            rows.append((name, len(durations), sum(durations), statistics.mean(durations),
+                         p95, durations[-1]))
+        return rows
+
+    def format_summary(self):
+        lines = [f"{'Stage':<10} {'Count':>6} {'Total s':>9} {'Mean s':>8} {'p95 s':>8} {'Max s':>8}"]
+        for name, count, total, mean, p95, longest in self.summary():
+            lines.append(f"{name:<10} {count:>6} {total:>9.2f} {mean:>8.3f} {p95:>8.3f} {longest:>8.3f}")
+        return "\n".join(lines)
+
+    def write(self, path):
+        """Export the spans; ``.csv`` writes CSV, anything else Chrome trace JSON"""
+        if path.lower().endswith('.csv'):
+            self.write_csv(path)
+        else:
+            self.write_chrome_trace(path)
+
+    def write_chrome_trace(self, path):
+        """Write a trace loadable in chrome://tracing or https://ui.perfetto.dev"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in {(s.thread_id, s.thread_name) for s in spans}]
+        for span in spans:
+            args = dict(span.args)
+            if span.entry:
+                args['entry'] = span.entry
+            events.append({'name': span.name, 'cat': 'stage', 'ph': 'X', 'pid': pid,
+                           'tid': span.thread_id, 'ts': round(span.start * 1e6),
+                           'dur': round(span.duration * 1e6), 'args': args})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'started': self._started}}, f)
+
+    def write_csv(self, path):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['stage', 'entry', 'start_s', 'duration_s', 'thread'])
+            for span in spans:
+                writer.writerow([span.name, span.entry or '', f"{span.start:.6f}",
+                                 f"{span.duration:.6f}", span.thread_name])
+
+    def write_profile(self, path):
+        """Merge the per-thread profiles into one pstats file (e.g. for snakeviz)"""
+        import pstats
+
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return False
+        if not PER_THREAD_PROFILES:
+            profiles[0].disable()
+        stats = pstats.Stats(profiles[0])
+        for profiler in profiles[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+        return True
+
+
+# Shared disabled tracer for callers that do not trace
+NULL_TRACER = Tracer(enabled=False)